@@ -0,0 +1,229 @@
+"""
+Background cache warmer: keeps geocoding, weather and attraction data for the
+most requested cities fresh, so their requests are answered from the caches.
+
+The warm set is the top-K cities by recent request count plus the cities
+seeded from a list (python main.py --warm cities.txt). Every pass refreshes
+whatever is missing or due to expire within REFRESH_AHEAD, at background
+priority; work for an upstream with no spare capacity is deferred to the
+next pass instead of competing with live traffic.
+"""
+import json
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+from agents import places_agent, weather_agent
+from utils import geocoding, ratelimit
+from utils.cache import CACHE_DIR, MISS
+from utils.geocoding import REGION_TYPES, normalize_place_name
+
+# Cities kept warm by request count (0 disables the warmer in TourismAgent)
+WARM_TOP_K = int(os.environ.get("TOURISM_WARM_TOP_K", 0))
+
+# Seconds between passes, and between upstream calls within a pass
+WARM_INTERVAL = 60
+WARM_PACE = 1.0
+
+# Request counts halve every HALF_LIFE seconds, so the ranking follows recent traffic
+HALF_LIFE = 6 * 3600
+MAX_TRACKED = 10000
+
+# Refresh data this many seconds before it expires. Forecasts expire when a
+# new model run is published, so their window must fit within the run's lag.
+REFRESH_AHEAD = {
+    "geocode": 24 * 3600,
+    "weather": 10 * 60,
+    "places": 24 * 3600,
+}
+
+# Seeded cities, shared by every worker process on the host
+SEEDS_PATH = os.path.join(CACHE_DIR, "warm_seeds.json")
+
+NOMINATIM_HOST = urlsplit(geocoding.NOMINATIM_URL).hostname
+OPEN_METEO_HOST = urlsplit(weather_agent.FORECAST_URL).hostname
+OVERPASS_HOST = urlsplit(places_agent.OVERPASS_URL).hostname
+
+
+class Popularity:
+    """
+    Thread-safe request counts per location with exponential decay.
+    """
+
+    def __init__(self, half_life=HALF_LIFE, max_entries=MAX_TRACKED):
+        self.half_life = half_life
+        self.max_entries = max_entries
+        self._scores = {}  # key -> (score, updated, location as first asked)
+        self._lock = threading.Lock()
+
+    def _decayed(self, score, updated, now):
+        return score * 0.5 ** ((now - updated) / self.half_life)
+
+    def record(self, location):
+        key = normalize_place_name(location)
+        now = time.time()
+        with self._lock:
+            score, updated, name = self._scores.get(key, (0.0, now, location))
+            self._scores[key] = (self._decayed(score, updated, now) + 1, now, name)
+            if len(self._scores) > self.max_entries:
+                # Forget the least requested half
+                ranked = sorted(self._scores, key=lambda k: self._decayed(*self._scores[k][:2], now))
+                for stale in ranked[:len(ranked) // 2]:
+                    del self._scores[stale]
+
+    def top(self, k):
+        """
+        The k most requested locations as [(location, decayed count)].
+        """
+        now = time.time()
+        with self._lock:
+            scored = [(name, self._decayed(score, updated, now)) for score, updated, name in self._scores.values()]
+        scored.sort(key=lambda item: -item[1])
+        return scored[:k]
+
+
+def load_seeds(path=SEEDS_PATH):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return []
+
+def save_seeds(names, path=SEEDS_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(names, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _due(expires_at, within):
+    return expires_at is None or expires_at <= time.time() + within
+
+
+class CacheWarmer:
+    """
+    Tracks request popularity and refreshes the warm set's cached data.
+    Call record() per answered request; start() runs warm passes in a
+    daemon thread, or call warm_once() directly.
+    """
+
+    def __init__(self, top_k=WARM_TOP_K, interval=WARM_INTERVAL, pace=WARM_PACE, seeds_path=SEEDS_PATH):
+        self.top_k = top_k
+        self.interval = interval
+        self.pace = pace
+        self.seeds_path = seeds_path
+        self.popularity = Popularity()
+        self.last_pass = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def record(self, location):
+        self.popularity.record(location)
+
+    def seed(self, names):
+        """
+        Adds names to the shared seed list. Returns how many were new.
+        """
+        seeds = load_seeds(self.seeds_path)
+        known = {normalize_place_name(name) for name in seeds}
+        added = []
+        for name in names:
+            name = name.strip()
+            key = normalize_place_name(name)
+            if key and key not in known:
+                known.add(key)
+                added.append(name)
+        save_seeds(seeds + added, self.seeds_path)
+        return len(added)
+
+    def warm_set(self):
+        """
+        Location names to keep warm: seeds first, then the most requested.
+        """
+        names = {}
+        for name in load_seeds(self.seeds_path) + [name for name, _ in self.popularity.top(self.top_k)]:
+            names.setdefault(normalize_place_name(name), name)
+        return list(names.values())
+
+    def _may_call(self, host, wait, stats):
+        """
+        True if the pass may call host now. Without wait, busy upstreams are skipped.
+        """
+        if self._stop.is_set():
+            return False
+        if not wait and not ratelimit.has_headroom(host):
+            stats["deferred"] += 1
+            return False
+        return True
+
+    def _pause(self):
+        self._stop.wait(self.pace)
+
+    def _resolve(self, names, wait, stats):
+        """
+        Coordinates per warm city, refreshing geocodes that are due.
+        Returns [(name, geo)] with one entry per distinct coordinate.
+        """
+        cities = {}
+        for name in names:
+            entry = geocoding.peek(name)
+            geo = None if entry is MISS else entry[0]
+            if (entry is MISS or _due(entry[1], REFRESH_AHEAD["geocode"])) and self._may_call(NOMINATIM_HOST, wait, stats):
+                geo = geocoding.refresh(name) or geo
+                stats["geocode"] += 1
+                self._pause()
+            # Regions are answered with a "please pick a city" message; nothing to warm
+            if geo and geo.get("addresstype") not in REGION_TYPES:
+                cities.setdefault((geo["lat"], geo["lon"]), (name, geo))
+        return list(cities.values())
+
+    def warm_once(self, wait=False):
+        """
+        One refresh pass over the warm set. With wait, calls queue for
+        upstream capacity (still behind live traffic) instead of being
+        deferred. Returns counts of the work done.
+        """
+        stats = {"cities": 0, "geocode": 0, "weather": 0, "places": 0, "deferred": 0}
+        with ratelimit.priority(ratelimit.PRIORITY_BACKGROUND):
+            cities = self._resolve(self.warm_set(), wait, stats)
+            stats["cities"] = len(cities)
+
+            # 1. Every due forecast in grouped Open-Meteo requests
+            coords = [
+                (geo["lat"], geo["lon"]) for _, geo in cities
+                if _due(weather_agent.forecast_expires_at(geo["lat"], geo["lon"]), REFRESH_AHEAD["weather"])
+            ]
+            if coords and self._may_call(OPEN_METEO_HOST, wait, stats):
+                weather_agent.refresh_forecasts(coords)
+                stats["weather"] = len(coords)
+                self._pause()
+
+            # 2. One Overpass query per city with due tiles
+            for _, geo in cities:
+                tiles = places_agent.tiles_to_refresh(geo["lat"], geo["lon"], REFRESH_AHEAD["places"])
+                if tiles and self._may_call(OVERPASS_HOST, wait, stats):
+                    places_agent.refresh_tiles(tiles)
+                    stats["places"] += 1
+                    self._pause()
+
+        self.last_pass = dict(stats, finished=time.time())
+        return stats
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.warm_once()
+            except Exception as e:
+                print(f"Cache warming pass failed: {e}")
+            self._stop.wait(self.interval)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="tourism-cache-warmer", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
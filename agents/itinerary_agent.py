@@ -0,0 +1,177 @@
+import math
+
+from agents import places_agent, weather_agent
+from utils.geo import local_xy
+
+# Stops planned per day, and the longest trip we plan day by day
+STOPS_PER_DAY = 4
+MAX_DAYS = 14
+
+# Daytime precipitation probability (%) at which a day is planned indoors
+RAINY_DAY_CHANCE = 50
+INDOOR_CATEGORIES = frozenset(("museum", "aquarium"))
+
+KMEANS_ITERATIONS = 20
+
+
+def _distance(a, b):
+    return math.hypot(a[0] - b[0], a[1] - b[1])
+
+def _assign(points, centroids, capacity):
+    """
+    Gives each point its nearest centroid, with at most `capacity` points per
+    centroid: (point, centroid) pairs are taken closest first.
+    """
+    pairs = sorted(
+        (_distance(p, c), i, j) for i, p in enumerate(points) for j, c in enumerate(centroids)
+    )
+    labels = [None] * len(points)
+    load = [0] * len(centroids)
+    left = len(points)
+    for _, i, j in pairs:
+        if labels[i] is None and load[j] < capacity:
+            labels[i] = j
+            load[j] += 1
+            left -= 1
+            if not left:
+                break
+    return labels
+
+def cluster(points, k):
+    """
+    Splits projected points into k geographic groups of near-equal size
+    (capacity-constrained k-means). Returns a group label per point; some
+    labels may go unused when points coincide.
+    """
+    capacity = math.ceil(len(points) / k)
+
+    # Deterministic farthest-point seeding, starting from the best-ranked point
+    centroids = [points[0]]
+    while len(centroids) < k:
+        centroids.append(max(points, key=lambda p: min(_distance(p, c) for c in centroids)))
+
+    labels = _assign(points, centroids, capacity)
+    for _ in range(KMEANS_ITERATIONS):
+        updated = []
+        for j, centroid in enumerate(centroids):
+            members = [p for p, label in zip(points, labels) if label == j]
+            if members:
+                updated.append((sum(p[0] for p in members) / len(members), sum(p[1] for p in members) / len(members)))
+            else:
+                updated.append(centroid)
+        if updated == centroids:
+            break
+        centroids = updated
+        labels = _assign(points, centroids, capacity)
+    return labels
+
+def route(start, points):
+    """
+    Visiting order (indexes into points) for a walk from start: nearest
+    neighbour, then 2-opt reversals until none shortens the path.
+    """
+    # 1. Nearest neighbour
+    order = []
+    remaining = set(range(len(points)))
+    current = start
+    while remaining:
+        nearest = min(remaining, key=lambda i: _distance(current, points[i]))
+        remaining.remove(nearest)
+        order.append(nearest)
+        current = points[nearest]
+
+    # 2. 2-opt on the open path (the start stays fixed)
+    path = [start] + [points[i] for i in order]
+    improved = True
+    while improved:
+        improved = False
+        for i in range(1, len(path) - 1):
+            for j in range(i + 1, len(path)):
+                a, b, c = path[i - 1], path[i], path[j]
+                d = path[j + 1] if j + 1 < len(path) else None
+                before = _distance(a, b) + (_distance(c, d) if d else 0)
+                after = _distance(a, c) + (_distance(b, d) if d else 0)
+                if after < before - 1e-6:
+                    path[i:j + 1] = reversed(path[i:j + 1])
+                    order[i - 1:j] = reversed(order[i - 1:j])
+                    improved = True
+    return order
+
+def _path_length(start, points):
+    total = 0.0
+    for point in points:
+        total += _distance(start, point)
+        start = point
+    return total
+
+def _day_weather(lat, lon, num_days):
+    """
+    [(date, daytime rain chance)] per trip day from the cached forecast, or
+    (None, None) per day when there isn't one.
+    """
+    forecast = weather_agent.cached_forecast(lat, lon)
+    if forecast is None:
+        return [(None, None)] * num_days
+    return weather_agent.daily_rain_chance(forecast, num_days)
+
+def plan_itinerary(lat, lon, num_days):
+    """
+    Builds a day-by-day plan for a multi-day trip: the best-ranked attractions
+    near the city are grouped into one geographic cluster per day, each day
+    is ordered into a short walking route from the city centre, and the days
+    with most rain get the clusters with most indoor venues.
+    Uses only cached attractions and forecasts, so it adds no upstream calls;
+    call after the places agent has run.
+    """
+    num_days = max(1, min(num_days, MAX_DAYS))
+    candidates = places_agent.cached_candidates(lat, lon, num_days * STOPS_PER_DAY)
+    days = _day_weather(lat, lon, num_days)
+    if not candidates:
+        return []
+
+    # 1. Cluster in local metres around the city centre
+    points = [local_xy(c["lat"], c["lon"], lat, lon) for c in candidates]
+    k = min(num_days, len(candidates))
+    labels = cluster(points, k)
+    groups = [[i for i, label in enumerate(labels) if label == j] for j in range(k)]
+    # Attractions at the same spot can leave a group empty; those days stay free
+    groups = [members for members in groups if members]
+
+    # 2. Days in rank order (the group holding the top attraction first), then
+    # move the most indoor groups onto the rainiest days
+    groups.sort(key=lambda members: min(members))
+    rainy = sorted(
+        (d for d, (_, chance) in enumerate(days) if chance is not None and chance >= RAINY_DAY_CHANCE),
+        key=lambda d: -days[d][1]
+    )
+    by_day = [None] * num_days
+    if rainy:
+        indoor_first = sorted(
+            range(len(groups)),
+            key=lambda g: -sum(candidates[i]["category"] in INDOOR_CATEGORIES for i in groups[g]) / len(groups[g])
+        )
+        for day, g in zip(rainy, indoor_first):
+            by_day[day] = groups[g]
+    leftover = iter(g for g in groups if not any(g is assigned for assigned in by_day))
+    for day in range(num_days):
+        if by_day[day] is None:
+            by_day[day] = next(leftover, [])
+
+    # 3. Route each day from the centre
+    itinerary = []
+    for day, members in enumerate(by_day):
+        order = [members[i] for i in route((0.0, 0.0), [points[m] for m in members])]
+        date, chance = days[day]
+        itinerary.append({
+            "day": day + 1,
+            "date": date,
+            "rain_chance": chance,
+            "indoor": chance is not None and chance >= RAINY_DAY_CHANCE,
+            "stops": [
+                {"name": candidates[i]["name"], "category": candidates[i]["category"],
+                 "lat": candidates[i]["lat"], "lon": candidates[i]["lon"]}
+                for i in order
+            ],
+            "route_km": round(_path_length((0.0, 0.0), [points[i] for i in order]) / 1000, 1)
+        })
+    return itinerary
@@ -1,156 +1,781 @@
-import re
-from utils.geocoding import get_coordinates
-from agents.weather_agent import get_weather
-from agents.places_agent import get_places
-from agents.travel_advisor import get_packing_suggestion, get_travel_tips, get_activity_advice
+import asyncio
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, TimeoutError as FutureTimeoutError, wait
+from utils.geocoding import REGION_TYPES, get_coordinates, get_coordinates_async, normalize_place_name
+from agents.weather_agent import get_weather, get_weather_async, get_weather_batch, get_weather_batch_async
+from agents.places_agent import get_places, get_places_async, get_places_batch, get_places_batch_async
+from agents import query_parser
+from agents.itinerary_agent import plan_itinerary
+from agents.cache_warmer import CacheWarmer, WARM_TOP_K
+from utils.gazetteer import get_gazetteer
+from utils.cache import LRUCache, SingleFlight, MISS
+from utils import circuit, metrics
+from agents.travel_advisor import get_packing_suggestion, get_travel_tips, get_activity_advice, get_budget_estimate
 
-class TourismAgent:
-    def __init__(self):
-        pass
+# Seconds a child agent may take before its section is dropped from the response
+AGENT_TIMEOUT = 10
+
+# Complete responses are served as-is while fresh, and served immediately but
+# refreshed in the background while stale (weather is what goes out of date).
+RESPONSE_FRESH_TTL = 10 * 60
+RESPONSE_STALE_TTL = 6 * 3600
+
+# Threads recomputing stale responses. They are separate from the agent pool
+# because a refresh submits agent jobs and waits for them.
+REFRESH_WORKERS = 2
 
-    def extract_location(self, query):
+def _timed(fn, *args):
+    """
+    Runs fn(*args) and returns (result, elapsed milliseconds).
+    """
+    start = time.perf_counter()
+    value = fn(*args)
+    return value, round((time.perf_counter() - start) * 1000, 1)
+
+class TourismAgent:
+    def __init__(self, concurrent=True, max_workers=8, agent_timeout=AGENT_TIMEOUT, response_cache=True, warm_top_k=WARM_TOP_K):
         """
-        Extracts location from query using regex patterns or loose matching.
+        Args:
+            concurrent (bool): Run the weather and places agents in parallel once geocoding finishes.
+            max_workers (int): Size of the thread pool shared by all requests.
+            agent_timeout (float): Seconds to wait for the child agents before returning partial results.
+            response_cache (bool): Reuse complete responses for equivalent requests (see process_request).
+            warm_top_k (int): Keep the data of the K most requested cities fresh in the background (0: off).
         """
+        self.concurrent = concurrent
+        self.agent_timeout = agent_timeout
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tourism-agent") if concurrent else None
+        self.responses = LRUCache(max_entries=1024) if response_cache else None
+        self.inflight = SingleFlight()
+        self.refresher = ThreadPoolExecutor(max_workers=REFRESH_WORKERS, thread_name_prefix="tourism-refresh")
+        self._refreshing = set()
+        self._refreshing_lock = threading.Lock()
+        # Async path: in-flight plans per response key, and refresh tasks kept alive until done
+        self._async_inflight = {}
+        self.warmer = CacheWarmer(warm_top_k).start() if warm_top_k > 0 else None
+
     def extract_location(self, text):
         """
         Extracts location from query using robust regex patterns and cleaning.
         """
-        # Clean punctuation at sentence boundaries
-        text = re.sub(r'[.!?]+\s+', ' ', text)
-        
-        # Patterns to extract location
-        # Matches: "going to X", "visit X", "trip to X", "traveling to X"
-        # Stops at: punctuation, end of string, or keywords (help, plan, etc.)
-        patterns = [
-            r"(?:going|go|visit\w*|travel\w*|trip)\s+(?:to\s+)?([a-zA-Z\s]+?)(?:\s+(?:let|help|plan|what|and|please|can|could|would|me|give|tell|show)|[\.,!\?]|$)",
-            r"(?:in|at)\s+([a-zA-Z\s]+?)(?:\s+(?:let|help|plan|what|and|please|can|could|would|me|give|tell|show)|[\.,!\?]|$)"
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                location = match.group(1).strip()
-                
-                # Secondary cleanup: Remove any trailing stop words that might have slipped into the capture group
-                # (Though the regex lookahead should catch most)
-                stop_words = ['help', 'plan', 'let', 'the', 'my', 'this', 'trip', 'me', 'please', 'is', 'a', 'an', 'give', 'tell', 'show']
-                words = location.split()
-                cleaned = []
-                for word in words:
-                    if word.lower() in stop_words:
-                        break
-                    cleaned.append(word)
-                
-                if cleaned:
-                    return ' '.join(cleaned).strip().title()
-        
-        # Fallback for simple "Bangalore" type queries
-        # If short query and not matched yet, assume it's the location
-        # But filter common junk
-        clean_text = text.lower()
-        junk = ["i'm", "i", "am", "travel", "to", "city", "place", "location"]
-        
-        if len(text.split()) <= 3:
-             # Remove junk (whole words only)
-             for j in junk:
-                 clean_text = re.sub(r'\b' + re.escape(j) + r'\b', '', clean_text)
-             return clean_text.strip().title()
+        return query_parser.extract_location(text)
 
-        return None
+    def _run_agents(self, lat, lon, show_places, timings):
+        """
+        Calls the weather agent and (if needed) the places agent.
+        In concurrent mode both upstream calls are in flight at the same time and
+        any agent that misses the deadline is reported as timed out instead of
+        holding up the whole response.
+        """
+        jobs = {"weather": (get_weather, lat, lon)}
+        if show_places:
+            jobs["places"] = (get_places, lat, lon)
+        outputs, timed_out = self._run_jobs(jobs, timings)
+        return self._fill_timeouts(outputs, timed_out), timed_out
 
-    def process_request(self, query):
-        query_lower = query.lower()
-        
-        # 1. Detect Intents
-        show_weather = False
-        show_places = False
-        
-        if any(k in query_lower for k in ["weather", "temperature", "rain", "forecast", "hot", "cold"]):
-            show_weather = True
-        
-        if any(k in query_lower for k in ["place", "visit", "attraction", "sight", "see", "plan"]):
-            show_places = True
-            
-        if not show_weather and not show_places:
-            show_places = True
-            
-        # Duration Parsing
-        num_days = 1
-        day_match = re.search(r"(\d+)\s*days?", query, re.IGNORECASE)
-        if day_match:
+    def _run_jobs(self, jobs, timings):
+        """
+        Runs {name: (fn, *args)} jobs, in parallel when concurrent, and
+        returns (outputs, names of the jobs that missed the deadline).
+        """
+        if not self.concurrent:
+            outputs = {}
+            for name, (fn, *args) in jobs.items():
+                outputs[name], timings[name] = _timed(fn, *args)
+            return outputs, []
+
+        futures = {name: self.executor.submit(_timed, fn, *args) for name, (fn, *args) in jobs.items()}
+        deadline = time.perf_counter() + self.agent_timeout
+        outputs = {}
+        timed_out = []
+        for name, future in futures.items():
+            try:
+                outputs[name], timings[name] = future.result(timeout=max(0, deadline - time.perf_counter()))
+            except FutureTimeoutError:
+                future.cancel()
+                timed_out.append(name)
+                timings[name] = round(self.agent_timeout * 1000, 1)
+        return outputs, timed_out
+
+    async def _run_agents_async(self, lat, lon, show_places, timings):
+        """
+        Async variant of _run_agents: both agents run on the event loop, each
+        bounded by agent_timeout.
+        """
+        jobs = {"weather": get_weather_async(lat, lon)}
+        if show_places:
+            jobs["places"] = get_places_async(lat, lon)
+        outputs, timed_out = await self._run_jobs_async(jobs, timings)
+        return self._fill_timeouts(outputs, timed_out), timed_out
+
+    async def _run_jobs_async(self, jobs, timings):
+        """
+        Async variant of _run_jobs for {name: coroutine} jobs.
+        """
+        async def timed(name, coro):
+            start = time.perf_counter()
             try:
-                num_days = int(day_match.group(1))
-            except ValueError:
-                num_days = 1
-            
-        # 2. Extract Location
-        location = self.extract_location(query)
-        if not location:
-            # Last ditch attempt: use raw query if short enough (likely just a city name)
-            if len(query.split()) <= 3:
-                location = query
+                return await asyncio.wait_for(coro, self.agent_timeout)
+            finally:
+                timings[name] = round((time.perf_counter() - start) * 1000, 1)
+
+        values = await asyncio.gather(*(timed(name, coro) for name, coro in jobs.items()), return_exceptions=True)
+        outputs = {}
+        timed_out = []
+        for name, value in zip(jobs, values):
+            if isinstance(value, asyncio.TimeoutError):
+                timed_out.append(name)
+            elif isinstance(value, BaseException):
+                raise value
             else:
-                return {"error": "I couldn't identify the location."}
-        
-        # 3. Geocoding
-        geo_result = get_coordinates(location)
+                outputs[name] = value
+        return outputs, timed_out
+
+    def _fill_timeouts(self, outputs, timed_out):
+        for name in timed_out:
+            metrics.AGENT_TIMEOUTS.inc(name)
+        if "weather" in timed_out:
+            outputs["weather"] = {"error": "Weather agent timed out"}
+        if "places" in timed_out:
+            outputs["places"] = []
+        return outputs
+
+    def parse_query(self, query):
+        """
+        Reads intents, trip length and location out of a chat message.
+        Returns {location, show_weather, show_places, num_days} or {"error": ...}.
+        """
+        with metrics.STAGE_SECONDS.time("parse"):
+            return query_parser.parse_query(query)
+
+    def check_location(self, location, geo_result):
+        """
+        Returns an error message if the geocoding result can't be planned for
+        (unknown place, or a country/state instead of a city), else None.
+        """
         if not geo_result:
-            return {"error": f"I don't know where '{location}' is."}
+            return f"I don't know where '{location}' is."
         
         # Geographic Level Check
         # If Country/State, ask for city.
         addr_type = geo_result.get("addresstype", "unknown")
-        if addr_type in ["country", "state", "region", "province"]:
+        if addr_type in REGION_TYPES:
              msg = f"'{geo_result['display_name']}' is a {addr_type}. Please specify a city for better recommendations."
              
-             # Suggestions for popular inputs
-             suggestions = {
-                 "Kerala": "Kochi, Munnar, Alappuzha, Thiruvananthapuram",
-                 "Italy": "Rome, Venice, Florence, Milan",
-                 "India": "Delhi, Mumbai, Jaipur, Bangalore",
-                 "Karnataka": "Bangalore, Mysore, Hampi, Coorg",
-                 "France": "Paris, Nice, Lyon"
-             }
-             
-             # Check if any key in suggestions is in the display name
-             for key, val in suggestions.items():
-                 if key in geo_result['display_name']:
-                     msg += f"\nPopular cities include: {val}."
-                     break
+             # Suggestions for popular regions come from the gazetteer
+             popular = get_gazetteer().suggestions_for(geo_result['display_name'])
+             if popular:
+                 msg += f"\nPopular cities include: {popular}."
                      
-             return {"error": msg}
+             return msg
+
+        return None
 
-        lat = geo_result["lat"]
-        lon = geo_result["lon"]
+    def build_result(self, parsed, geo_result, weather, places):
+        """
+        Combines the child agents' outputs with the travel advisor's suggestions.
+        """
         display_name = geo_result["display_name"]
         simple_name = display_name.split(",")[0]
         
         result = {
             "city": simple_name,
             "full_name": display_name,
-            "days": num_days,
+            "days": parsed["num_days"],
             "intents": {
-                "weather": show_weather,
-                "places": show_places
+                "weather": parsed["show_weather"],
+                "places": parsed["show_places"]
             },
-            "weather": None,
-            "places": None
+            "weather": weather,
+            "places": places if parsed["show_places"] else None
         }
+
+        # Get Advanced Features (Always fetch if we have a city, as they add value)
+        # Pass the weather data (if any) to travel advisor
+        result["packing"] = get_packing_suggestion(weather)
+        result["tips"] = get_travel_tips(simple_name)
+        result["activity_advice"] = get_activity_advice(weather)
+
+        # Multi-day trips get a day-by-day plan from the attractions and forecast already fetched
+        if parsed["num_days"] > 1 and places:
+            result["itinerary"] = plan_itinerary(geo_result["lat"], geo_result["lon"], parsed["num_days"])
+        
+        return result
+
+    def _response_key(self, parsed):
+        """
+        Canonical identity of a request: equivalent phrasings of the same trip
+        ("plan my trip to Rome", "going to rome, help me plan") share a key.
+        """
+        return (
+            "|".join(normalize_place_name(location) for location in parsed["locations"]),
+            parsed["num_days"],
+            parsed["show_weather"],
+            parsed["show_places"]
+        )
+
+    def _plan(self, parsed, request_start, key=None):
+        """
+        Runs geocoding, the child agents and the advisor for a parsed request,
+        storing complete results in the response cache under key.
+        """
+        if len(parsed["locations"]) > 1:
+            return self._compare(parsed, request_start, key)
+        timings = {}
+        
+        # 3. Geocoding
+        geo_result, timings["geocoding"] = _timed(get_coordinates, parsed["location"])
+        return self._plan_located(parsed, geo_result, timings, request_start, key)
+
+    def _plan_located(self, parsed, geo_result, timings, request_start, key):
+        error = self.check_location(parsed["location"], geo_result)
+        if error:
+            return {"error": error}
         
         # 4. Execute Intended Actions
         # Always fetch weather as it drives other features
-        result["weather"] = get_weather(lat, lon)
-            
-        if show_places:
-            result["places"] = get_places(lat, lon)
+        outputs, timed_out = self._run_agents(geo_result["lat"], geo_result["lon"], parsed["show_places"], timings)
+        return self._finish(parsed, geo_result, outputs, timed_out, timings, request_start, key)
 
-        # 5. Get Advanced Features (Always fetch if we have a city, as they add value)
-        # Pass the weather data (if any) to travel advisor
-        weather_data = result.get("weather")
-        
-        result["packing"] = get_packing_suggestion(weather_data)
-        result["tips"] = get_travel_tips(simple_name)
-        result["activity_advice"] = get_activity_advice(weather_data)
+    async def _plan_async(self, parsed, request_start, key=None):
+        """
+        Async variant of _plan.
+        """
+        if len(parsed["locations"]) > 1:
+            return await self._compare_async(parsed, request_start, key)
+        timings = {}
+
+        geocode_start = time.perf_counter()
+        geo_result = await get_coordinates_async(parsed["location"])
+        timings["geocoding"] = round((time.perf_counter() - geocode_start) * 1000, 1)
+        return await self._plan_located_async(parsed, geo_result, timings, request_start, key)
+
+    async def _plan_located_async(self, parsed, geo_result, timings, request_start, key):
+        error = self.check_location(parsed["location"], geo_result)
+        if error:
+            return {"error": error}
+
+        outputs, timed_out = await self._run_agents_async(geo_result["lat"], geo_result["lon"], parsed["show_places"], timings)
+        return self._finish(parsed, geo_result, outputs, timed_out, timings, request_start, key)
+
+    def _finish(self, parsed, geo_result, outputs, timed_out, timings, request_start, key):
+        # 5. Advisor features
+        advisor_start = time.perf_counter()
+        result = self.build_result(parsed, geo_result, outputs["weather"], outputs.get("places"))
+        timings["advisor"] = round((time.perf_counter() - advisor_start) * 1000, 1)
+        if timed_out:
+            result["timed_out"] = timed_out
+        return self._complete(result, [result["weather"]], [outputs.get("places")], timed_out, timings, request_start, key)
+
+    def _complete(self, result, weather, places, timed_out, timings, request_start, key):
+        """
+        Adds the timings to a finished result and caches it under key if
+        nothing is missing from it.
+        """
+        # Per-agent latency in milliseconds
+        timings["total"] = round((time.perf_counter() - request_start) * 1000, 1)
+        result["timings"] = timings
+        for stage, ms in timings.items():
+            metrics.STAGE_SECONDS.observe(ms / 1000, stage)
+
+        # Partial answers (timeouts, weather errors, stale weather or
+        # attractions, anything built while an upstream's circuit is open)
+        # are not worth repeating
+        failed = any(isinstance(w, dict) and ("error" in w or w.get("stale")) for w in weather)
+        failed = failed or any(getattr(p, "error", None) or getattr(p, "stale", False) for p in places)
+        if key is not None and self.responses is not None and not timed_out and not failed and not circuit.any_open():
+            now = time.time()
+            self.responses.set(key, {"payload": result, "fresh_until": now + RESPONSE_FRESH_TTL}, now + RESPONSE_FRESH_TTL + RESPONSE_STALE_TTL)
         
         return result
+
+    def _compare(self, parsed, request_start, key=None):
+        """
+        Plans every location of a comparison query together: they are
+        geocoded in parallel, then the weather for all of them comes from one
+        grouped Open-Meteo request and their attractions from one Overpass
+        query, so N cities cost about one round trip.
+        """
+        timings = {}
+        locations = parsed["locations"]
+        if self.executor:
+            geos, timings["geocoding"] = _timed(lambda: list(self.executor.map(get_coordinates, locations)))
+        else:
+            geos, timings["geocoding"] = _timed(lambda: [get_coordinates(location) for location in locations])
+
+        parsed, geos = self._drop_qualifiers(parsed, geos)
+        if len(geos) == 1:
+            return self._plan_located(parsed, geos[0], timings, request_start, key)
+
+        coords, errors = self._compare_targets(parsed["locations"], geos)
+        if not coords:
+            return {"error": " ".join(errors)}
+
+        jobs = {"weather": (get_weather_batch, coords)}
+        if parsed["show_places"]:
+            jobs["places"] = (get_places_batch, coords)
+        outputs, timed_out = self._run_jobs(jobs, timings)
+        return self._finish_comparison(parsed, geos, errors, coords, outputs, timed_out, timings, request_start, key)
+
+    async def _compare_async(self, parsed, request_start, key=None):
+        """
+        Async variant of _compare.
+        """
+        timings = {}
+        locations = parsed["locations"]
+        geocode_start = time.perf_counter()
+        geos = await asyncio.gather(*(get_coordinates_async(location) for location in locations))
+        timings["geocoding"] = round((time.perf_counter() - geocode_start) * 1000, 1)
+
+        parsed, geos = self._drop_qualifiers(parsed, geos)
+        if len(geos) == 1:
+            return await self._plan_located_async(parsed, geos[0], timings, request_start, key)
+
+        coords, errors = self._compare_targets(parsed["locations"], geos)
+        if not coords:
+            return {"error": " ".join(errors)}
+
+        jobs = {"weather": get_weather_batch_async(coords)}
+        if parsed["show_places"]:
+            jobs["places"] = get_places_batch_async(coords)
+        outputs, timed_out = await self._run_jobs_async(jobs, timings)
+        return self._finish_comparison(parsed, geos, errors, coords, outputs, timed_out, timings, request_start, key)
+
+    def _drop_qualifiers(self, parsed, geos):
+        """
+        Drops list entries that only qualify the place before them: a
+        country or state whose name is part of that place's full name
+        ("Paris, France or Rome": France). Returns (parsed, geos).
+        """
+        locations = []
+        kept = []
+        for location, geo in zip(parsed["locations"], geos):
+            if kept and kept[-1] and geo and geo.get("addresstype") in REGION_TYPES:
+                region = normalize_place_name(geo["display_name"].split(",")[0])
+                if region in {normalize_place_name(part) for part in kept[-1]["display_name"].split(",")}:
+                    continue
+            locations.append(location)
+            kept.append(geo)
+        if len(locations) == len(geos):
+            return parsed, geos
+        return dict(parsed, location=locations[0], locations=locations), kept
+
+    def _compare_targets(self, locations, geos):
+        """
+        Returns (distinct coordinates to plan for, error message or None per location).
+        """
+        errors = [self.check_location(location, geo) for location, geo in zip(locations, geos)]
+        coords = list(dict.fromkeys((geo["lat"], geo["lon"]) for geo, error in zip(geos, errors) if not error))
+        return coords, errors
+
+    def _finish_comparison(self, parsed, geos, errors, coords, outputs, timed_out, timings, request_start, key):
+        """
+        Builds the side-by-side response: a full result per location plus one
+        summary row each.
+        """
+        for name in timed_out:
+            metrics.AGENT_TIMEOUTS.inc(name)
+        weather = outputs.get("weather") or [{"error": "Weather agent timed out"}] * len(coords)
+        places = outputs.get("places") or [[]] * len(coords)
+        by_coord = dict(zip(coords, zip(weather, places)))
+
+        advisor_start = time.perf_counter()
+        cities = []
+        for location, geo, error in zip(parsed["locations"], geos, errors):
+            if error:
+                cities.append({"city": location, "error": error})
+                continue
+            city_weather, city_places = by_coord[(geo["lat"], geo["lon"])]
+            cities.append(self.build_result(dict(parsed, location=location), geo, city_weather, city_places))
+        summary = [self._summary_row(city) for city in cities]
+        timings["advisor"] = round((time.perf_counter() - advisor_start) * 1000, 1)
+
+        result = {
+            "comparison": cities,
+            "summary": summary,
+            "days": parsed["num_days"],
+            "intents": {
+                "weather": parsed["show_weather"],
+                "places": parsed["show_places"]
+            }
+        }
+        if timed_out:
+            result["timed_out"] = timed_out
+        return self._complete(result, weather, places, timed_out, timings, request_start, key)
+
+    def _summary_row(self, city):
+        """
+        One city's line in a comparison: weather, top attractions and budget.
+        """
+        if "error" in city:
+            return {"city": city["city"], "error": city["error"]}
+        weather = city["weather"] if "error" not in city["weather"] else {}
+        return {
+            "city": city["city"],
+            "temperature": weather.get("temperature"),
+            "description": weather.get("description"),
+            "rain_chance": weather.get("rain_chance"),
+            "top_places": (city["places"] or [])[:3],
+            # None where the knowledge base has no prices for the region
+            "budget": get_budget_estimate(city["city"], city["full_name"]) or None
+        }
+
+    def _cached_response(self, key, request_start):
+        """
+        Returns (cached result or None, True if it is stale and should be refreshed).
+        """
+        entry = self.responses.get(key)
+        if entry is MISS:
+            return None, False
+        stale = entry["fresh_until"] <= time.time()
+        result = dict(entry["payload"])
+        result["cache"] = "stale" if stale else "hit"
+        result["timings"] = {"total": round((time.perf_counter() - request_start) * 1000, 1)}
+        return result, stale
+
+    def _refresh_in_background(self, key, parsed):
+        """
+        Recomputes a stale response off the request path, once per key, on
+        the refresh pool (never the agent pool, which the refresh itself uses).
+        """
+        with self._refreshing_lock:
+            if key in self._refreshing or self.inflight.in_flight(key):
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                self.inflight.do(key, lambda: self._plan(parsed, time.perf_counter(), key))
+            except Exception as e:
+                print(f"Background refresh failed for {key[0]}: {e}")
+            finally:
+                with self._refreshing_lock:
+                    self._refreshing.discard(key)
+
+        self.refresher.submit(refresh)
+
+    def _record(self, result, request_start, parsed=None):
+        """
+        Observes the end-to-end request time, labelled by how it was answered,
+        and counts the city towards the cache warmer's ranking.
+        """
+        outcome = "error" if "error" in result else result.get("cache", "miss")
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - request_start, outcome)
+        if parsed is not None and outcome != "error":
+            self._track(parsed)
+        return result
+
+    def _track(self, parsed):
+        """
+        Counts a successfully planned city towards the cache warmer's ranking.
+        """
+        if self.warmer is not None:
+            for location in parsed["locations"]:
+                self.warmer.record(location)
+
+    def process_request(self, query):
+        request_start = time.perf_counter()
+
+        # 1-2. Intents, duration and location
+        parsed = self.parse_query(query)
+        if "error" in parsed:
+            return self._record(parsed, request_start)
+
+        if self.responses is None:
+            return self._record(self._plan(parsed, request_start), request_start, parsed)
+
+        # Serve equivalent requests from the response cache; refresh stale ones in the background
+        key = self._response_key(parsed)
+        cached, stale = self._cached_response(key, request_start)
+        if cached is not None:
+            if stale:
+                self._refresh_in_background(key, parsed)
+            return self._record(cached, request_start, parsed)
+
+        # Concurrent misses for the same trip share one upstream fan-out
+        result, shared = self.inflight.do(key, lambda: self._plan(parsed, request_start, key))
+        if shared:
+            result = dict(result, cache="coalesced")
+        return self._record(result, request_start, parsed)
+
+    def iter_request(self, query):
+        """
+        Streaming variant of process_request. Yields (event, data) pairs as
+        each stage finishes, so callers can show partial results right away:
+
+            location  city, full_name, days, intents
+            tips      city tips (needs only the location)
+            weather   / places, in whichever order the agents finish
+            advice    packing list, activity advice and (multi-day trips) itinerary
+            done      per-stage timings
+            error     instead of the above when the request can't be planned
+
+        Comparisons ("Rome or Paris?") send one `comparison` event with the
+        whole side-by-side result, then `done`.
+        """
+        request_start = time.perf_counter()
+        outcome = "miss"
+        for event, data in self._iter_events(query, request_start):
+            if event == "error":
+                outcome = "error"
+            elif event == "done":
+                outcome = data.get("cache") or "miss"
+            yield event, data
+        # Labelled like process_request's observations (see _record)
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - request_start, outcome)
+
+    def _iter_events(self, query, request_start):
+        parsed = self.parse_query(query)
+        if "error" in parsed:
+            yield "error", parsed
+            return
+
+        key = self._response_key(parsed) if self.responses is not None else None
+        if key is not None:
+            cached, stale = self._cached_response(key, request_start)
+            if cached is not None:
+                if stale:
+                    self._refresh_in_background(key, parsed)
+                self._track(parsed)
+                yield from self._stream_sections(cached)
+                return
+
+        if len(parsed["locations"]) > 1:
+            if key is not None:
+                result, _ = self.inflight.do(key, lambda: self._plan(parsed, request_start, key))
+            else:
+                result = self._plan(parsed, request_start)
+            if "error" in result:
+                yield "error", result
+                return
+            self._track(parsed)
+            yield from self._stream_sections(result)
+            return
+
+        if key is None:
+            yield from self._stream_plan(parsed, request_start, key)
+            return
+
+        # Concurrent streams for the same trip share one fan-out: the leader
+        # streams as it goes, the others replay its finished result
+        try:
+            finish, result = self.inflight.join(key)
+        except Exception:
+            # The leader failed or its client went away; plan this one directly
+            finish, result = None, self._plan(parsed, request_start, key)
+        if finish is None:
+            if "error" in result:
+                yield "error", result
+                return
+            self._track(parsed)
+            yield from self._stream_sections(dict(result, cache="coalesced"))
+            return
+
+        try:
+            result = yield from self._stream_plan(parsed, request_start, key)
+        except BaseException as e:
+            finish(error=e if isinstance(e, Exception) else RuntimeError("Stream closed before the plan finished"))
+            raise
+        finish(result)
+
+    def _stream_plan(self, parsed, request_start, key):
+        """
+        Plans a single-city request, yielding iter_request's events as each
+        stage finishes. Returns the complete result (or error dict).
+        """
+        timings = {}
+        geo_result, timings["geocoding"] = _timed(get_coordinates, parsed["location"])
+        error = self.check_location(parsed["location"], geo_result)
+        if error:
+            yield "error", {"error": error}
+            return {"error": error}
+
+        simple_name = geo_result["display_name"].split(",")[0]
+        yield "location", {
+            "city": simple_name,
+            "full_name": geo_result["display_name"],
+            "days": parsed["num_days"],
+            "intents": {"weather": parsed["show_weather"], "places": parsed["show_places"]}
+        }
+        yield "tips", {"tips": get_travel_tips(simple_name)}
+
+        lat, lon = geo_result["lat"], geo_result["lon"]
+        jobs = {"weather": (get_weather, lat, lon)}
+        if parsed["show_places"]:
+            jobs["places"] = (get_places, lat, lon)
+
+        outputs = {}
+        timed_out = []
+        if not self.concurrent:
+            for name, (fn, *args) in jobs.items():
+                outputs[name], timings[name] = _timed(fn, *args)
+                yield name, {name: outputs[name]}
+        else:
+            # Emit each agent's section as soon as it completes
+            futures = {self.executor.submit(_timed, fn, *args): name for name, (fn, *args) in jobs.items()}
+            deadline = time.perf_counter() + self.agent_timeout
+            pending = set(futures)
+            while pending:
+                done, pending = wait(pending, timeout=max(0, deadline - time.perf_counter()), return_when=FIRST_COMPLETED)
+                if not done:
+                    break
+                for future in done:
+                    name = futures[future]
+                    outputs[name], timings[name] = future.result()
+                    yield name, {name: outputs[name]}
+            for future in pending:
+                future.cancel()
+                name = futures[future]
+                timed_out.append(name)
+                timings[name] = round(self.agent_timeout * 1000, 1)
+            self._fill_timeouts(outputs, timed_out)
+            for name in timed_out:
+                yield name, {name: outputs[name], "timed_out": True}
+
+        result = self._finish(parsed, geo_result, outputs, timed_out, timings, request_start, key)
+        self._track(parsed)
+        yield "advice", self._advice(result)
+        yield "done", {"timings": result["timings"]}
+        return result
+
+    def _stream_sections(self, result):
+        """
+        Replays a complete result as the events iter_request would have sent.
+        """
+        if "comparison" in result:
+            yield "comparison", {k: v for k, v in result.items() if k != "timings"}
+            yield "done", {"timings": result["timings"], "cache": result.get("cache")}
+            return
+        yield "location", {k: result[k] for k in ("city", "full_name", "days", "intents")}
+        yield "tips", {"tips": result["tips"]}
+        yield "weather", {"weather": result["weather"]}
+        if result["intents"]["places"]:
+            yield "places", {"places": result["places"]}
+        yield "advice", self._advice(result)
+        yield "done", {"timings": result["timings"], "cache": result.get("cache")}
+
+    def _advice(self, result):
+        advice = {"packing": result["packing"], "activity_advice": result["activity_advice"]}
+        if "itinerary" in result:
+            advice["itinerary"] = result["itinerary"]
+        return advice
+
+    def _plan_task(self, key, parsed, request_start):
+        """
+        Returns (task, shared): the in-flight async plan for key, starting one if needed.
+        """
+        task = self._async_inflight.get(key)
+        if task is not None:
+            return task, True
+        task = asyncio.ensure_future(self._plan_async(parsed, request_start, key))
+        self._async_inflight[key] = task
+
+        def done(finished):
+            self._async_inflight.pop(key, None)
+            if not finished.cancelled() and finished.exception() is not None:
+                print(f"Planning failed for {key[0]}: {finished.exception()}")
+
+        task.add_done_callback(done)
+        return task, False
+
+    async def process_request_async(self, query):
+        """
+        Async variant of process_request for the ASGI app; upstream calls run on
+        the event loop instead of blocking a worker thread.
+        """
+        request_start = time.perf_counter()
+
+        parsed = self.parse_query(query)
+        if "error" in parsed:
+            return self._record(parsed, request_start)
+
+        if self.responses is None:
+            return self._record(await self._plan_async(parsed, request_start), request_start, parsed)
+
+        key = self._response_key(parsed)
+        cached, stale = self._cached_response(key, request_start)
+        if cached is not None:
+            if stale and key not in self._async_inflight:
+                self._plan_task(key, parsed, time.perf_counter())
+            return self._record(cached, request_start, parsed)
+
+        task, shared = self._plan_task(key, parsed, request_start)
+        # Shielded so a client disconnect doesn't cancel the plan other requests are waiting on
+        result = await asyncio.shield(task)
+        if shared:
+            result = dict(result, cache="coalesced")
+        return self._record(result, request_start, parsed)
+
+    def iter_batch(self, messages):
+        """
+        Plans many chat messages at once, sharing upstream work between them:
+        each distinct location is geocoded once, weather for all distinct
+        coordinates comes from grouped Open-Meteo calls, and each distinct
+        coordinate's places are fetched once.
+        Yields results in input order as soon as each one is ready.
+        """
+        parsed = [self.parse_query(m) if m.strip() else {"error": "Empty message"} for m in messages]
+
+        # Comparisons are planned on their own; each is already one grouped fan-out
+        comparisons = {i for i, p in enumerate(parsed) if "error" not in p and len(p["locations"]) > 1}
+
+        # 1. Geocode every distinct location once
+        locations = {}
+        for i, p in enumerate(parsed):
+            if "error" not in p and i not in comparisons:
+                locations.setdefault(normalize_place_name(p["location"]), p["location"])
+        keys = list(locations)
+        if self.executor:
+            geocoded = dict(zip(keys, self.executor.map(get_coordinates, [locations[k] for k in keys])))
+        else:
+            geocoded = {k: get_coordinates(locations[k]) for k in keys}
+
+        # 2. One weather lookup per distinct coordinate, grouped into batch calls
+        geos = [None] * len(parsed)
+        for i, p in enumerate(parsed):
+            if "error" in p or i in comparisons:
+                continue
+            geo = geocoded[normalize_place_name(p["location"])]
+            error = self.check_location(p["location"], geo)
+            if error:
+                parsed[i] = {"error": error}
+            else:
+                geos[i] = geo
+
+        coords = list(dict.fromkeys((g["lat"], g["lon"]) for g in geos if g))
+        weather = dict(zip(coords, get_weather_batch(coords)))
+
+        # 3. Places once per distinct coordinate that asked for them
+        place_coords = list(dict.fromkeys(
+            (g["lat"], g["lon"]) for g, p in zip(geos, parsed) if g and p["show_places"]
+        ))
+        if self.executor:
+            place_futures = {c: self.executor.submit(get_places, *c) for c in place_coords}
+        else:
+            place_futures = None
+            places = {c: get_places(*c) for c in place_coords}
+
+        # 4. Assemble in input order
+        for i, (p, geo) in enumerate(zip(parsed, geos)):
+            if i in comparisons:
+                result = self._plan(p, time.perf_counter())
+                if "error" not in result:
+                    self._track(p)
+                yield result
+                continue
+            if "error" in p:
+                yield {"error": p["error"]}
+                continue
+            coord = (geo["lat"], geo["lon"])
+            place_list = None
+            if p["show_places"]:
+                place_list = place_futures[coord].result() if place_futures else places[coord]
+            self._track(p)
+            yield self.build_result(p, geo, weather[coord], place_list)
+
+    def process_batch(self, messages):
+        """
+        Batch version of process_request; returns a list of results in input order.
+        """
+        return list(self.iter_batch(messages))
@@ -1,64 +1,366 @@
-import requests
+import time
+
+from utils import metrics, transport
+from utils.attraction_index import get_index
+from utils.cache import TieredCache, MISS
+from utils.geo import haversine_m, tiles_covering, tile_of, tile_bbox, TILE_DEG
+
+OVERPASS_URL = "https://overpass-api.de/api/interpreter"
+
+SEARCH_RADIUS = 5000  # metres
+MIN_STRICT_RESULTS = 3
+TOP_PLACES = 5
+
+# Attractions change slowly; a tile is refetched at most once a week
+TILE_TTL = 7 * 24 * 3600
+
+# Expired tiles are kept this long and served while Overpass is unavailable
+STALE_TTL = 30 * 24 * 3600
+
+# Tags the offline index keeps per element (see utils.attraction_index)
+KEPT_TAGS = ("name", "tourism", "historic", "leisure", "wikipedia", "wikidata")
+
+# Features we treat as attractions: tag key -> accepted values
+FEATURE_TAGS = {
+    "tourism": ("attraction", "museum", "zoo", "theme_park", "aquarium", "viewpoint"),
+    "historic": ("castle", "monument", "memorial", "ruins"),
+    "leisure": ("park",),
+}
+
+FEATURE_FILTERS = [
+    f'["{key}"="{values[0]}"]' if len(values) == 1 else f'["{key}"~"{"|".join(values)}"]'
+    for key, values in FEATURE_TAGS.items()
+]
+
+# Ranking: an attraction's importance is its category weight plus bonuses
+# for being referenced by Wikipedia/Wikidata, minus up to DISTANCE_WEIGHT for
+# distance from the query point (0 at the centre, all of it at SEARCH_RADIUS).
+# The Wikipedia bonus outweighs the whole distance range, so referenced
+# attractions still come before unreferenced ones, as the strict filter did.
+CATEGORY_WEIGHTS = {
+    "attraction": 1.0, "museum": 1.0, "castle": 1.0,
+    "zoo": 0.8, "theme_park": 0.8, "aquarium": 0.8,
+    "monument": 0.7, "ruins": 0.7,
+    "park": 0.5, "viewpoint": 0.5, "memorial": 0.4,
+}
+WIKIPEDIA_BONUS = 2.0
+WIKIDATA_BONUS = 0.5
+DISTANCE_WEIGHT = 1.5
+
+# Compact attraction records per grid tile (see utils.geo). Bounded in memory and on disk.
+_tile_cache = TieredCache("places_tiles", memory_entries=4096, disk_entries=100000, stale_ttl=STALE_TTL)
+
+# Bumped when the cached record shape changes
+TILE_FORMAT = 2
+
+
+class PlaceList(list):
+    """
+    Attraction names (or records) for one point. When Overpass failed,
+    `stale` marks lists built partly from expired tiles and `error` lists
+    missing tiles nothing could stand in for. Serialises as a plain list.
+    """
+    stale = False
+    error = None
+
+def _tile_key(tile):
+    return f"v{TILE_FORMAT}:{TILE_DEG}:{tile[0]}:{tile[1]}"
+
+def _category(tags):
+    for key, values in FEATURE_TAGS.items():
+        if tags.get(key) in values:
+            return tags[key]
+    return "attraction"
+
+def _record(name, lat, lon, tags):
+    """
+    Compact attraction record: just what ranking and display need.
+    """
+    return {
+        "name": name,
+        "lat": lat,
+        "lon": lon,
+        "category": _category(tags),
+        "wikipedia": "wikipedia" in tags,
+        "wikidata": "wikidata" in tags,
+    }
+
+def _span(tiles):
+    """
+    Every tile in the rectangle spanned by the given tiles.
+    """
+    rows = [t[0] for t in tiles]
+    cols = [t[1] for t in tiles]
+    return [(r, c) for r in range(min(rows), max(rows) + 1) for c in range(min(cols), max(cols) + 1)]
+
+def _tiles_query(groups):
+    """
+    One broad Overpass query for every named attraction inside the span of
+    each group of tiles (a union of bounding boxes when there are several).
+    """
+    clauses = []
+    for tiles in groups:
+        span = _span(tiles)
+        south, west, _, _ = tile_bbox(span[0])
+        _, _, north, east = tile_bbox(span[-1])
+        clauses.extend(
+            f'      nwr{f}["name"]({south:.5f},{west:.5f},{north:.5f},{east:.5f});' for f in FEATURE_FILTERS
+        )
+    clauses = "\n".join(clauses)
+    # Nodes carry their own coordinates; ways and relations only need tags
+    # and a centre point, not their member lists
+    return f"""
+    [out:json][timeout:25];
+    (
+{clauses}
+    )->.found;
+    node.found;
+    out body qt;
+    (way.found; relation.found;);
+    out tags center qt;
+    """
+
+def _store_tiles(groups, data):
+    """
+    Splits an Overpass response into per-tile element lists and caches them
+    (empty tiles too). Returns {tile: [element, ...]}.
+    """
+    span = {tile: [] for tiles in groups for tile in _span(tiles)}
+    for element in data.get("elements", []):
+        tags = element.get("tags", {})
+        if not tags.get("name"):
+            continue
+        # Ways and relations carry their coordinates in 'center'
+        point = element if "lat" in element else element.get("center")
+        if not point:
+            continue
+        tile = tile_of(point["lat"], point["lon"])
+        if tile in span:
+            span[tile].append(_record(tags["name"], point["lat"], point["lon"], tags))
+
+    for tile, elements in span.items():
+        _tile_cache.set(_tile_key(tile), elements, TILE_TTL)
+    return span
+
+def _fetch_tiles(groups):
+    """
+    Downloads and caches the given groups of tiles in one request. Returns
+    {tile: [element, ...]} or None if the request failed.
+    """
+    try:
+        response = transport.post(OVERPASS_URL, data=_tiles_query(groups))
+        response.raise_for_status()
+        return _store_tiles(groups, response.json())
+    except Exception as e:
+        print(f"Overpass Error: {e}")
+        metrics.AGENT_ERRORS.inc("places")
+        return None
+
+async def _fetch_tiles_async(groups):
+    try:
+        response = await transport.apost(OVERPASS_URL, data=_tiles_query(groups))
+        response.raise_for_status()
+        return _store_tiles(groups, response.json())
+    except Exception as e:
+        print(f"Overpass Error: {e}")
+        metrics.AGENT_ERRORS.inc("places")
+        return None
+
+def _index_records(index, lat, lon, radius):
+    return [_record(e["name"], e["lat"], e["lon"], e["tags"]) for e in index.query(lat, lon, radius)]
+
+def _cached_lookup(lat, lon, radius):
+    """
+    First step of a radius lookup. Returns (elements, None) when the offline
+    index covers the area, else (tile lookup, missing tiles) where the tile
+    lookup holds the cached tiles found so far.
+    """
+    index = get_index()
+    if index is not None and index.covers(lat, lon, radius):
+        metrics.LOOKUPS.inc("places", "index")
+        return _index_records(index, lat, lon, radius), None
+
+    tiles = tiles_covering(lat, lon, radius)
+    by_tile = {}
+    missing = []
+    for tile in tiles:
+        cached = _tile_cache.get(_tile_key(tile))
+        if cached is MISS:
+            missing.append(tile)
+        else:
+            by_tile[tile] = cached
+    metrics.LOOKUPS.inc("places", "upstream" if missing else "cache")
+    return (tiles, by_tile), missing
+
+def _within(lat, lon, radius, lookup, missing, fetched):
+    """
+    Merges fetched tiles into the lookup and returns the records within radius.
+    If the fetch failed, expired copies of the missing tiles stand in for them
+    and the returned PlaceList is marked stale (or error, for tiles with none).
+    """
+    tiles, by_tile = lookup
+    stale_tiles = 0
+    lost_tiles = 0
+    for tile in missing:
+        if fetched is not None:
+            by_tile[tile] = fetched.get(tile, [])
+            continue
+        stale = _tile_cache.get_stale(_tile_key(tile))
+        by_tile[tile] = [] if stale is MISS else stale
+        stale_tiles += stale is not MISS
+        lost_tiles += stale is MISS
+    if stale_tiles:
+        metrics.FALLBACKS.inc("places_stale")
+
+    records = PlaceList(
+        record
+        for tile in tiles
+        for record in by_tile[tile]
+        if haversine_m(lat, lon, record["lat"], record["lon"]) <= radius
+    )
+    records.stale = stale_tiles > 0
+    if lost_tiles:
+        records.error = f"Attractions unavailable for {lost_tiles} of {len(tiles)} tiles"
+    return records
+
+def _nearby_elements(lat, lon, radius=SEARCH_RADIUS):
+    """
+    Returns the attraction records within radius of a point.
+    Areas covered by the offline index are answered locally; elsewhere we use
+    cached tiles and fetch only the tiles we don't have.
+    """
+    lookup, missing = _cached_lookup(lat, lon, radius)
+    if missing is None:
+        return lookup
+    return _within(lat, lon, radius, lookup, missing, _fetch_tiles([missing]) if missing else None)
+
+async def _nearby_elements_async(lat, lon, radius=SEARCH_RADIUS):
+    lookup, missing = _cached_lookup(lat, lon, radius)
+    if missing is None:
+        return lookup
+    return _within(lat, lon, radius, lookup, missing, await _fetch_tiles_async([missing]) if missing else None)
+
+def _lookups(coords, radius):
+    """
+    Cached lookups for many points, plus the groups of tiles still missing.
+    """
+    lookups = [_cached_lookup(lat, lon, radius) for lat, lon in coords]
+    return lookups, [missing for _, missing in lookups if missing]
+
+def _within_all(coords, radius, lookups, fetched):
+    return [
+        lookup if missing is None else _within(lat, lon, radius, lookup, missing, fetched)
+        for (lat, lon), (lookup, missing) in zip(coords, lookups)
+    ]
+
+def tiles_to_refresh(lat, lon, within, radius=SEARCH_RADIUS):
+    """
+    Tiles around a point that are missing from the cache or expire within
+    `within` seconds. Empty where the offline index covers the area.
+    """
+    index = get_index()
+    if index is not None and index.covers(lat, lon, radius):
+        return []
+    horizon = time.time() + within
+    tiles = []
+    for tile in tiles_covering(lat, lon, radius):
+        entry = _tile_cache.peek(_tile_key(tile))
+        if entry is MISS or entry[1] <= horizon:
+            tiles.append(tile)
+    return tiles
+
+def refresh_tiles(tiles):
+    """
+    Re-fetches tiles in one Overpass query, replacing their cache entries.
+    Returns False if the request failed.
+    """
+    return _fetch_tiles([tiles]) is not None
+
+def rank_places(lat, lon, records, limit=TOP_PLACES, radius=SEARCH_RADIUS):
+    """
+    Orders attraction records by importance and closeness to (lat, lon) and
+    returns the best `limit` with distinct names.
+    """
+    # One pass over the records scores them all; then a single sort
+    penalty = DISTANCE_WEIGHT / radius
+    scores = [
+        CATEGORY_WEIGHTS.get(r["category"], 0.5)
+        + WIKIPEDIA_BONUS * r["wikipedia"]
+        + WIKIDATA_BONUS * r["wikidata"]
+        - penalty * haversine_m(lat, lon, r["lat"], r["lon"])
+        for r in records
+    ]
+
+    top = []
+    seen = set()
+    for i in sorted(range(len(records)), key=scores.__getitem__, reverse=True):
+        name = records[i]["name"]
+        if name not in seen:
+            seen.add(name)
+            top.append(records[i])
+            if len(top) == limit:
+                break
+    return top
+
+def _top_names(lat, lon, records):
+    top = rank_places(lat, lon, records)
+    # Too few Wikipedia-referenced attractions: the list leans on lesser-known ones
+    if sum(1 for r in top if r["wikipedia"]) < MIN_STRICT_RESULTS:
+        metrics.FALLBACKS.inc("places_broad")
+    names = PlaceList(r["name"] for r in top)
+    names.stale = getattr(records, "stale", False)
+    names.error = getattr(records, "error", None)
+    return names
+
+def cached_candidates(lat, lon, limit, radius=SEARCH_RADIUS):
+    """
+    The `limit` best-ranked attraction records near a point, from the offline
+    index or the cached tiles (expired ones too). Never fetches: itineraries
+    are planned from what get_places just looked up, even while Overpass is down.
+    """
+    index = get_index()
+    if index is not None and index.covers(lat, lon, radius):
+        return rank_places(lat, lon, _index_records(index, lat, lon, radius), limit, radius)
+
+    records = []
+    for tile in tiles_covering(lat, lon, radius):
+        entry = _tile_cache.peek(_tile_key(tile))
+        cached = entry[0] if entry is not MISS else _tile_cache.get_stale(_tile_key(tile))
+        if cached is not MISS:
+            records.extend(r for r in cached if haversine_m(lat, lon, r["lat"], r["lon"]) <= radius)
+    return rank_places(lat, lon, records, limit, radius)
 
 def get_places(lat, lon):
     """
     Fetches major tourist attractions near a given latitude and longitude using Overpass API.
     Uses 'nwr' (node, way, relation) to capture large places like parks and museums.
+    Returns a PlaceList, marked stale or error if Overpass failed.
     """
-    overpass_url = "https://overpass-api.de/api/interpreter"
-    
     # Strategy:
-    # 1. Try Strict Query (High Quality: has wikipedia tag)
-    # 2. If < 3 results, Try Broad Query (Any named tourism attraction)
-    
-    strict_query = f"""
-    [out:json][timeout:25];
-    (
-      nwr["tourism"~"attraction|museum|zoo|theme_park|aquarium|viewpoint"]["name"]["wikipedia"](around:5000, {lat}, {lon});
-      nwr["historic"~"castle|monument|memorial|ruins"]["name"]["wikipedia"](around:5000, {lat}, {lon});
-      nwr["leisure"="park"]["name"]["wikipedia"](around:5000, {lat}, {lon});
-    );
-    out center body; 
-    """
-    
-    broad_query = f"""
-    [out:json][timeout:25];
-    (
-      nwr["tourism"~"attraction|museum|zoo|theme_park|aquarium|viewpoint"]["name"](around:5000, {lat}, {lon});
-      nwr["historic"~"castle|monument|memorial|ruins"]["name"](around:5000, {lat}, {lon});
-      nwr["leisure"="park"]["name"](around:5000, {lat}, {lon});
-    );
-    out center body; 
-    """
-
-    def fetch_overpass(query):
-        try:
-            response = requests.post(overpass_url, data=query)
-            response.raise_for_status()
-            data = response.json()
-            items = []
-            seen = set()
-            for element in data.get("elements", []):
-                tags = element.get("tags", {})
-                name = tags.get("name")
-                if name and name not in seen:
-                    items.append(name)
-                    seen.add(name)
-            return items
-        except Exception as e:
-            print(f"Overpass Error: {e}")
-            return []
-
-    # 1. Strict
-    places = fetch_overpass(strict_query)
-    
-    # 2. Fallback if needed
-    if len(places) < 3:
-        # print("DEBUG: Not enough strict results, trying broad query...")
-        more_places = fetch_overpass(broad_query)
-        # Append unique new places
-        for p in more_places:
-            if p not in places:
-                places.append(p)
-                
-    return places[:5]
+    # 1. One broad query per uncached tile (any named attraction), kept as compact records
+    # 2. Rank by importance (Wikipedia/Wikidata references, category) and distance
+    return _top_names(lat, lon, _nearby_elements(lat, lon))
+
+async def get_places_async(lat, lon):
+    """
+    Async variant of get_places.
+    """
+    return _top_names(lat, lon, await _nearby_elements_async(lat, lon))
+
+def get_places_batch(coords, radius=SEARCH_RADIUS):
+    """
+    Top attractions for many (lat, lon) pairs. The tiles none of them has
+    cached come from a single Overpass query (a union of their bounding
+    boxes). Returns one PlaceList of names per coordinate, in order.
+    """
+    lookups, groups = _lookups(coords, radius)
+    fetched = _fetch_tiles(groups) if groups else None
+    return [_top_names(lat, lon, records) for (lat, lon), records in zip(coords, _within_all(coords, radius, lookups, fetched))]
+
+async def get_places_batch_async(coords, radius=SEARCH_RADIUS):
+    """
+    Async variant of get_places_batch.
+    """
+    lookups, groups = _lookups(coords, radius)
+    fetched = await _fetch_tiles_async(groups) if groups else None
+    return [_top_names(lat, lon, records) for (lat, lon), records in zip(coords, _within_all(coords, radius, lookups, fetched))]
@@ -0,0 +1,228 @@
+import re
+
+from utils import gazetteer
+
+# Intent keywords, matched as substrings of the lowercased query
+WEATHER_KEYWORDS = ("weather", "temperature", "rain", "forecast", "hot", "cold")
+PLACES_KEYWORDS = ("place", "visit", "attraction", "sight", "see", "plan")
+
+# Words that end a captured location ("going to Rome please help" -> "Rome")
+STOP_WORDS = frozenset(['help', 'plan', 'let', 'the', 'my', 'this', 'trip', 'me', 'please', 'is', 'a', 'an', 'give', 'tell', 'show', 'or', 'vs', 'versus'])
+
+# Most locations compared in one query ("Rome or Paris", "Kochi, Munnar and Alappuzha")
+MAX_LOCATIONS = 5
+
+# Words that end a further location in a list ("Rome or Paris for 3 days" -> "Paris")
+LIST_STOP_WORDS = STOP_WORDS | frozenset(['and', 'for', 'in', 'on', 'at', 'with', 'what', 'which', 'can', 'could', 'would', 'should', 'next', 'today', 'tomorrow', 'weekend', 'then', 'need', 'also'])
+
+# Filler removed from short queries that are assumed to be just a place name
+JUNK_WORDS = ("i'm", "i", "am", "travel", "to", "city", "place", "location")
+
+def trie_regex(words):
+    """
+    Builds a regex alternation shaped like a trie of the given words, so the
+    regex engine tests each shared prefix once instead of once per word.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def emit(node):
+        terminal = "" in node
+        branches = [re.escape(char) + emit(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if terminal:
+            body = "(?:" + body + ")?"
+        return body
+
+    return emit(trie)
+
+_SENTENCE_BREAK = re.compile(r'[.!?]+\s+')
+_DAYS = re.compile(r"(\d+)\s*days?", re.IGNORECASE)
+
+# Matches: "going to X", "visit X", "trip to X", "traveling to X"
+# Stops at: punctuation, end of string, or keywords (help, plan, etc.)
+_LOCATION_PATTERNS = [
+    re.compile(r"(?:going|go|visit\w*|travel\w*|trip)\s+(?:to\s+)?([a-zA-Z\s]+?)(?:\s+(?:let|help|plan|what|and|please|can|could|would|me|give|tell|show)|[\.,!\?]|$)", re.IGNORECASE),
+    re.compile(r"(?:in|at)\s+([a-zA-Z\s]+?)(?:\s+(?:let|help|plan|what|and|please|can|could|would|me|give|tell|show)|[\.,!\?]|$)", re.IGNORECASE)
+]
+
+# Trie-shaped alternations: one C-level scan per intent finds any of its keywords
+_WEATHER_INTENT = re.compile(trie_regex(WEATHER_KEYWORDS))
+_PLACES_INTENT = re.compile(trie_regex(PLACES_KEYWORDS))
+
+_JUNK = re.compile(r"\b(?:" + trie_regex(JUNK_WORDS) + r")\b")
+
+# Comparisons without a travel verb: "compare Rome and Paris", "Rome or Paris?"
+_COMPARE = re.compile(r"\bcompare\s+([a-zA-Z][a-zA-Z\s]*?)(?=\s*,|\s+(?:and|or|vs\.?|versus)\s)", re.IGNORECASE)
+# Skips an opening interjection: "Hmm, Rome or Paris?"
+_LIST_START = re.compile(r"^\s*(?:(?:hmm+|um+|uh+|ok(?:ay)?|so|well|hi|hey|hello)\b[\s,]*)?([a-zA-Z][a-zA-Z\s]*?)(?=\s*,|\s+(?:or|vs\.?|versus)\s)", re.IGNORECASE)
+_LIST_SEPARATOR = re.compile(r"\s*,\s*(?:(?:and|or)\s+)?|\s+(?:and|or|vs\.?|versus)\s+", re.IGNORECASE)
+_WORD = re.compile(r"[a-zA-Z]+")
+_INTENT_WORDS = WEATHER_KEYWORDS + PLACES_KEYWORDS
+
+def _list_item(text, pos):
+    """
+    Reads the words of a further list entry starting at pos, up to
+    punctuation or a stop word. Returns (words, end position).
+    """
+    words = []
+    end = pos
+    for match in _WORD.finditer(text, pos):
+        if text[end:match.start()].strip() or match.group().lower() in LIST_STOP_WORDS:
+            break
+        words.append(match.group())
+        end = match.end()
+    return words, end
+
+def _looks_like_place(words):
+    """
+    Whether a further list entry names a place: capitalised as typed, or
+    known to the gazetteer ("compare rome and paris"). Keeps "and eat pasta"
+    or "and packing list" out of comparisons.
+    """
+    return words[0][0].isupper() or gazetteer.lookup(" ".join(words)) is not None
+
+def _more_locations(text, pos, comma_list=False):
+    """
+    Further locations listed after the one ending at pos
+    (", Munnar and Alappuzha", " or Paris").
+
+    Commas alone don't make a list: "Paris, France" and "Kochi, Kerala" name
+    one place, so entries count only if a conjunction (and/or/vs) joins some
+    of them, or with comma_list ("compare Rome, Paris").
+    """
+    locations = []
+    conjunction = comma_list
+    while len(locations) < MAX_LOCATIONS - 1:
+        separator = _LIST_SEPARATOR.match(text, pos)
+        if not separator:
+            break
+        words, end = _list_item(text, separator.end())
+        # "weather in Kyoto and places to see": the list ended at "Kyoto"
+        if not words or len(words) > 3 or any(w.lower().startswith(_INTENT_WORDS) for w in words):
+            break
+        if not _looks_like_place(words):
+            break
+        conjunction = conjunction or separator.group().strip(", \t") != ""
+        locations.append(' '.join(words).title())
+        pos = end
+    return locations if conjunction else []
+
+def _patterns(lowered):
+    """
+    The extraction patterns worth trying on a lowercased query, and whether
+    it may name several places (lists need a conjunction or "compare").
+    Plain substring checks, far cheaper than running the list patterns, so
+    single-place queries skip list parsing entirely.
+    """
+    choice = " or " in lowered or " vs" in lowered or " versus " in lowered
+    compare = "compare" in lowered
+    listed = choice or compare or " and " in lowered
+    patterns = _LOCATION_PATTERNS
+    if compare:
+        patterns = patterns + [_COMPARE]
+    # A list without a travel verb must offer a choice or join commas with "and"
+    if choice or (listed and "," in lowered):
+        patterns = patterns + [_LIST_START]
+    return patterns, listed
+
+def extract_locations(text):
+    """
+    Extracts every location named in a query, in order: one for most
+    queries, several for comparisons. Returns [] if none is found.
+    """
+    # Clean punctuation at sentence boundaries
+    text = _SENTENCE_BREAK.sub(' ', text)
+    patterns, listed = _patterns(text.lower())
+
+    for pattern in patterns:
+        match = pattern.search(text)
+        if match:
+            # Secondary cleanup: drop any trailing stop words that slipped into the capture group
+            captured = match.group(1).split()
+            cleaned = []
+            for word in captured:
+                if word.lower() in STOP_WORDS:
+                    break
+                cleaned.append(word)
+
+            if cleaned and not listed:
+                return [' '.join(cleaned).strip().title()]
+            if cleaned:
+                # Continue after the kept words to pick up a list
+                if len(cleaned) == len(captured):
+                    end = match.start(1) + len(match.group(1).rstrip())
+                else:
+                    words = _WORD.finditer(text, match.start(1))
+                    end = [next(words) for _ in cleaned][-1].end()
+                more = _more_locations(text, end, pattern is _COMPARE)
+                # Without a travel verb a leading phrase is a place only if a list follows
+                # ("Rome or Paris?", not "What is the weather in Kyoto, ...")
+                if more or pattern is not _LIST_START:
+                    return [' '.join(cleaned).strip().title()] + more
+
+    # Fallback for simple "Bangalore" type queries
+    # If short query and not matched yet, assume it's the location (minus filler words)
+    if len(text.split()) <= 3:
+        location = _JUNK.sub('', text.lower()).strip().title()
+        return [location] if location else []
+
+    return []
+
+def extract_location(text):
+    """
+    Extracts location from query using robust regex patterns and cleaning.
+    """
+    locations = extract_locations(text)
+    return locations[0] if locations else None
+
+def detect_intents(query_lower):
+    """
+    Returns (show_weather, show_places) for a lowercased query.
+    """
+    return _WEATHER_INTENT.search(query_lower) is not None, _PLACES_INTENT.search(query_lower) is not None
+
+def parse_query(query):
+    """
+    Reads locations, intents and trip length out of a chat message.
+    Returns {location, locations, show_weather, show_places, num_days} or
+    {"error": ...}; location is the first of locations.
+    """
+    show_weather, show_places = detect_intents(query.lower())
+    if not show_weather and not show_places:
+        show_places = True
+
+    # Duration Parsing
+    num_days = 1
+    day_match = _DAYS.search(query)
+    if day_match:
+        num_days = int(day_match.group(1))
+
+    locations = extract_locations(query)
+    if not locations:
+        # Last ditch attempt: use raw query if short enough (likely just a city name)
+        if len(query.split()) <= 3:
+            locations = [query]
+        else:
+            return {"error": "I couldn't identify the location."}
+
+    # The same place named twice ("Paris or paris") is not a comparison
+    if len(locations) > 1:
+        unique = {}
+        for location in locations:
+            unique.setdefault(" ".join(location.split()).casefold(), location)
+        locations = list(unique.values())
+
+    return {
+        "location": locations[0],
+        "locations": locations,
+        "show_weather": show_weather,
+        "show_places": show_places,
+        "num_days": num_days
+    }
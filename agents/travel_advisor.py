@@ -1,3 +1,5 @@
+from utils.advisor_kb import get_knowledge_base
+
 
 def get_packing_suggestion(weather_data):
     """
@@ -5,7 +7,8 @@ def get_packing_suggestion(weather_data):
     """
     items = []
     
-    if not weather_data or isinstance(weather_data, str):
+    # No forecast (or the weather agent failed): generic advice
+    if not weather_data or isinstance(weather_data, str) or "error" in weather_data:
         return ["Check forecast before packing", "Comfortable walking shoes"]
     
     try:
@@ -44,93 +47,23 @@ def get_packing_suggestion(weather_data):
 
 def get_budget_estimate(city_name, full_name=""):
     """
-    Returns a budget dictionary based on city tier and region (India vs Int'l).
+    Returns a budget dictionary based on city tier and region, or an empty
+    one for regions without price data.
     """
-    # Detect Region based on full name or city
-    full_lower = (city_name + " " + full_name).lower()
-    
-    # Regions
-    europe = ["italy", "france", "spain", "germany", "uk", "london", "paris", "rome", "europe"]
-    us = ["usa", "united states", "new york", "california", "america"]
-    
-    if any(x in full_lower for x in europe):
-        return {
-            "Budget": "€50-70 ($55-77)",
-            "Mid-range": "€100-150 ($110-165)",
-            "Luxury": "€250+ ($275+)"
-        }
-    elif any(x in full_lower for x in us):
-        return {
-            "Budget": "$80-100",
-            "Mid-range": "$150-250",
-            "Luxury": "$400+"
-        }
-    
-    # Default to India logic (refined)
-    expensive_india = ["bangalore", "mumbai", "delhi", "goa"]
-    if any(x in full_lower for x in expensive_india):
-        return {
-            "Budget": "₹2000-3000 ($24-36)",
-            "Mid-range": "₹4000-6000 ($48-72)",
-            "Luxury": "₹10000+ ($120+)"
-        }
-    else:
-        # Tier 2 India
-        return {
-            "Budget": "₹1000-2000 ($12-24)",
-            "Mid-range": "₹2500-4000 ($30-48)",
-            "Luxury": "₹7000+ ($84+)"
-        }
+    # Regions and their price tiers come from the advisor knowledge base
+    return get_knowledge_base().budget_for(city_name, full_name)
 
 def get_travel_tips(city_name):
     """
     Returns specific travel tips for supported cities or generic ones.
     """
-    tips = {
-        "kochi": [
-            "Best time: Nov-Feb (cooler)",
-            "Try 'Sadya' on banana leaf",
-            "Ferry is the best transport"
-        ],
-        "bangalore": [
-            "Uber/Ola is better than auto-Rickshaws",
-            "Traffic is heavy - use Metro",
-            "Visit breweries in Indiranagar"
-        ],
-        "rome": [
-            "Buy a 'Roma Pass' for transport & museums",
-            "Don't order cappuccino after 11 AM (local custom)",
-            "Watch for pickpockets at Trevi Fountain"
-        ],
-        "paris": [
-            "Learn basic French greetings (Bonjour/Merci)",
-            "Metro is the fastest way around",
-            "Dinner starts late (8 PM+)"
-        ],
-        "new york": [
-            "Get a MetroCard for subways",
-            "Pizza slices are the best cheap eat",
-            "Walk across Brooklyn Bridge"
-        ]
-    }
-    
-    city_lower = city_name.lower()
-    for key, val in tips.items():
-        if key in city_lower:
-            return val
-            
-    return [
-        "Check local transport apps",
-        "Keep cash for small purchases",
-        "Download offline maps",
-        "Try local street food"
-    ]
+    return get_knowledge_base().tips_for(city_name)
 
 def get_activity_advice(weather_data):
     """
     Returns advice based on weather conditions.
     """
-    if not weather_data or isinstance(weather_data, str):
+    if not weather_data or isinstance(weather_data, str) or "error" in weather_data:
         return "Check local forecast to plan your day."
     
     try:
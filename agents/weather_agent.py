@@ -1,5 +1,13 @@
 import requests
-from datetime import datetime
+import time
+from utils import metrics, transport
+from utils.cache import LRUCache, MISS
+from datetime import datetime, timedelta, timezone
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:  # Python < 3.9
+    ZoneInfo = None
 
 WEATHER_CODES = {
     0: "Clear sky",
@@ -14,55 +22,260 @@ WEATHER_CODES = {
     95: "Thunderstorm", 96: "Thunderstorm with slight hail", 99: "Thunderstorm with heavy hail"
 }
 
-def get_weather(lat, lon):
+FORECAST_URL = "https://api.open-meteo.com/v1/forecast"
+
+# Coordinates per grouped Open-Meteo request (keeps the URL a sane length)
+WEATHER_BATCH_SIZE = 50
+
+HOURLY_VARIABLES = "temperature_2m,weathercode,precipitation_probability"
+
+# Open-Meteo's forecast models are refreshed every few hours. A cached series
+# is kept until the next update slot (plus a lag for the new run to publish).
+MODEL_UPDATE_HOURS = 3
+MODEL_PUBLISH_LAG = 15 * 60  # seconds
+
+# A series covers a week, so an expired one can still answer for the current
+# hour; it is kept this long and used while Open-Meteo is unavailable
+STALE_TTL = 24 * 3600
+
+# Whole hourly series per ~1 km cell, bounded by entry count
+_forecast_cache = LRUCache(max_entries=2048, stale_ttl=STALE_TTL)
+
+def _forecast_key(lat, lon):
+    return f"{round(lat, 2)}:{round(lon, 2)}"
+
+def _next_model_update(now=None):
+    now = now or time.time()
+    slot = MODEL_UPDATE_HOURS * 3600
+    return (now // slot + 1) * slot + MODEL_PUBLISH_LAG
+
+def _compact_forecast(data):
     """
-    Fetches the current weather and precipitation chance using Open-Meteo API.
+    Keeps the parts of an Open-Meteo payload needed to answer for any hour.
     """
-    url = "https://api.open-meteo.com/v1/forecast"
-    params = {
-        "latitude": lat,
-        "longitude": lon,
-        "current_weather": "true",
-        "hourly": "precipitation_probability", # Needed for chance of rain
-        "timezone": "auto"
+    hourly = data.get("hourly", {})
+    return {
+        "timezone": data.get("timezone"),
+        "utc_offset_seconds": data.get("utc_offset_seconds", 0),
+        "time": hourly.get("time", []),
+        "temperature": hourly.get("temperature_2m", []),
+        "weathercode": hourly.get("weathercode", []),
+        "precipitation_probability": hourly.get("precipitation_probability", [])
     }
-    
-    try:
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        data = response.json()
-        
-        # 1. Current Weather
-        cw = data.get("current_weather", {})
-        temp = cw.get("temperature", "N/A")
-        code = cw.get("weathercode", 0)
-        desc = WEATHER_CODES.get(code, "Unknown weather")
-        
-        # 2. Precipitation Probability
-        # Open-Meteo returns hourly data list. We need to find the current hour's index.
-        # Simple approximation: take the first hour (current time) or 0 index
-        rain_chance = 0
-        if "hourly" in data and "precipitation_probability" in data["hourly"]:
-            # 'time' list in hourly corresponds to 'precipitation_probability' list
-            # We'll just grab the current probability (index 0 is usually the start of the requested time or 'now')
-            # For more precision we could parse timestamps, but 0 index is 'current hour' in standard request
-            current_hour_index = datetime.now().hour 
-            # Note: The API returns 24h forecast for today starting at 00:00. 
-            # If request is made at 8 PM, index 20 is the current hour.
-            # However, safer to just assume the current 'current_weather' matches the 'now' time.
-            # Let's find index by matching current hour.
-            
-            # Simple fallback: use the first value if parsing fails
-            try:
-                rain_chance = data["hourly"]["precipitation_probability"][datetime.now().hour]
-            except:
-                rain_chance = data["hourly"]["precipitation_probability"][0]
-
-        return {
-            "temperature": temp,
-            "description": desc,
-            "rain_chance": rain_chance
+
+def _local_now(forecast):
+    """
+    Current wall-clock time at the forecast location, from the response's timezone.
+    """
+    tz = None
+    if ZoneInfo and forecast.get("timezone"):
+        try:
+            tz = ZoneInfo(forecast["timezone"])
+        except Exception:
+            tz = None
+    if tz is None:
+        tz = timezone(timedelta(seconds=forecast.get("utc_offset_seconds") or 0))
+    return datetime.now(tz).replace(tzinfo=None)
+
+def _hour_index(forecast):
+    """
+    Index of the location's current hour in the hourly series, or None if the
+    series doesn't cover it.
+    """
+    times = forecast["time"]
+    if not times:
+        return None
+    start = datetime.fromisoformat(times[0])
+    index = int((_local_now(forecast) - start).total_seconds() // 3600)
+    return index if 0 <= index < len(times) else None
+
+def _summarize(forecast):
+    """
+    Reads {temperature, description, rain_chance} for the current hour out of a
+    cached forecast. Returns None if the series doesn't cover the current hour.
+    """
+    index = _hour_index(forecast)
+    if index is None:
+        return None
+
+    def at(series, default):
+        values = forecast[series]
+        value = values[index] if index < len(values) else None
+        return default if value is None else value
+
+    return {
+        "temperature": at("temperature", "N/A"),
+        "description": WEATHER_CODES.get(at("weathercode", 0), "Unknown weather"),
+        "rain_chance": at("precipitation_probability", 0)
+    }
+
+def daily_rain_chance(forecast, days, start_hour=9, end_hour=18):
+    """
+    Highest daytime precipitation probability for each of the next `days`
+    local days, today first. Returns [(date, chance or None), ...].
+    """
+    today = _local_now(forecast).date()
+    dates = [(today + timedelta(days=i)).isoformat() for i in range(days)]
+    highest = dict.fromkeys(dates)
+    for stamp, chance in zip(forecast["time"], forecast["precipitation_probability"]):
+        date = stamp[:10]
+        if date in highest and chance is not None and start_hour <= int(stamp[11:13]) < end_hour:
+            highest[date] = max(highest[date] or 0, chance)
+    return [(date, highest[date]) for date in dates]
+
+def _forecast_chunks(coords):
+    """
+    Splits coordinates into groups of WEATHER_BATCH_SIZE and yields
+    (chunk, request params) for Open-Meteo's comma-separated multi-location form.
+    """
+    for i in range(0, len(coords), WEATHER_BATCH_SIZE):
+        chunk = coords[i:i + WEATHER_BATCH_SIZE]
+        yield chunk, {
+            "latitude": ",".join(str(lat) for lat, _ in chunk),
+            "longitude": ",".join(str(lon) for _, lon in chunk),
+            "hourly": HOURLY_VARIABLES,
+            "timezone": "auto"
         }
-            
-    except requests.RequestException as e:
-        return {"error": f"Failed to fetch weather: {e}"}
+
+def _store_forecasts(chunk, data):
+    """
+    Caches the forecasts of one grouped response and returns them in order.
+    """
+    # A single location comes back as an object, several as a list
+    payloads = data if isinstance(data, list) else [data]
+    expires_at = _next_model_update()
+    forecasts = []
+    for (lat, lon), payload in zip(chunk, payloads):
+        forecast = _compact_forecast(payload)
+        _forecast_cache.set(_forecast_key(lat, lon), forecast, expires_at)
+        forecasts.append(forecast)
+    return forecasts
+
+def _fetch_forecasts(coords):
+    """
+    Downloads and caches hourly forecasts for (lat, lon) pairs. Returns one
+    forecast (or an error dict) per coordinate.
+    """
+    results = []
+    for chunk, params in _forecast_chunks(coords):
+        try:
+            response = transport.get(FORECAST_URL, params=params)
+            response.raise_for_status()
+            results.extend(_store_forecasts(chunk, response.json()))
+        except requests.RequestException as e:
+            metrics.AGENT_ERRORS.inc("weather", amount=len(chunk))
+            results.extend({"error": f"Failed to fetch weather: {e}"} for _ in chunk)
+    return results
+
+async def _fetch_forecasts_async(coords):
+    results = []
+    for chunk, params in _forecast_chunks(coords):
+        try:
+            response = await transport.aget(FORECAST_URL, params=params)
+            response.raise_for_status()
+            results.extend(_store_forecasts(chunk, response.json()))
+        except requests.RequestException as e:
+            metrics.AGENT_ERRORS.inc("weather", amount=len(chunk))
+            results.extend({"error": f"Failed to fetch weather: {e}"} for _ in chunk)
+    return results
+
+def get_forecast(lat, lon):
+    """
+    Returns the cached hourly forecast for a location, fetching it if needed.
+    """
+    forecast = _forecast_cache.get(_forecast_key(lat, lon))
+    if forecast is MISS:
+        forecast = _fetch_forecasts([(lat, lon)])[0]
+    return forecast
+
+def cached_forecast(lat, lon):
+    """
+    Returns the cached hourly forecast for a location, or None. Never fetches.
+    """
+    forecast = _forecast_cache.get(_forecast_key(lat, lon))
+    return None if forecast is MISS else forecast
+
+def forecast_expires_at(lat, lon):
+    """
+    When the cached forecast for a location expires, or None if there isn't one.
+    """
+    entry = _forecast_cache.peek(_forecast_key(lat, lon))
+    return None if entry is MISS else entry[1]
+
+def refresh_forecasts(coords):
+    """
+    Re-fetches the forecasts for (lat, lon) pairs in grouped requests,
+    replacing their cache entries. Returns one forecast (or error dict) each.
+    """
+    return _fetch_forecasts(coords)
+
+def get_weather(lat, lon):
+    """
+    Fetches the current weather and precipitation chance using Open-Meteo API.
+    Answered from the cached hourly series when we have one for this area.
+    """
+    return get_weather_batch([(lat, lon)])[0]
+
+def _cached_weather(coords):
+    """
+    Answers what it can from the forecast cache. Returns (results, indexes of
+    coordinates that need fetching).
+    """
+    results = [None] * len(coords)
+    missing = []
+    for i, (lat, lon) in enumerate(coords):
+        forecast = _forecast_cache.get(_forecast_key(lat, lon))
+        summary = _summarize(forecast) if forecast is not MISS else None
+        if summary is None:
+            missing.append(i)
+        else:
+            results[i] = summary
+    metrics.LOOKUPS.inc("weather", "cache", amount=len(coords) - len(missing))
+    metrics.LOOKUPS.inc("weather", "upstream", amount=len(missing))
+    return results, missing
+
+def _stale_weather(lat, lon):
+    """
+    Current-hour weather from an expired forecast, marked stale, or None.
+    """
+    forecast = _forecast_cache.get_stale(_forecast_key(lat, lon))
+    summary = _summarize(forecast) if forecast is not MISS else None
+    if summary is None:
+        return None
+    metrics.FALLBACKS.inc("weather_stale")
+    return dict(summary, stale=True)
+
+def _fill_weather(coords, results, missing, fetched):
+    for i, forecast in zip(missing, fetched):
+        if "error" in forecast:
+            # The advisor falls back to generic advice for errors we can't cover
+            results[i] = _stale_weather(*coords[i]) or forecast
+        else:
+            results[i] = _summarize(forecast) or {"error": "Forecast does not cover the current hour"}
+    return results
+
+def get_weather_batch(coords):
+    """
+    Fetches weather for many (lat, lon) pairs. Cached areas are answered
+    locally; the rest use Open-Meteo's comma-separated multi-location form.
+    Returns one weather dict per input coordinate, in order.
+    """
+    results, missing = _cached_weather(coords)
+    if missing:
+        _fill_weather(coords, results, missing, _fetch_forecasts([coords[i] for i in missing]))
+    return results
+
+async def get_weather_batch_async(coords):
+    """
+    Async variant of get_weather_batch.
+    """
+    results, missing = _cached_weather(coords)
+    if missing:
+        _fill_weather(coords, results, missing, await _fetch_forecasts_async([coords[i] for i in missing]))
+    return results
+
+async def get_weather_async(lat, lon):
+    """
+    Async variant of get_weather.
+    """
+    return (await get_weather_batch_async([(lat, lon)]))[0]
@@ -0,0 +1,192 @@
+import asyncio
+import json
+import sys
+import os
+from urllib.parse import parse_qs
+
+# Add the parent directory to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agents.orchestrator import TourismAgent
+from api.index import MAX_BATCH_SIZE
+from utils import circuit, metrics, ratelimit, transport
+
+# Async serving path: a plain ASGI app whose chat handler awaits the async
+# agent variants, so one process can hold many in-flight chats. The stream and
+# batch routes step through the agent's (sync) iterators on worker threads.
+# Run with e.g.
+#   uvicorn api.asgi:app --port 8000
+# api/index.py (Flask, sync) remains the entry point used on Vercel.
+
+agent = TourismAgent()
+
+async def _read_json(receive):
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            break
+    try:
+        return json.loads(body or b"null")
+    except ValueError:
+        return None
+
+async def _iterate(iterator):
+    """
+    Steps through a blocking iterator on worker threads, one item at a time,
+    so the event loop keeps serving other requests in between.
+    """
+    done = object()
+    try:
+        while True:
+            item = await asyncio.to_thread(next, iterator, done)
+            if item is done:
+                return
+            yield item
+    finally:
+        try:
+            iterator.close()
+        except ValueError:
+            # Cancelled mid-step: the generator is still running on its thread
+            pass
+
+async def _start_stream(send, content_type, headers=()):
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [(b"content-type", content_type), *headers],
+    })
+
+async def _send_chunk(send, text):
+    await send({"type": "http.response.body", "body": text.encode("utf-8"), "more_body": True})
+
+async def _end_stream(send):
+    await send({"type": "http.response.body", "body": b""})
+
+async def _send_json(send, payload, status=200):
+    body = json.dumps(payload).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+async def chat(scope, receive, send):
+    data = await _read_json(receive)
+    if not isinstance(data, dict) or 'message' not in data:
+        return await _send_json(send, {"error": "No message provided"}, 400)
+
+    user_message = data['message']
+    try:
+        if not user_message:
+            return await _send_json(send, {"error": "Empty message"}, 400)
+
+        result = await agent.process_request_async(user_message)
+        await _send_json(send, result)
+    except Exception as e:
+        print(f"Error processing request: {e}")
+        await _send_json(send, {"error": "Internal server error", "details": str(e)}, 500)
+
+async def chat_stream(scope, receive, send):
+    """
+    Same input as /api/chat, answered as Server-Sent Events (see api/index.py).
+    """
+    data = await _read_json(receive)
+    if not isinstance(data, dict) or 'message' not in data:
+        return await _send_json(send, {"error": "No message provided"}, 400)
+
+    user_message = data['message']
+    if not user_message:
+        return await _send_json(send, {"error": "Empty message"}, 400)
+
+    await _start_stream(send, b"text/event-stream", [(b"cache-control", b"no-cache"), (b"x-accel-buffering", b"no")])
+    try:
+        async for event, payload in _iterate(agent.iter_request(user_message)):
+            await _send_chunk(send, f"event: {event}\ndata: {json.dumps(payload)}\n\n")
+    except Exception as e:
+        print(f"Error processing request: {e}")
+        await _send_chunk(send, f"event: error\ndata: {json.dumps({'error': 'Internal server error', 'details': str(e)})}\n\n")
+    await _end_stream(send)
+
+async def chat_batch(scope, receive, send):
+    """
+    Plans many messages in one call: {"messages": [...]}. Returns
+    {"results": [...]}, or NDJSON with ?stream=1 (see api/index.py).
+    """
+    data = await _read_json(receive)
+    messages = data.get('messages') if isinstance(data, dict) else None
+    if not isinstance(messages, list) or not all(isinstance(m, str) for m in messages):
+        return await _send_json(send, {"error": "Expected a list of messages"}, 400)
+    if len(messages) > MAX_BATCH_SIZE:
+        return await _send_json(send, {"error": f"At most {MAX_BATCH_SIZE} messages per batch"}, 400)
+
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    accept = dict(scope.get("headers", [])).get(b"accept", b"").decode("latin-1")
+    if query.get('stream') != ['1'] and 'application/x-ndjson' not in accept:
+        try:
+            return await _send_json(send, {"results": await asyncio.to_thread(agent.process_batch, messages)})
+        except Exception as e:
+            print(f"Error processing batch: {e}")
+            return await _send_json(send, {"error": "Internal server error", "details": str(e)}, 500)
+
+    await _start_stream(send, b"application/x-ndjson")
+    # Planning happens while streaming, so failures end the stream with an error line
+    index = 0
+    try:
+        async for result in _iterate(agent.iter_batch(messages)):
+            await _send_chunk(send, json.dumps({"index": index, **result}) + "\n")
+            index += 1
+    except Exception as e:
+        print(f"Error processing batch: {e}")
+        await _send_chunk(send, json.dumps({"index": index, "error": "Internal server error", "details": str(e)}) + "\n")
+    await _end_stream(send)
+
+async def health(scope, receive, send):
+    await _send_json(send, {"status": "ok"})
+
+async def metrics_endpoint(scope, receive, send):
+    body = metrics.render().encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [(b"content-type", metrics.CONTENT_TYPE.encode()), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+async def upstreams(scope, receive, send):
+    await _send_json(send, {
+        "breakers": circuit.breaker_stats(),
+        "rate_limits": ratelimit.governor_stats(),
+        "transport": transport.transport_stats(),
+    })
+
+ROUTES = {
+    ('POST', '/api/chat'): chat,
+    ('POST', '/api/chat/stream'): chat_stream,
+    ('POST', '/api/chat/batch'): chat_batch,
+    ('GET', '/api/health'): health,
+    ('GET', '/api/metrics'): metrics_endpoint,
+    ('GET', '/api/upstreams'): upstreams,
+}
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await transport.aclose()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    if scope["type"] != "http":
+        return
+
+    handler = ROUTES.get((scope["method"], scope["path"].rstrip("/") or "/"))
+    if handler is None:
+        allowed = any(path == scope["path"] for _, path in ROUTES)
+        return await _send_json(send, {"error": "Method not allowed" if allowed else "Not found"}, 405 if allowed else 404)
+    await handler(scope, receive, send)
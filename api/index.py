@@ -1,34 +1,174 @@
-from flask import Flask, request, jsonify
+"""
+Flask entry point. Cold starts are kept short: Flask, the agents and their
+dependencies (requests, caches, gazetteer) are imported on the first request
+that needs them, and health checks are answered without importing any of it.
+"""
+import json
 import sys
 import os
+import threading
 
 # Add the parent directory to sys.path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from agents.orchestrator import TourismAgent
+# Largest number of messages accepted by /api/chat/batch
+MAX_BATCH_SIZE = 500
 
-app = Flask(__name__)
-agent = TourismAgent()
+HEALTH_BODY = json.dumps({"status": "ok"}).encode("utf-8")
 
-@app.route('/api/chat', methods=['POST'])
-def chat():
-    data = request.json
-    if not data or 'message' not in data:
-        return jsonify({"error": "No message provided"}), 400
-    
-    user_message = data['message']
-    try:
+# Created on first use by get_agent() (may also be replaced, e.g. by benchmarks)
+agent = None
+_flask_app = None
+_lock = threading.Lock()
+
+def get_agent():
+    global agent
+    if agent is None:
+        with _lock:
+            if agent is None:
+                from agents.orchestrator import TourismAgent
+                agent = TourismAgent()
+    return agent
+
+def create_app():
+    """
+    Builds the Flask app with every /api route.
+    """
+    from flask import Flask, Response, request, jsonify, stream_with_context
+    from utils import metrics
+
+    app = Flask(__name__)
+
+    @app.route('/api/chat', methods=['POST'])
+    def chat():
+        data = request.json
+        if not data or 'message' not in data:
+            return jsonify({"error": "No message provided"}), 400
+        
+        user_message = data['message']
+        try:
+            if not user_message:
+                 return jsonify({"error": "Empty message"}), 400
+                 
+            result = get_agent().process_request(user_message)
+            return jsonify(result)
+        except Exception as e:
+            print(f"Error processing request: {e}")
+            return jsonify({"error": "Internal server error", "details": str(e)}), 500
+
+    @app.route('/api/chat/stream', methods=['POST'])
+    def chat_stream():
+        """
+        Same input as /api/chat, answered as Server-Sent Events: one event per
+        stage (location, tips, weather, places, advice, done) as soon as it is ready.
+        Comparisons of several places arrive as a single comparison event.
+        """
+        data = request.json
+        if not data or 'message' not in data:
+            return jsonify({"error": "No message provided"}), 400
+        
+        user_message = data['message']
         if not user_message:
-             return jsonify({"error": "Empty message"}), 400
-             
-        result = agent.process_request(user_message)
-        return jsonify(result)
-    except Exception as e:
-        print(f"Error processing request: {e}")
-        return jsonify({"error": "Internal server error", "details": str(e)}), 500
-
-@app.route('/api/health', methods=['GET'])
-def health():
-    return jsonify({"status": "ok"})
+            return jsonify({"error": "Empty message"}), 400
+
+        def generate():
+            try:
+                for event, payload in get_agent().iter_request(user_message):
+                    yield f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+            except Exception as e:
+                print(f"Error processing request: {e}")
+                yield f"event: error\ndata: {json.dumps({'error': 'Internal server error', 'details': str(e)})}\n\n"
+
+        headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        return Response(stream_with_context(generate()), mimetype='text/event-stream', headers=headers)
+
+    @app.route('/api/chat/batch', methods=['POST'])
+    def chat_batch():
+        """
+        Plans many messages in one call: {"messages": [...]}.
+        Returns {"results": [...]} in input order, or one JSON object per line
+        (NDJSON) when called with ?stream=1 or Accept: application/x-ndjson.
+        """
+        data = request.json
+        messages = data.get('messages') if isinstance(data, dict) else None
+        if not isinstance(messages, list) or not all(isinstance(m, str) for m in messages):
+            return jsonify({"error": "Expected a list of messages"}), 400
+        if len(messages) > MAX_BATCH_SIZE:
+            return jsonify({"error": f"At most {MAX_BATCH_SIZE} messages per batch"}), 400
+
+        stream = request.args.get('stream') == '1' or 'application/x-ndjson' in request.headers.get('Accept', '')
+        if stream:
+            def generate():
+                # Planning happens while streaming, so failures end the stream with an error line
+                index = 0
+                try:
+                    for result in get_agent().iter_batch(messages):
+                        yield json.dumps({"index": index, **result}) + "\n"
+                        index += 1
+                except Exception as e:
+                    print(f"Error processing batch: {e}")
+                    yield json.dumps({"index": index, "error": "Internal server error", "details": str(e)}) + "\n"
+            return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+        try:
+            return jsonify({"results": get_agent().process_batch(messages)})
+        except Exception as e:
+            print(f"Error processing batch: {e}")
+            return jsonify({"error": "Internal server error", "details": str(e)}), 500
+
+    @app.route('/api/health', methods=['GET'])
+    def health():
+        return jsonify({"status": "ok"})
+
+    @app.route('/api/metrics', methods=['GET'])
+    def metrics_endpoint():
+        """
+        Stage and upstream latency histograms plus error/fallback counters, in the
+        Prometheus text exposition format.
+        """
+        return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+    @app.route('/api/upstreams', methods=['GET'])
+    def upstreams():
+        """
+        Circuit breaker state, rate-limit queues and request counters per
+        upstream API, for this process.
+        """
+        from utils import circuit, ratelimit, transport
+
+        return jsonify({
+            "breakers": circuit.breaker_stats(),
+            "rate_limits": ratelimit.governor_stats(),
+            "transport": transport.transport_stats(),
+        })
+
+    return app
+
+def get_flask_app():
+    global _flask_app
+    if _flask_app is None:
+        with _lock:
+            if _flask_app is None:
+                _flask_app = create_app()
+    return _flask_app
+
+
+class LazyApp:
+    """
+    WSGI app that answers GET /api/health itself and passes every other
+    request to the Flask app, building it on first use. Attribute access
+    (test_client(), config, ...) goes to the Flask app.
+    """
+
+    def __call__(self, environ, start_response):
+        if environ.get("PATH_INFO") == "/api/health" and environ.get("REQUEST_METHOD") in ("GET", "HEAD"):
+            start_response("200 OK", [("Content-Type", "application/json"), ("Content-Length", str(len(HEALTH_BODY)))])
+            return [HEALTH_BODY] if environ["REQUEST_METHOD"] == "GET" else []
+        return get_flask_app()(environ, start_response)
+
+    def __getattr__(self, name):
+        return getattr(get_flask_app(), name)
+
 
 # Vercel requires the app to be named 'app'
+app = LazyApp()
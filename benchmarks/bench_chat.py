@@ -0,0 +1,356 @@
+"""
+End-to-end benchmark of chat requests against replayed upstream APIs.
+
+    python benchmarks/bench_chat.py [--target agent|flask|both] [--concurrency 1,8,32]
+                                    [--rounds 3] [--latency-scale 1.0] [--check | --save-baseline]
+
+No network is used: the shared HTTP session is fitted with a replay adapter
+that answers Nominatim, Open-Meteo and Overpass from fixtures/upstreams.json
+(payloads in each API's own format, built from OpenStreetMap data) after a
+simulated, seeded latency per upstream. Overpass answers also include
+synthetic filler attractions per tile so payload sizes resemble a real city.
+
+Each concurrency level starts with empty caches and sends the query corpus
+`--rounds` times, so later rounds exercise the caches. Reports throughput,
+latency percentiles, a per-stage breakdown and upstream call counts. With
+--check the run fails (exit 1) if throughput or p95 latency regresses past
+--tolerance against baseline.json.
+"""
+import argparse
+import atexit
+import json
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from urllib.parse import parse_qs, urlsplit
+
+# Isolated caches and no offline attraction index, set before the agents are imported
+os.environ["TOURISM_CACHE_DIR"] = tempfile.mkdtemp(prefix="tourism-bench-")
+atexit.register(shutil.rmtree, os.environ["TOURISM_CACHE_DIR"], True)
+os.environ["TOURISM_ATTRACTION_INDEX"] = os.path.join(os.environ["TOURISM_CACHE_DIR"], "no-index")
+# No startup snapshot unless the caller picked one (see bench_cold_start.py)
+os.environ.setdefault("TOURISM_SNAPSHOT", os.path.join(os.environ["TOURISM_CACHE_DIR"], "no-snapshot"))
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+
+from agents import places_agent, weather_agent
+from agents.orchestrator import TourismAgent
+from utils import geocoding, ratelimit, transport
+from utils.geo import TILE_DEG
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+FIXTURES = os.path.join(HERE, "fixtures", "upstreams.json")
+BASELINE = os.path.join(HERE, "baseline.json")
+
+# Simulated response time per upstream in seconds (scaled by --latency-scale)
+LATENCY = {
+    "nominatim.openstreetmap.org": 0.12,
+    "api.open-meteo.com": 0.08,
+    "overpass-api.de": 0.45,
+}
+JITTER = 0.2  # +/- fraction of the latency
+
+# Synthetic un-tagged attractions added per tile to Overpass answers
+FILLER_PER_TILE = 8
+
+FORECAST_DAYS = 7
+
+CORPUS = [
+    "I'm going to Bangalore, let's plan my trip",
+    "I'm travelling to Bangalore. Help me plan this.",
+    "What's the weather in Paris?",
+    "I'm going to Kochi, let's plan my trip",
+    "Paris",
+    "Tokyo",
+    "plan a 3 day trip to Rome please",
+    "What's the temperature in London?",
+    "Will it be hot at Jaipur this weekend and what places can I visit",
+    "Show me attractions in London",
+    "trip to Kyoto",
+    "visiting Lisbon, what should I see in 4 days",
+    "What's the weather in Prague?",
+    "I'm going to Vienna, help me plan",
+    "trip to Ooty",
+    "Kochi",
+    "going to Rome, what places can I visit",
+    "weather in Kyoto and places to see",
+    "Portugal",
+    "trip to Bavaria",
+    "France",
+    "I'm going to Xyzzyville, help me plan",
+    "Jaipur",
+    "Show me attractions in Vienna",
+]
+
+
+class ReplayAdapter(BaseAdapter):
+    """
+    requests transport adapter that answers from recorded payloads instead of the network.
+    """
+
+    def __init__(self, fixtures, latency_scale=1.0, seed=0):
+        super().__init__()
+        self.fixtures = fixtures
+        self.latency_scale = latency_scale
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = {}
+
+    def _delay(self, host):
+        with self._lock:
+            self.calls[host] = self.calls.get(host, 0) + 1
+            jitter = self._random.uniform(-JITTER, JITTER)
+        return LATENCY.get(host, 0) * self.latency_scale * (1 + jitter)
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        parts = urlsplit(request.url)
+        host = parts.hostname
+        time.sleep(self._delay(host))
+
+        if host == "nominatim.openstreetmap.org":
+            query = parse_qs(parts.query).get("q", [""])[0]
+            payload = self.fixtures["nominatim"].get(query.strip().lower(), [])
+        elif host == "api.open-meteo.com":
+            payload = self._forecasts(parse_qs(parts.query))
+        elif host == "overpass-api.de":
+            body = request.body.decode() if isinstance(request.body, bytes) else request.body
+            payload = self._overpass(body or "")
+        else:
+            raise requests.ConnectionError(f"No fixture for {host}")
+
+        response = requests.Response()
+        response.status_code = 200
+        response.headers = CaseInsensitiveDict({"Content-Type": "application/json; charset=utf-8"})
+        response._content = json.dumps(payload).encode("utf-8")
+        response.encoding = "utf-8"
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+    def _forecasts(self, params):
+        """
+        Open-Meteo answer for each requested coordinate: the recorded daily
+        pattern, starting at today's UTC midnight and shifted by latitude.
+        """
+        template = self.fixtures["open_meteo"]
+        start = datetime.now(timezone.utc).replace(tzinfo=None, hour=0, minute=0, second=0, microsecond=0)
+        times = [(start + timedelta(hours=h)).strftime("%Y-%m-%dT%H:%M") for h in range(FORECAST_DAYS * 24)]
+        lats = [float(v) for v in params["latitude"][0].split(",")]
+        lons = [float(v) for v in params["longitude"][0].split(",")]
+
+        payloads = []
+        for lat, lon in zip(lats, lons):
+            offset = 12 - abs(lat) * 0.35
+            hourly = {"time": times}
+            for name, values in template["hourly"].items():
+                series = [values[h % 24] for h in range(len(times))]
+                hourly[name] = [round(v + offset, 1) for v in series] if name == "temperature_2m" else series
+            payloads.append({
+                "latitude": lat, "longitude": lon, "timezone": "GMT", "utc_offset_seconds": 0,
+                "hourly_units": template["hourly_units"], "hourly": hourly
+            })
+        return payloads[0] if len(payloads) == 1 else payloads
+
+    def _overpass(self, query):
+        """
+        Overpass answer for a bbox query (or a union of several boxes):
+        recorded attractions inside any box plus deterministic filler per tile.
+        """
+        boxes = list(dict.fromkeys(
+            tuple(float(v) for v in match) for match in re.findall(r"\(([-\d.]+),([-\d.]+),([-\d.]+),([-\d.]+)\)", query)
+        ))
+
+        def inside(element):
+            point = element.get("center", element)
+            return any(s <= point["lat"] <= n and w <= point["lon"] <= e for s, w, n, e in boxes)
+
+        tiles = dict.fromkeys(
+            (row, col)
+            for south, west, north, east in boxes
+            for row in range(round(south / TILE_DEG), round(north / TILE_DEG))
+            for col in range(round(west / TILE_DEG), round(east / TILE_DEG))
+        )
+        elements = [e for e in self.fixtures["overpass"]["elements"] if inside(e)]
+        for row, col in tiles:
+            rng = random.Random(f"{row}:{col}")
+            for i in range(FILLER_PER_TILE):
+                elements.append({
+                    "type": "node",
+                    "id": abs(hash((row, col, i))),
+                    "lat": (row + rng.random()) * TILE_DEG,
+                    "lon": (col + rng.random()) * TILE_DEG,
+                    "tags": {"name": f"Viewpoint {row}/{col}/{i}", "tourism": "viewpoint"}
+                })
+        return {"version": 0.6, "elements": elements}
+
+
+def _reset_caches():
+    geocoding._cache.clear()
+    places_agent._tile_cache.clear()
+    weather_agent._forecast_cache.clear()
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+def _make_sender(target):
+    """
+    Returns (send(query) -> result dict) for a fresh agent behind the chosen target.
+    """
+    agent = TourismAgent()
+    if target == "agent":
+        return agent.process_request
+
+    import api.index as flask_api
+    flask_api.agent = agent
+    local = threading.local()
+
+    def send(query):
+        client = getattr(local, "client", None)
+        if client is None:
+            client = local.client = flask_api.app.test_client()
+        return client.post("/api/chat", json={"message": query}).get_json()
+    return send
+
+def run_level(target, concurrency, rounds, adapter):
+    """
+    Sends the corpus `rounds` times at the given concurrency and returns a summary dict.
+    """
+    _reset_caches()
+    adapter.calls.clear()
+    send = _make_sender(target)
+    queries = CORPUS * rounds
+    latencies = []
+    stages = {}
+    outcomes = {}
+
+    def one(query):
+        start = time.perf_counter()
+        result = send(query)
+        return time.perf_counter() - start, result
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for elapsed, result in pool.map(one, queries):
+            latencies.append(elapsed * 1000)
+            outcome = "error" if "error" in result else result.get("cache", "miss")
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+            if outcome == "miss":
+                for stage, ms in result.get("timings", {}).items():
+                    stages.setdefault(stage, []).append(ms)
+    wall = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests": len(queries),
+        "throughput": round(len(queries) / wall, 2),
+        "p50": round(_percentile(latencies, 50), 1),
+        "p90": round(_percentile(latencies, 90), 1),
+        "p95": round(_percentile(latencies, 95), 1),
+        "p99": round(_percentile(latencies, 99), 1),
+        "stages": {stage: round(sum(v) / len(v), 1) for stage, v in sorted(stages.items())},
+        "outcomes": outcomes,
+        "upstream_calls": dict(adapter.calls),
+    }
+
+def report(name, summary):
+    print(f"\n{name}: {summary['requests']} requests, {summary['throughput']:.1f} req/s")
+    print(f"  latency ms  p50 {summary['p50']:>8.1f}  p90 {summary['p90']:>8.1f}  "
+          f"p95 {summary['p95']:>8.1f}  p99 {summary['p99']:>8.1f}")
+    if summary["stages"]:
+        print("  stages (mean ms, uncached): " + "  ".join(f"{k} {v}" for k, v in summary["stages"].items()))
+    print("  outcomes: " + "  ".join(f"{k} {v}" for k, v in sorted(summary["outcomes"].items())))
+    print("  upstream calls: " + "  ".join(f"{k} {v}" for k, v in sorted(summary["upstream_calls"].items())))
+
+def compare(results, baseline, tolerance):
+    """
+    Returns a list of regressions: throughput below, or p95 above, the baseline by more than tolerance.
+    """
+    failures = []
+    for name, summary in results.items():
+        expected = baseline.get(name)
+        if not expected:
+            print(f"  (no baseline for {name})")
+            continue
+        if summary["throughput"] < expected["throughput"] * (1 - tolerance):
+            failures.append(f"{name}: throughput {summary['throughput']} < baseline {expected['throughput']}")
+        if summary["p95"] > expected["p95"] * (1 + tolerance):
+            failures.append(f"{name}: p95 {summary['p95']} ms > baseline {expected['p95']} ms")
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--target", choices=("agent", "flask", "both"), default="both")
+    parser.add_argument("--concurrency", default="1,8,32", help="Comma-separated concurrency levels")
+    parser.add_argument("--rounds", type=int, default=3, help="Passes over the query corpus per level")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="Multiplier for simulated upstream latency")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--rate-limits", action="store_true", help="Keep the upstream rate-limit policies (off by default)")
+    parser.add_argument("--check", action="store_true", help="Fail on regressions against the stored baseline")
+    parser.add_argument("--save-baseline", action="store_true", help="Store this run as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative regression for --check")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    # The public rate limits would otherwise dominate every number
+    if not args.rate_limits:
+        ratelimit.POLICIES.clear()
+
+    with open(FIXTURES, encoding="utf-8") as f:
+        adapter = ReplayAdapter(json.load(f), args.latency_scale, args.seed)
+    session = transport._get_session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+    targets = ("agent", "flask") if args.target == "both" else (args.target,)
+    levels = [int(level) for level in args.concurrency.split(",")]
+    results = {}
+    for target in targets:
+        for level in levels:
+            name = f"{target}@{level}"
+            results[name] = run_level(target, level, args.rounds, adapter)
+            report(name, results[name])
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    if args.save_baseline:
+        baseline = {name: {"throughput": s["throughput"], "p95": s["p95"]} for name, s in results.items()}
+        with open(BASELINE, "w", encoding="utf-8") as f:
+            json.dump({"latency_scale": args.latency_scale, "rounds": args.rounds, "results": baseline}, f, indent=2)
+            f.write("\n")
+        print(f"\nBaseline written to {BASELINE}")
+
+    if args.check:
+        with open(BASELINE, encoding="utf-8") as f:
+            stored = json.load(f)
+        if stored.get("latency_scale") != args.latency_scale or stored.get("rounds") != args.rounds:
+            print("\nBaseline was recorded with different --latency-scale/--rounds; comparison may not be meaningful")
+        failures = compare(results, stored["results"], args.tolerance)
+        print()
+        for failure in failures:
+            print(f"REGRESSION {failure}")
+        if failures:
+            return 1
+        print("No regressions against baseline")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,155 @@
+"""
+Cold-start benchmark: time from a fresh Python process to its first answer.
+
+    python benchmarks/bench_cold_start.py [--runs 5] [--latency-scale 1.0] [--query "..."]
+
+Every measurement runs in a new interpreter that imports api/index.py and
+serves one request (GET /api/health, or one POST /api/chat answered through
+the replay adapter from bench_chat.py, so no network is used). Modes:
+
+  eager     Flask app and agents built at import, as api/index.py used to
+  lazy      the current lazy entry point, no startup snapshot
+  snapshot  lazy, with a snapshot built from a warm-up pass over the corpus
+
+Reports the median per request and mode: process wall time (including
+interpreter start), import time and time to the first response.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+
+MODES = ("eager", "lazy", "snapshot")
+REQUESTS = ("health", "chat")
+DEFAULT_QUERY = "I'm going to Vienna, help me plan"
+
+
+def child(request, mode, query, latency_scale, seed):
+    """
+    Runs inside the fresh process: imports the app, serves one request and
+    prints its timings as JSON.
+    """
+    start = time.perf_counter()
+    sys.path.insert(0, ROOT)
+    import api.index as flask_api
+    if mode == "eager":
+        flask_api.get_flask_app()
+        flask_api.get_agent()
+    imported = time.perf_counter()
+
+    if request == "health":
+        if mode == "eager":
+            ok = flask_api.app.test_client().get("/api/health").status_code == 200
+        else:
+            status = []
+            environ = {"REQUEST_METHOD": "GET", "PATH_INFO": "/api/health"}
+            b"".join(flask_api.app(environ, lambda s, headers: status.append(s)))
+            ok = status[0].startswith("200")
+    else:
+        # Pulls in requests and the agents, which the chat needs anyway
+        import bench_chat
+        from utils import ratelimit, transport
+        ratelimit.POLICIES.clear()
+        with open(bench_chat.FIXTURES, encoding="utf-8") as f:
+            adapter = bench_chat.ReplayAdapter(json.load(f), latency_scale, seed)
+        transport._get_session().mount("https://", adapter)
+        result = flask_api.app.test_client().post("/api/chat", json={"message": query}).get_json()
+        ok = "error" not in result
+    done = time.perf_counter()
+
+    print(json.dumps({
+        "import_ms": (imported - start) * 1000,
+        "first_ms": (done - start) * 1000,
+        "ok": ok,
+    }))
+
+def build_snapshot(path):
+    """
+    Sends the bench_chat corpus through a fresh agent, then snapshots the
+    filled caches and the gazetteer to path.
+    """
+    sys.path.insert(0, ROOT)
+    import bench_chat
+    from agents.orchestrator import TourismAgent
+    from utils import ratelimit, snapshot, transport
+
+    ratelimit.POLICIES.clear()
+    with open(bench_chat.FIXTURES, encoding="utf-8") as f:
+        transport._get_session().mount("https://", bench_chat.ReplayAdapter(json.load(f), 0))
+    agent = TourismAgent()
+    for query in bench_chat.CORPUS:
+        agent.process_request(query)
+    return snapshot.build_snapshot(path)
+
+def measure(request, mode, args, snapshot_path, seed):
+    # Empty disk caches in every process, as on a fresh serverless instance
+    env = dict(os.environ)
+    env["TOURISM_CACHE_DIR"] = tempfile.mkdtemp(prefix="tourism-cold-cache-")
+    env["TOURISM_SNAPSHOT"] = snapshot_path if mode == "snapshot" else os.path.join(tempfile.gettempdir(), "no-snapshot")
+    command = [sys.executable, os.path.abspath(__file__), "--child", request, mode,
+               "--query", args.query, "--latency-scale", str(args.latency_scale), "--seed", str(seed)]
+    start = time.perf_counter()
+    try:
+        output = subprocess.run(command, env=env, capture_output=True, text=True, check=True).stdout
+        process_ms = (time.perf_counter() - start) * 1000
+    finally:
+        shutil.rmtree(env["TOURISM_CACHE_DIR"], True)
+    timings = json.loads(output.strip().splitlines()[-1])
+    timings["process_ms"] = process_ms
+    return timings
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="Fresh processes per request and mode")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="Multiplier for simulated upstream latency")
+    parser.add_argument("--query", default=DEFAULT_QUERY, help="Chat message (should be in the bench_chat corpus)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Also write the results to this file")
+    parser.add_argument("--child", nargs=2, metavar=("REQUEST", "MODE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child[0], args.child[1], args.query, args.latency_scale, args.seed)
+        return 0
+
+    workdir = tempfile.mkdtemp(prefix="tourism-cold-")
+    snapshot_path = os.path.join(workdir, "snapshot.bin")
+    counts = build_snapshot(snapshot_path)
+    print("Snapshot: " + ", ".join(f"{name} {count}" for name, count in counts.items()))
+
+    results = {}
+    print(f"\n{'request':<8} {'mode':<9} {'process ms':>11} {'import ms':>10} {'first ms':>9}")
+    for request in REQUESTS:
+        for mode in MODES:
+            runs = [measure(request, mode, args, snapshot_path, args.seed + i) for i in range(args.runs)]
+            if not all(run["ok"] for run in runs):
+                print(f"{request} ({mode}) returned an error")
+                return 1
+            summary = {key: round(statistics.median(run[key] for run in runs), 1)
+                       for key in ("process_ms", "import_ms", "first_ms")}
+            results[f"{request}/{mode}"] = summary
+            print(f"{request:<8} {mode:<9} {summary['process_ms']:>11.1f} {summary['import_ms']:>10.1f} {summary['first_ms']:>9.1f}")
+
+    print()
+    for request in REQUESTS:
+        eager = results[f"{request}/eager"]["first_ms"]
+        best = results[f"{request}/snapshot"]["first_ms"]
+        print(f"{request}: first response in {best:.1f} ms vs {eager:.1f} ms eager ({best / eager:.0%})")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    os.remove(snapshot_path)
+    os.rmdir(workdir)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
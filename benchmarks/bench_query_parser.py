@@ -0,0 +1,165 @@
+"""
+Micro-benchmark: compiled query parser vs. the original per-call regex implementation.
+
+    python benchmarks/bench_query_parser.py [--seconds 1.0]
+
+Checks both implementations agree on every query in the corpus (on the keys
+the original returned) and that comparison queries yield their expected
+locations. Then reports queries/sec for each on the corpus, and for the
+compiled parser alone on the comparisons, which the original can't parse.
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agents.query_parser import parse_query
+
+CORPUS = [
+    "I'm going to go to Bangalore, let's plan my trip",
+    "I'm travelling to Bangalore. Help me plan this.",
+    "What's the weather in Paris?",
+    "I'm going to Kochi, let's plan my trip",
+    "Paris",
+    "Bangalore",
+    "Tokyo",
+    "France",
+    "plan a 3 day trip to Rome please",
+    "visiting New York for 5 days, what should I see",
+    "is it going to rain in London tomorrow",
+    "Will it be hot at Jaipur this weekend and what places can I visit",
+    "trip to Munnar",
+    "i'm travel to city",
+    "Show me attractions in Florence",
+    "weather forecast for Alappuzha for the next 2 days and sights to see",
+    # "City, Region" names one place
+    "I'm going to Paris, France for 3 days",
+    "trip to Kochi, Kerala",
+    "weather in Springfield, Illinois",
+    "visit New York, NY",
+    # A leading phrase ended by a comma is not a list
+    "What is the weather in Kyoto, 4 days from now",
+    # "and" followed by something other than a place is not a list
+    "I'm going to Paris and need help",
+    "going to Rome and eat pasta",
+    "trip to Goa and enjoy",
+    "I'm travelling to Munnar and staying 3 days",
+    "weather in London and packing list",
+    "going to Rome and then Florence",
+]
+
+# Comparison queries and the locations they should yield (the original
+# parser predates comparisons, so these are only timed against it)
+COMPARISONS = {
+    "Rome or Paris?": ["Rome", "Paris"],
+    "compare Vienna and Prague": ["Vienna", "Prague"],
+    "compare Rome, Paris": ["Rome", "Paris"],
+    "Should I visit Lisbon or Porto?": ["Lisbon", "Porto"],
+    "I'm going to Kochi, Munnar and Alappuzha": ["Kochi", "Munnar", "Alappuzha"],
+    "weather in Kyoto vs Osaka": ["Kyoto", "Osaka"],
+    "Hmm, Rome or Paris?": ["Rome", "Paris"],
+    "compare rome and paris": ["Rome", "Paris"],
+}
+
+LEGACY_KEYS = ("location", "show_weather", "show_places", "num_days", "error")
+
+
+# --- Original implementation (from TourismAgent before the compiled parser) ---
+
+def legacy_extract_location(text):
+    text = re.sub(r'[.!?]+\s+', ' ', text)
+    patterns = [
+        r"(?:going|go|visit\w*|travel\w*|trip)\s+(?:to\s+)?([a-zA-Z\s]+?)(?:\s+(?:let|help|plan|what|and|please|can|could|would|me|give|tell|show)|[\.,!\?]|$)",
+        r"(?:in|at)\s+([a-zA-Z\s]+?)(?:\s+(?:let|help|plan|what|and|please|can|could|would|me|give|tell|show)|[\.,!\?]|$)"
+    ]
+    for pattern in patterns:
+        match = re.search(pattern, text, re.IGNORECASE)
+        if match:
+            location = match.group(1).strip()
+            stop_words = ['help', 'plan', 'let', 'the', 'my', 'this', 'trip', 'me', 'please', 'is', 'a', 'an', 'give', 'tell', 'show']
+            words = location.split()
+            cleaned = []
+            for word in words:
+                if word.lower() in stop_words:
+                    break
+                cleaned.append(word)
+            if cleaned:
+                return ' '.join(cleaned).strip().title()
+    clean_text = text.lower()
+    junk = ["i'm", "i", "am", "travel", "to", "city", "place", "location"]
+    if len(text.split()) <= 3:
+        for j in junk:
+            clean_text = re.sub(r'\b' + re.escape(j) + r'\b', '', clean_text)
+        return clean_text.strip().title()
+    return None
+
+def legacy_parse_query(query):
+    query_lower = query.lower()
+    show_weather = False
+    show_places = False
+    if any(k in query_lower for k in ["weather", "temperature", "rain", "forecast", "hot", "cold"]):
+        show_weather = True
+    if any(k in query_lower for k in ["place", "visit", "attraction", "sight", "see", "plan"]):
+        show_places = True
+    if not show_weather and not show_places:
+        show_places = True
+    num_days = 1
+    day_match = re.search(r"(\d+)\s*days?", query, re.IGNORECASE)
+    if day_match:
+        try:
+            num_days = int(day_match.group(1))
+        except ValueError:
+            num_days = 1
+    location = legacy_extract_location(query)
+    if not location:
+        if len(query.split()) <= 3:
+            location = query
+        else:
+            return {"error": "I couldn't identify the location."}
+    return {"location": location, "show_weather": show_weather, "show_places": show_places, "num_days": num_days}
+
+
+def throughput(fn, queries, seconds):
+    """
+    Runs fn over the queries repeatedly for about `seconds` and returns queries/sec.
+    """
+    count = 0
+    start = time.perf_counter()
+    while True:
+        for query in queries:
+            fn(query)
+        count += len(queries)
+        elapsed = time.perf_counter() - start
+        if elapsed >= seconds:
+            return count / elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=1.0, help="Time budget per implementation")
+    args = parser.parse_args()
+
+    def legacy_view(result):
+        return {key: value for key, value in result.items() if key in LEGACY_KEYS}
+
+    mismatches = [q for q in CORPUS if legacy_view(parse_query(q)) != legacy_parse_query(q)]
+    for query in mismatches:
+        print(f"MISMATCH {query!r}: {legacy_view(parse_query(query))} != {legacy_parse_query(query)}")
+    for query, expected in COMPARISONS.items():
+        locations = parse_query(query).get("locations")
+        if locations != expected:
+            mismatches.append(query)
+            print(f"MISMATCH {query!r}: locations {locations} != {expected}")
+
+    legacy = throughput(legacy_parse_query, CORPUS, args.seconds)
+    compiled = throughput(parse_query, CORPUS, args.seconds)
+    comparisons = throughput(parse_query, list(COMPARISONS), args.seconds)
+    print(f"legacy    {legacy:>12,.0f} queries/sec")
+    print(f"compiled  {compiled:>12,.0f} queries/sec  ({compiled / legacy:.2f}x)")
+    print(f"compiled  {comparisons:>12,.0f} queries/sec on comparisons")
+    return 1 if mismatches else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
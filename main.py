@@ -1,6 +1,55 @@
+import argparse
+import sys
+
+from agents.cache_warmer import CacheWarmer
 from agents.orchestrator import TourismAgent
 
+def warm(path):
+    """
+    Adds the cities listed in a file (one per line, '-' for stdin) to the
+    warm set shared with running servers and fetches their data now.
+    """
+    if path == "-":
+        names = sys.stdin.read().splitlines()
+    else:
+        with open(path, encoding="utf-8") as f:
+            names = f.read().splitlines()
+    names = [name for name in names if name.strip() and not name.lstrip().startswith("#")]
+
+    warmer = CacheWarmer()
+    added = warmer.seed(names)
+    print(f"Warm set: {added} cities added, {len(warmer.warm_set())} in total. Fetching...")
+    stats = warmer.warm_once(wait=True)
+    print(f"Warmed {stats['cities']} cities: {stats['geocode']} geocoded, "
+          f"{stats['weather']} forecasts, {stats['places']} attraction lookups.")
+
+def print_comparison(result):
+    """
+    Prints a multi-city answer with one block per city.
+    """
+    print(f"\n⚖️ Comparing {', '.join(row['city'] for row in result['summary'])}:")
+    for row in result["summary"]:
+        print(f"\n📍 {row['city']}")
+        if "error" in row:
+            print(row["error"])
+            continue
+        if row["temperature"] is not None:
+            print(f"Weather: {row['temperature']}°C ({row['description']}), {row['rain_chance']}% chance of rain.")
+        else:
+            print("Weather data unavailable.")
+        if result["intents"]["places"]:
+            print("Top places: " + (", ".join(row["top_places"]) or "none found"))
+        if row["budget"]:
+            print("Budget per day: " + ", ".join(f"{tier} {cost}" for tier, cost in row["budget"].items()))
+
 def main():
+    parser = argparse.ArgumentParser(description="Multi-Agent Tourism System")
+    parser.add_argument("--warm", metavar="FILE", help="Seed the cache warm set from a list of cities and exit")
+    args = parser.parse_args()
+    if args.warm:
+        warm(args.warm)
+        return
+
     agent = TourismAgent()
     
     print("Multi-Agent Tourism System Initialized.")
@@ -15,6 +64,8 @@ def main():
         
         if "error" in result:
             print(result["error"])
+        elif "comparison" in result:
+            print_comparison(result)
         else:
             city = result['city']
             intents = result.get('intents', {})
@@ -40,12 +91,23 @@ def main():
                 else:
                     print("Could not find specific attractions.")
 
-            # 3. Packing Section
+            # 3. Itinerary Section (multi-day trips)
+            if result.get('itinerary'):
+                print(f"\n🗺️ {len(result['itinerary'])}-Day Itinerary:")
+                for day in result['itinerary']:
+                    rain = " (rainy - indoor day)" if day['indoor'] else ""
+                    print(f"Day {day['day']}{rain}:")
+                    if day['stops']:
+                        print("  " + " → ".join(stop['name'] for stop in day['stops']) + f"  (~{day['route_km']} km)")
+                    else:
+                        print("  Free day")
+
+            # 4. Packing Section
             print(f"\n🎒 What to Pack:")
             for item in result.get('packing', []):
                 print(f"- {item}")
 
-            # 4. Tips Section
+            # 5. Tips Section
             print(f"\n💡 Pro Tips:")
             for tip in result.get('tips', []):
                 print(f"- {tip}")
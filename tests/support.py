@@ -0,0 +1,91 @@
+"""
+Shared test setup. Import it before any module of the app: it puts the repo
+on sys.path, and importing the benchmark harness points the caches at a
+throwaway directory with no offline attraction index or startup snapshot,
+so tests never see cached data from a developer's runs.
+
+replay() answers the upstream APIs from benchmarks/fixtures/upstreams.json
+for tests that plan whole requests (replay_async() does the same for the
+async transport); expire_tiles() ages the cached
+attractions so the next lookup has to refetch them.
+
+    python -m pytest tests        (or: python -m unittest discover -s tests)
+"""
+import json
+import os
+import sys
+from urllib.parse import urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "benchmarks")]
+
+os.environ.pop("TOURISM_SNAPSHOT", None)
+import bench_chat  # noqa: E402  (sets up the isolated cache directory)
+
+import requests  # noqa: E402
+
+from agents import places_agent  # noqa: E402
+from utils import circuit, ratelimit, transport  # noqa: E402
+
+
+class Upstreams(bench_chat.ReplayAdapter):
+    """
+    Replays the recorded upstreams without latency. Hosts added to `down`
+    fail with a connection error; `calls` counts requests per host either way.
+    """
+
+    def __init__(self):
+        with open(bench_chat.FIXTURES, encoding="utf-8") as f:
+            super().__init__(json.load(f), latency_scale=0)
+        self.down = set()
+
+    def send(self, request, *args, **kwargs):
+        host = urlsplit(request.url).hostname
+        if host in self.down:
+            self._delay(host)
+            raise requests.ConnectionError(f"{host} is down")
+        return super().send(request, *args, **kwargs)
+
+
+def replay():
+    """
+    Empties the caches and circuit breakers, lifts the rate limits and
+    retries, and mounts a fresh Upstreams adapter on the shared session.
+    Returns the adapter.
+    """
+    bench_chat._reset_caches()
+    circuit.reset()
+    ratelimit.POLICIES.clear()
+    transport.MAX_RETRIES = 0
+    upstreams = Upstreams()
+    session = transport._get_session()
+    session.mount("https://", upstreams)
+    session.mount("http://", upstreams)
+    return upstreams
+
+
+def replay_async(upstreams):
+    """
+    Answers the async (httpx) transport from the same Upstreams adapter.
+    """
+    import httpx
+
+    def handle(request):
+        prepared = requests.Request(request.method, str(request.url), headers=dict(request.headers),
+                                    data=request.content).prepare()
+        try:
+            response = upstreams.send(prepared)
+        except requests.ConnectionError as e:
+            raise httpx.ConnectError(str(e), request=request)
+        return httpx.Response(response.status_code, headers=dict(response.headers), content=response.content)
+
+    transport._async_client = httpx.AsyncClient(transport=httpx.MockTransport(handle))
+
+
+def expire_tiles():
+    """
+    Marks every cached attraction tile as expired (kept for stale reads).
+    """
+    memory = places_agent._tile_cache.memory
+    for key in list(memory._data):
+        places_agent._tile_cache.set(key, memory._data[key][0], -1)
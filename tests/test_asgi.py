@@ -0,0 +1,85 @@
+"""
+ASGI app: every /api route, driven directly with ASGI messages against
+replayed upstreams (sync and async transports).
+"""
+import asyncio
+import json
+import unittest
+
+import support
+
+from agents.orchestrator import TourismAgent
+from api import asgi
+
+
+def call(method, path, body=None, query=b"", headers=()):
+    """
+    Sends one request through asgi.app. Returns (status, headers, body bytes).
+    """
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": json.dumps(body).encode() if body is not None else b"", "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": method, "path": path, "query_string": query, "headers": list(headers)}
+    asyncio.run(asgi.app(scope, receive, send))
+    return sent[0]["status"], dict(sent[0]["headers"]), b"".join(m.get("body", b"") for m in sent[1:])
+
+
+class AsgiTest(unittest.TestCase):
+    def setUp(self):
+        self.upstreams = support.replay()
+        support.replay_async(self.upstreams)
+        asgi.agent = TourismAgent(response_cache=False)
+
+    def test_chat(self):
+        status, headers, body = call("POST", "/api/chat", {"message": "trip to Vienna"})
+        self.assertEqual(status, 200)
+        self.assertEqual(headers[b"content-type"], b"application/json")
+        self.assertTrue(json.loads(body)["places"])
+
+    def test_chat_without_message(self):
+        self.assertEqual(call("POST", "/api/chat", {})[0], 400)
+        self.assertEqual(call("POST", "/api/chat", {"message": ""})[0], 400)
+
+    def test_stream(self):
+        status, headers, body = call("POST", "/api/chat/stream", {"message": "plan a 2 day trip to Vienna"})
+        self.assertEqual(status, 200)
+        self.assertEqual(headers[b"content-type"], b"text/event-stream")
+        events = [block.splitlines()[0] for block in body.decode().strip().split("\n\n")]
+        self.assertEqual(events[:2], ["event: location", "event: tips"])
+        self.assertEqual(events[-2:], ["event: advice", "event: done"])
+
+    def test_batch(self):
+        messages = ["trip to Vienna", "", "trip to Prague"]
+        status, _, body = call("POST", "/api/chat/batch", {"messages": messages})
+        self.assertEqual(status, 200)
+        results = json.loads(body)["results"]
+        self.assertEqual(len(results), 3)
+        self.assertEqual(results[1], {"error": "Empty message"})
+
+    def test_batch_ndjson(self):
+        messages = ["trip to Vienna", "", "trip to Prague"]
+        for query, headers in [(b"stream=1", ()), (b"", [(b"accept", b"application/x-ndjson")])]:
+            with self.subTest(query=query):
+                status, response_headers, body = call("POST", "/api/chat/batch", {"messages": messages}, query, headers)
+                self.assertEqual(response_headers[b"content-type"], b"application/x-ndjson")
+                lines = [json.loads(line) for line in body.decode().splitlines()]
+                self.assertEqual([line["index"] for line in lines], [0, 1, 2])
+                self.assertEqual(lines[1]["error"], "Empty message")
+
+    def test_batch_rejects_bad_input(self):
+        self.assertEqual(call("POST", "/api/chat/batch", {"messages": "Rome"})[0], 400)
+
+    def test_other_routes(self):
+        self.assertEqual(json.loads(call("GET", "/api/health")[2]), {"status": "ok"})
+        self.assertEqual(call("GET", "/api/metrics")[0], 200)
+        self.assertEqual(call("GET", "/api/chat")[0], 405)
+        self.assertEqual(call("GET", "/api/nowhere")[0], 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
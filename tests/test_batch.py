@@ -0,0 +1,79 @@
+"""
+Batch planning: shared upstream work across messages, and the JSON and
+NDJSON forms of /api/chat/batch, against replayed upstreams.
+"""
+import json
+import unittest
+from unittest import mock
+
+import support
+
+from agents.orchestrator import TourismAgent
+from api import index
+
+MESSAGES = ["trip to Vienna", "", "weather in Vienna", "What is the weather like", "trip to Prague"]
+
+
+class BatchTest(unittest.TestCase):
+    def setUp(self):
+        self.upstreams = support.replay()
+        self.agent = TourismAgent(response_cache=False)
+
+    def test_results_in_input_order(self):
+        results = self.agent.process_batch(MESSAGES)
+        self.assertEqual(len(results), len(MESSAGES))
+        self.assertEqual(results[1], {"error": "Empty message"})
+        self.assertIn("error", results[3])
+        self.assertTrue(results[0]["places"])
+        self.assertIsNone(results[2]["places"])
+        self.assertEqual(results[2]["full_name"], results[0]["full_name"])
+
+    def test_repeated_location_is_fetched_once(self):
+        self.agent.process_batch(["trip to Vienna", "going to vienna", "visit Vienna"])
+        self.assertEqual(self.upstreams.calls["overpass-api.de"], 1)
+        self.assertEqual(self.upstreams.calls["api.open-meteo.com"], 1)
+
+
+class BatchRouteTest(unittest.TestCase):
+    def setUp(self):
+        support.replay()
+        index.agent = TourismAgent(response_cache=False)
+        self.client = index.app.test_client()
+
+    def tearDown(self):
+        index.agent = None
+
+    def test_json(self):
+        response = self.client.post("/api/chat/batch", json={"messages": MESSAGES})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.get_json()["results"]), len(MESSAGES))
+
+    def test_ndjson(self):
+        response = self.client.post("/api/chat/batch?stream=1", json={"messages": MESSAGES})
+        self.assertEqual(response.mimetype, "application/x-ndjson")
+        lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        self.assertEqual([line["index"] for line in lines], list(range(len(MESSAGES))))
+        self.assertEqual(lines[1]["error"], "Empty message")
+
+    def test_ndjson_failure_ends_with_an_error_line(self):
+        def fail_after_first(messages):
+            yield {"city": "Vienna"}
+            raise RuntimeError("boom")
+
+        with mock.patch.object(index.agent, "iter_batch", fail_after_first):
+            response = self.client.post("/api/chat/batch", json={"messages": MESSAGES},
+                                        headers={"Accept": "application/x-ndjson"})
+            lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        self.assertEqual(lines, [
+            {"index": 0, "city": "Vienna"},
+            {"index": 1, "error": "Internal server error", "details": "boom"},
+        ])
+
+    def test_rejects_bad_input(self):
+        self.assertEqual(self.client.post("/api/chat/batch", json={"messages": "Rome"}).status_code, 400)
+        too_many = ["Rome"] * (index.MAX_BATCH_SIZE + 1)
+        self.assertEqual(self.client.post("/api/chat/batch", json={"messages": too_many}).status_code, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
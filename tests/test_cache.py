@@ -0,0 +1,149 @@
+"""
+Cache primitives: single-flight coalescing, including step-by-step leaders,
+and stale reads of expired entries.
+"""
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+import support  # noqa: F401  (isolated caches, repo on sys.path)
+
+from utils.cache import MISS, LRUCache, SingleFlight, TieredCache
+
+
+class SingleFlightTest(unittest.TestCase):
+    def run_concurrently(self, flight, fn, callers=8):
+        """
+        Starts callers threads on flight.do("key", fn) while the leader is
+        held inside fn. Returns ([value or exception], release event).
+        """
+        results = [None] * callers
+        started = threading.Event()
+        release = threading.Event()
+
+        def leader_fn():
+            started.set()
+            release.wait(2)
+            return fn()
+
+        def call(index):
+            try:
+                results[index] = flight.do("key", leader_fn)
+            except Exception as e:
+                results[index] = e
+
+        threads = [threading.Thread(target=call, args=(0,))]
+        threads[0].start()
+        started.wait(2)
+        for index in range(1, callers):
+            threads.append(threading.Thread(target=call, args=(index,)))
+            threads[-1].start()
+        while not all(t.is_alive() for t in threads[1:]):
+            time.sleep(0.001)
+        time.sleep(0.02)
+        release.set()
+        for t in threads:
+            t.join(2)
+        return results
+
+    def test_one_call_shared_by_everyone(self):
+        flight = SingleFlight()
+        calls = []
+
+        def fn():
+            calls.append(1)
+            return "value"
+
+        results = self.run_concurrently(flight, fn)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results[0], ("value", False))
+        self.assertEqual(results[1:], [("value", True)] * 7)
+        self.assertFalse(flight.in_flight("key"))
+
+    def test_error_reaches_every_waiter(self):
+        flight = SingleFlight()
+        calls = []
+
+        def fn():
+            calls.append(1)
+            raise ValueError("upstream down")
+
+        results = self.run_concurrently(flight, fn)
+        self.assertEqual(len(calls), 1)
+        for result in results:
+            self.assertIsInstance(result, ValueError)
+            self.assertEqual(str(result), "upstream down")
+
+        # The failed call is forgotten: the next caller runs again
+        self.assertFalse(flight.in_flight("key"))
+        self.assertEqual(flight.do("key", lambda: "recovered"), ("recovered", False))
+
+    def test_join_for_step_by_step_leaders(self):
+        flight = SingleFlight()
+        finish, value = flight.join("key")
+        self.assertIsNotNone(finish)
+        self.assertTrue(flight.in_flight("key"))
+
+        followers = []
+        thread = threading.Thread(target=lambda: followers.append(flight.join("key")))
+        thread.start()
+        time.sleep(0.02)
+        self.assertEqual(followers, [])
+
+        finish("done")
+        thread.join(2)
+        self.assertEqual(followers, [(None, "done")])
+        self.assertFalse(flight.in_flight("key"))
+
+    def test_join_follower_gets_leader_error(self):
+        flight = SingleFlight()
+        finish, _ = flight.join("key")
+        errors = []
+
+        def follow():
+            try:
+                flight.join("key")
+            except KeyError as e:
+                errors.append(e)
+
+        thread = threading.Thread(target=follow)
+        thread.start()
+        time.sleep(0.02)
+        finish(error=KeyError("missing"))
+        thread.join(2)
+        self.assertEqual(len(errors), 1)
+
+
+class StaleReadTest(unittest.TestCase):
+    def test_lru_keeps_expired_entries_for_stale_ttl(self):
+        cache = LRUCache(stale_ttl=60)
+        cache.set("fresh", 1, time.time() + 60)
+        cache.set("expired", 2, time.time() - 1)
+        cache.set("gone", 3, time.time() - 120)
+
+        self.assertEqual(cache.get("fresh"), 1)
+        self.assertIs(cache.get("expired"), MISS)
+        self.assertEqual(cache.get_stale("expired"), 2)
+        self.assertIs(cache.get_stale("gone"), MISS)
+
+    def test_tiered_cache_reads_stale_from_disk(self):
+        directory = tempfile.mkdtemp(prefix="tourism-cache-test-")
+        try:
+            path = os.path.join(directory, "cache.sqlite3")
+            writer = TieredCache("stale_test", path=path, stale_ttl=60)
+            writer.set("key", {"temp": 21}, -1)
+
+            # A fresh process sees only the disk tier
+            reader = TieredCache("stale_test", path=path, stale_ttl=60)
+            self.assertIs(reader.get("key"), MISS)
+            self.assertEqual(reader.get_stale("key"), {"temp": 21})
+            self.assertEqual(reader.stats()["stale_hits"], 1)
+        finally:
+            shutil.rmtree(directory, True)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,147 @@
+"""
+Circuit breaker state machine: opening, background probes and half-open trials.
+"""
+import time
+import unittest
+
+import support  # noqa: F401  (isolated caches, repo on sys.path)
+
+import requests
+
+from utils import circuit
+from utils.circuit import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpen
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+class OpeningTest(unittest.TestCase):
+    def test_opens_after_consecutive_failures(self):
+        breaker = CircuitBreaker("test-open", failure_threshold=3, reset_timeout=60)
+        for _ in range(2):
+            breaker.record_failure("boom")
+        self.assertEqual(breaker.state, CLOSED)
+        self.assertTrue(breaker.allow())
+
+        breaker.record_failure("boom")
+        self.assertEqual(breaker.state, OPEN)
+        self.assertFalse(breaker.allow())
+        self.assertEqual(breaker.snapshot()["rejected"], 1)
+        self.assertEqual(breaker.snapshot()["last_error"], "boom")
+
+    def test_success_resets_the_failure_count(self):
+        breaker = CircuitBreaker("test-reset", failure_threshold=3, reset_timeout=60)
+        breaker.record_failure()
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CLOSED)
+
+    def test_circuit_open_is_a_request_exception(self):
+        # Agents already handle RequestException, so open circuits fall back the same way
+        self.assertTrue(issubclass(CircuitOpen, requests.RequestException))
+
+
+class ProbeTest(unittest.TestCase):
+    def test_probe_closes_the_circuit_once_healthy(self):
+        answers = [False, True]
+        breaker = CircuitBreaker("test-probe", failure_threshold=1, reset_timeout=0.05,
+                                 max_reset_timeout=0.1, probe=lambda: answers.pop(0))
+        breaker.record_failure()
+        self.assertEqual(breaker.state, OPEN)
+        # Live calls keep failing fast while the prober works in the background
+        self.assertFalse(breaker.allow())
+
+        self.assertTrue(wait_for(lambda: breaker.state == CLOSED))
+        self.assertEqual(breaker.snapshot()["probes"], 2)
+        self.assertTrue(breaker.allow())
+
+    def test_failing_probe_backs_off_up_to_the_maximum(self):
+        breaker = CircuitBreaker("test-backoff", failure_threshold=1, reset_timeout=0.02,
+                                 max_reset_timeout=0.04, probe=lambda: False)
+        breaker.record_failure()
+        self.assertTrue(wait_for(lambda: breaker.snapshot()["probes"] >= 3))
+        self.assertEqual(breaker.state, OPEN)
+        self.assertEqual(breaker._delay, 0.04)
+
+    def test_probe_exception_counts_as_unhealthy(self):
+        def probe():
+            raise requests.ConnectionError("still down")
+
+        breaker = CircuitBreaker("test-probe-error", failure_threshold=1, reset_timeout=0.02,
+                                 max_reset_timeout=0.02, probe=probe)
+        breaker.record_failure("first")
+        self.assertTrue(wait_for(lambda: breaker.snapshot()["probes"] >= 1 and breaker.last_error == "still down"))
+        self.assertEqual(breaker.state, OPEN)
+
+    def test_reopening_keeps_a_single_prober(self):
+        healthy = [False]
+        breaker = CircuitBreaker("test-prober", failure_threshold=1, reset_timeout=0.02,
+                                 max_reset_timeout=0.02, probe=lambda: healthy[0])
+        breaker.record_failure()
+        first = breaker._prober
+        breaker.record_failure()
+        self.assertIs(breaker._prober, first)
+        healthy[0] = True
+        self.assertTrue(wait_for(lambda: breaker.state == CLOSED))
+        self.assertIsNone(breaker._prober)
+
+
+class HalfOpenTest(unittest.TestCase):
+    def test_trial_call_after_the_wait(self):
+        breaker = CircuitBreaker("test-half-open", failure_threshold=1, reset_timeout=0.05, max_reset_timeout=1)
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.state, HALF_OPEN)
+        # One trial per wait
+        self.assertFalse(breaker.allow())
+
+        # A failed trial reopens with a longer wait
+        breaker.record_failure()
+        self.assertEqual(breaker.state, OPEN)
+        self.assertEqual(breaker._delay, 0.1)
+        self.assertFalse(breaker.allow())
+
+        time.sleep(0.11)
+        self.assertTrue(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, CLOSED)
+        self.assertEqual(breaker._delay, 0.05)
+
+    def test_unreported_trial_does_not_wedge_the_breaker(self):
+        breaker = CircuitBreaker("test-lost-trial", failure_threshold=1, reset_timeout=0.03, max_reset_timeout=1)
+        breaker.record_failure()
+        time.sleep(0.04)
+        self.assertTrue(breaker.allow())
+        # The trial never reports back (e.g. it timed out in the rate-limit queue)
+        time.sleep(0.04)
+        self.assertTrue(breaker.allow())
+
+
+class RegistryTest(unittest.TestCase):
+    def tearDown(self):
+        circuit.reset()
+
+    def test_shared_breakers_and_stats(self):
+        breaker = circuit.breaker_for("example.test")
+        self.assertIs(circuit.breaker_for("example.test"), breaker)
+        self.assertFalse(circuit.any_open())
+
+        for _ in range(circuit.FAILURE_THRESHOLD):
+            breaker.record_failure()
+        self.assertTrue(circuit.any_open())
+        self.assertEqual(circuit.breaker_stats()["example.test"]["state"], OPEN)
+
+
+if __name__ == "__main__":
+    unittest.main()
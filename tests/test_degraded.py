@@ -0,0 +1,87 @@
+"""
+Degraded mode: when an upstream is down, the agents answer from expired
+cache entries and mark what they served, against replayed upstreams.
+"""
+import time
+import unittest
+
+import support
+
+from agents import weather_agent
+from agents.orchestrator import TourismAgent
+from utils import circuit, geocoding
+
+VIENNA = (48.2082, 16.3738)
+
+
+def expire(cache):
+    """
+    Marks every entry of an in-memory LRUCache as expired.
+    """
+    for key, (value, _) in list(cache._data.items()):
+        cache.set(key, value, time.time() - 1)
+
+
+class WeatherFallbackTest(unittest.TestCase):
+    def setUp(self):
+        self.upstreams = support.replay()
+
+    def test_expired_forecast_stands_in(self):
+        fresh = weather_agent.get_weather(*VIENNA)
+        self.assertNotIn("stale", fresh)
+        expire(weather_agent._forecast_cache)
+        self.upstreams.down.add("api.open-meteo.com")
+
+        stale = weather_agent.get_weather(*VIENNA)
+        self.assertTrue(stale["stale"])
+        self.assertEqual(stale["temperature"], fresh["temperature"])
+
+    def test_error_without_a_cached_forecast(self):
+        self.upstreams.down.add("api.open-meteo.com")
+        self.assertIn("error", weather_agent.get_weather(*VIENNA))
+
+
+class GeocodeFallbackTest(unittest.TestCase):
+    def setUp(self):
+        self.upstreams = support.replay()
+
+    def test_expired_entry_stands_in(self):
+        fresh = geocoding.get_coordinates("Ooty")
+        self.assertTrue(fresh["found"])
+        key = geocoding.normalize_place_name("Ooty")
+        geocoding._cache.set(key, fresh, -1)
+        self.upstreams.down.add("nominatim.openstreetmap.org")
+        self.upstreams.calls.clear()
+
+        self.assertEqual(geocoding.get_coordinates("Ooty"), fresh)
+        self.assertEqual(self.upstreams.calls["nominatim.openstreetmap.org"], 1)
+
+    def test_none_without_a_cached_entry(self):
+        self.upstreams.down.add("nominatim.openstreetmap.org")
+        self.assertIsNone(geocoding.get_coordinates("Ooty"))
+
+
+class OpenCircuitTest(unittest.TestCase):
+    def setUp(self):
+        self.upstreams = support.replay()
+        self.agent = TourismAgent(response_cache=False)
+
+    def tearDown(self):
+        circuit.reset()
+
+    def test_open_circuit_fails_fast_to_stale_data(self):
+        self.agent.process_request("trip to Vienna")
+        support.expire_tiles()
+        self.upstreams.down.add("overpass-api.de")
+        for _ in range(circuit.FAILURE_THRESHOLD):
+            self.agent.process_request("trip to Vienna")
+        self.assertTrue(circuit.any_open())
+
+        self.upstreams.calls.clear()
+        result = self.agent.process_request("trip to Vienna")
+        self.assertTrue(result["places"])
+        self.assertNotIn("overpass-api.de", self.upstreams.calls)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+"""
+Multi-day itineraries: planned from the attractions and forecast the agents
+already fetched, against replayed upstreams.
+"""
+import unittest
+from unittest import mock
+
+import support
+
+from agents import itinerary_agent
+from agents.itinerary_agent import STOPS_PER_DAY, cluster, plan_itinerary
+from agents.orchestrator import TourismAgent
+
+
+class ClusterTest(unittest.TestCase):
+    def test_groups_are_near_equal(self):
+        points = [(x * 1000.0, y * 1000.0) for x in range(4) for y in range(3)]
+        labels = cluster(points, 3)
+        self.assertEqual(sorted(labels.count(j) for j in range(3)), [4, 4, 4])
+
+    def test_colocated_points(self):
+        labels = cluster([(0.0, 0.0)] * 5, 4)
+        self.assertEqual(len(labels), 5)
+        self.assertTrue(all(0 <= label < 4 for label in labels))
+
+    def test_colocated_candidates_leave_a_day_free(self):
+        # Several attractions mapped to the same point used to crash the planner
+        candidates = [
+            {"name": f"Hall {i}", "lat": 48.2, "lon": 16.37, "category": "museum", "wikipedia": False, "wikidata": False}
+            for i in range(5)
+        ]
+        rainy = [("2026-10-19", 80), ("2026-10-20", 10), ("2026-10-21", 90), ("2026-10-22", None)]
+        with mock.patch.object(itinerary_agent.places_agent, "cached_candidates", return_value=candidates), \
+                mock.patch.object(itinerary_agent, "_day_weather", return_value=rainy):
+            itinerary = plan_itinerary(48.2, 16.37, 4)
+
+        self.assertEqual(len(itinerary), 4)
+        names = [stop["name"] for day in itinerary for stop in day["stops"]]
+        self.assertEqual(sorted(names), [f"Hall {i}" for i in range(5)])
+        self.assertEqual(sum(1 for day in itinerary if not day["stops"]), 1)
+
+
+class PlanTest(unittest.TestCase):
+    def setUp(self):
+        self.upstreams = support.replay()
+        self.agent = TourismAgent(response_cache=False)
+
+    def test_one_route_per_day(self):
+        result = self.agent.process_request("plan a 3 day trip to Vienna")
+        itinerary = result["itinerary"]
+        self.assertEqual([day["day"] for day in itinerary], [1, 2, 3])
+        self.assertEqual([len(day["stops"]) for day in itinerary], [STOPS_PER_DAY] * 3)
+        names = [stop["name"] for day in itinerary for stop in day["stops"]]
+        self.assertEqual(len(set(names)), len(names))
+        # The itinerary reuses the places agent's tiles
+        self.assertEqual(self.upstreams.calls["overpass-api.de"], 1)
+
+    def test_no_extra_calls_while_overpass_is_down(self):
+        self.agent.process_request("plan a 3 day trip to Vienna")
+        support.expire_tiles()
+        self.upstreams.down.add("overpass-api.de")
+        self.upstreams.calls.clear()
+
+        result = self.agent.process_request("plan a 3 day trip to Vienna")
+        # Only the places agent tried Overpass; both answered from the stale tiles
+        self.assertEqual(self.upstreams.calls, {"overpass-api.de": 1})
+        self.assertTrue(result["places"])
+        self.assertEqual(len(result["itinerary"]), 3)
+        self.assertTrue(all(day["stops"] for day in result["itinerary"]))
+
+    def test_single_day_has_no_itinerary(self):
+        self.assertNotIn("itinerary", self.agent.process_request("trip to Vienna"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+"""
+Query parser: locations, intents and trip length, "City, Region"
+qualifiers and multi-location lists.
+"""
+import unittest
+
+import support  # noqa: F401  (isolated caches, repo on sys.path)
+
+from agents.query_parser import MAX_LOCATIONS, extract_location, parse_query
+
+
+class SingleLocationTest(unittest.TestCase):
+    def test_travel_phrases(self):
+        self.assertEqual(extract_location("I'm going to Bangalore, let's plan my trip"), "Bangalore")
+        self.assertEqual(extract_location("weather in New York please"), "New York")
+        self.assertEqual(extract_location("Bangalore"), "Bangalore")
+
+    def test_intents_and_days(self):
+        parsed = parse_query("What's the weather in Kyoto, staying 4 days")
+        self.assertEqual(parsed["location"], "Kyoto")
+        self.assertTrue(parsed["show_weather"])
+        self.assertFalse(parsed["show_places"])
+        self.assertEqual(parsed["num_days"], 4)
+
+    def test_no_location(self):
+        self.assertIn("error", parse_query("What is the weather like"))
+        # A leading phrase ended by a comma is not a list of places
+        self.assertIn("error", parse_query("What is the weather in Kyoto, 4 days from now"))
+
+
+class RegionQualifierTest(unittest.TestCase):
+    """
+    "City, Region" names one place; the comma must not start a comparison.
+    """
+
+    def test_city_country(self):
+        for query, location in [
+            ("I'm going to Paris, France for 3 days", "Paris"),
+            ("trip to Kochi, Kerala", "Kochi"),
+            ("weather in Springfield, Illinois", "Springfield"),
+            ("visit New York, NY", "New York"),
+        ]:
+            with self.subTest(query=query):
+                parsed = parse_query(query)
+                self.assertEqual(parsed["locations"], [location])
+                self.assertEqual(parsed["location"], location)
+
+    def test_days_still_read_after_qualifier(self):
+        self.assertEqual(parse_query("I'm going to Paris, France for 3 days")["num_days"], 3)
+
+
+class LocationListTest(unittest.TestCase):
+    def test_lists(self):
+        for query, locations in [
+            ("Rome or Paris?", ["Rome", "Paris"]),
+            ("compare Vienna and Prague", ["Vienna", "Prague"]),
+            ("compare Rome, Paris", ["Rome", "Paris"]),
+            ("Should I visit Lisbon or Porto?", ["Lisbon", "Porto"]),
+            ("I'm going to Kochi, Munnar and Alappuzha", ["Kochi", "Munnar", "Alappuzha"]),
+            ("weather in Kyoto vs Osaka", ["Kyoto", "Osaka"]),
+        ]:
+            with self.subTest(query=query):
+                parsed = parse_query(query)
+                self.assertEqual(parsed["locations"], locations)
+                self.assertEqual(parsed["location"], locations[0])
+
+    def test_list_stops_at_intent_words(self):
+        parsed = parse_query("weather in Kyoto and places to see")
+        self.assertEqual(parsed["locations"], ["Kyoto"])
+        self.assertTrue(parsed["show_weather"])
+        self.assertTrue(parsed["show_places"])
+
+    def test_and_followed_by_something_else(self):
+        for query, location in [
+            ("I'm going to Paris and need help", "Paris"),
+            ("going to Rome and eat pasta", "Rome"),
+            ("trip to Goa and enjoy", "Goa"),
+            ("I'm travelling to Munnar and staying 3 days", "Munnar"),
+            ("weather in London and packing list", "London"),
+            ("going to Rome and then Florence", "Rome"),
+        ]:
+            with self.subTest(query=query):
+                self.assertEqual(parse_query(query)["locations"], [location])
+
+    def test_lowercase_places_the_gazetteer_knows(self):
+        self.assertEqual(parse_query("compare rome and paris")["locations"], ["Rome", "Paris"])
+
+    def test_opening_interjection(self):
+        self.assertEqual(parse_query("Hmm, Rome or Paris?")["locations"], ["Rome", "Paris"])
+        self.assertEqual(parse_query("So, Lisbon or Porto?")["locations"], ["Lisbon", "Porto"])
+
+    def test_same_place_twice_is_not_a_comparison(self):
+        self.assertEqual(parse_query("Rome or rome?")["locations"], ["Rome"])
+        self.assertEqual(parse_query("compare Rome and Rome")["locations"], ["Rome"])
+
+    def test_list_is_capped(self):
+        parsed = parse_query("compare Rome, Paris, Vienna, Prague, Lisbon, Porto and Madrid")
+        self.assertEqual(len(parsed["locations"]), MAX_LOCATIONS)
+        self.assertEqual(parsed["locations"][:2], ["Rome", "Paris"])
+
+
+if __name__ == "__main__":
+    unittest.main()
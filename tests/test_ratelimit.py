@@ -0,0 +1,231 @@
+"""
+Rate-limit primitives: token bucket pacing, cross-process sharing, slot pool
+and the governor's priority queue (threads and coroutines).
+"""
+import asyncio
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+import support  # noqa: F401  (isolated caches, repo on sys.path)
+
+from utils.ratelimit import PRIORITY_BACKGROUND, PRIORITY_LIVE, Governor, SlotPool, TokenBucket, fcntl
+
+
+def hold_file_lock(path):
+    """
+    Locks a bucket file the way another worker process would. Returns the
+    open file; closing it releases the lock.
+    """
+    f = open(path, "a+")
+    fcntl.flock(f, fcntl.LOCK_EX)
+    return f
+
+
+async def count_ticks(coro):
+    """
+    Awaits coro while a ticker runs on the same loop. Returns (result, ticks);
+    few ticks mean the coroutine blocked the loop.
+    """
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        while True:
+            ticks += 1
+            await asyncio.sleep(0.01)
+
+    task = asyncio.ensure_future(ticker())
+    try:
+        return await coro, ticks
+    finally:
+        task.cancel()
+
+
+class StateDirTest(unittest.TestCase):
+    def setUp(self):
+        self.state_dir = tempfile.mkdtemp(prefix="tourism-ratelimit-test-")
+
+    def tearDown(self):
+        shutil.rmtree(self.state_dir, True)
+
+
+class TokenBucketTest(StateDirTest):
+    def test_burst_then_pacing(self):
+        bucket = TokenBucket("pace", rate=20, burst=2, state_dir=self.state_dir)
+        self.assertEqual(bucket.try_take(), 0)
+        self.assertEqual(bucket.try_take(), 0)
+        wait = bucket.try_take()
+        self.assertGreater(wait, 0)
+        self.assertLessEqual(wait, 1 / 20)
+
+        time.sleep(wait + 0.01)
+        self.assertEqual(bucket.try_take(), 0)
+
+    def test_buckets_with_the_same_name_share_tokens(self):
+        # Two instances stand in for two worker processes
+        first = TokenBucket("shared", rate=0.1, burst=1, state_dir=self.state_dir)
+        second = TokenBucket("shared", rate=0.1, burst=1, state_dir=self.state_dir)
+        self.assertEqual(first.try_take(), 0)
+        self.assertGreater(second.try_take(), 0)
+
+    def test_block_pauses_every_holder(self):
+        bucket = TokenBucket("block", rate=100, burst=5, state_dir=self.state_dir)
+        bucket.block(0.5)
+        wait = bucket.try_take()
+        self.assertGreater(wait, 0.4)
+        self.assertEqual(bucket.available(), 0)
+
+    @unittest.skipIf(fcntl is None, "needs fcntl")
+    def test_non_blocking_take_while_another_process_holds_the_bucket(self):
+        bucket = TokenBucket("busy", rate=10, burst=1, state_dir=self.state_dir)
+        held = hold_file_lock(bucket.path)
+        start = time.monotonic()
+        self.assertIsNone(bucket.try_take(blocking=False))
+        self.assertLess(time.monotonic() - start, 0.05)
+
+        held.close()
+        self.assertEqual(bucket.try_take(blocking=False), 0)
+
+
+class SlotPoolTest(StateDirTest):
+    def test_timeout_when_full_and_reuse_after_release(self):
+        pool = SlotPool("slots", 1, state_dir=self.state_dir)
+        handle = pool.acquire(0.1)
+        self.assertIsNotNone(handle)
+        self.assertIsNone(pool.acquire(0.1))
+
+        pool.release(handle)
+        handle = pool.acquire(0.1)
+        self.assertIsNotNone(handle)
+        pool.release(handle)
+
+    def test_async_acquire_times_out_without_blocking_the_loop(self):
+        pool = SlotPool("slots-async", 1, state_dir=self.state_dir)
+
+        async def scenario():
+            handle = await pool.acquire_async(0.1)
+            ticks = 0
+
+            async def ticker():
+                nonlocal ticks
+                while True:
+                    ticks += 1
+                    await asyncio.sleep(0.01)
+
+            task = asyncio.ensure_future(ticker())
+            second = await pool.acquire_async(0.1)
+            task.cancel()
+            pool.release(handle)
+            return second, ticks
+
+        second, ticks = asyncio.run(scenario())
+        self.assertIsNone(second)
+        self.assertGreater(ticks, 3)
+
+
+class GovernorTest(StateDirTest):
+    def test_paces_acquisitions_to_the_rate(self):
+        governor = Governor("paced", rate=20, burst=1, state_dir=self.state_dir)
+        start = time.monotonic()
+        for _ in range(5):
+            self.assertTrue(governor.acquire(timeout=2))
+        # One token up front, then one every 50 ms
+        self.assertGreaterEqual(time.monotonic() - start, 0.18)
+        self.assertEqual(governor.snapshot()["acquired"], 5)
+
+    def test_queue_timeout_cancels_the_waiter(self):
+        governor = Governor("timeout", rate=0.5, burst=1, state_dir=self.state_dir)
+        self.assertTrue(governor.acquire(timeout=1))
+        start = time.monotonic()
+        self.assertFalse(governor.acquire(timeout=0.1))
+        self.assertLess(time.monotonic() - start, 0.5)
+
+        stats = governor.snapshot()
+        self.assertEqual(stats["cancelled"], 1)
+        self.assertEqual(stats["queue_depth"], 0)
+
+    def test_live_requests_go_before_background_ones(self):
+        governor = Governor("priority", rate=10, burst=1, state_dir=self.state_dir)
+        self.assertTrue(governor.acquire(timeout=1))
+        order = []
+
+        def waiter(name, priority):
+            if governor.acquire(priority=priority, timeout=2):
+                order.append(name)
+
+        background = threading.Thread(target=waiter, args=("background", PRIORITY_BACKGROUND))
+        background.start()
+        time.sleep(0.02)
+        live = threading.Thread(target=waiter, args=("live", PRIORITY_LIVE))
+        live.start()
+        background.join()
+        live.join()
+        self.assertEqual(order, ["live", "background"])
+
+    def test_async_waiters_share_the_queue_without_threads(self):
+        governor = Governor("async", rate=20, burst=1, state_dir=self.state_dir)
+
+        async def scenario():
+            threads = threading.active_count()
+            results = await asyncio.gather(*(governor.acquire_async(timeout=0.3) for _ in range(50)))
+            return results, threading.active_count() - threads
+
+        results, extra_threads = asyncio.run(scenario())
+        # About 0.3 s of tokens at 20/s: a handful get through, the rest time out
+        self.assertGreaterEqual(sum(results), 3)
+        self.assertGreater(results.count(False), 30)
+        self.assertEqual(extra_threads, 0)
+        self.assertEqual(governor.snapshot()["queue_depth"], 0)
+
+    def test_cancelled_async_waiter_leaves_the_queue(self):
+        governor = Governor("async-cancel", rate=0.5, burst=1, state_dir=self.state_dir)
+        self.assertTrue(governor.acquire(timeout=1))
+
+        async def scenario():
+            task = asyncio.ensure_future(governor.acquire_async(timeout=5))
+            await asyncio.sleep(0.05)
+            self.assertEqual(governor.snapshot()["queue_depth"], 1)
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+        asyncio.run(scenario())
+        self.assertEqual(governor.snapshot()["queue_depth"], 0)
+
+    @unittest.skipIf(fcntl is None, "needs fcntl")
+    def test_async_waiter_does_not_block_on_a_locked_bucket(self):
+        governor = Governor("async-locked", rate=10, burst=1, state_dir=self.state_dir)
+        held = hold_file_lock(governor.bucket.path)
+        release = threading.Timer(0.2, held.close)
+        release.start()
+
+        acquired, ticks = asyncio.run(count_ticks(governor.acquire_async(timeout=2)))
+        release.join()
+        self.assertTrue(acquired)
+        self.assertGreater(ticks, 10)
+
+    def test_async_waiter_does_not_block_on_a_thread_holding_the_queue(self):
+        governor = Governor("async-queue", rate=10, burst=1, state_dir=self.state_dir)
+        holding = threading.Event()
+
+        def hold():
+            with governor._cond:
+                holding.set()
+                time.sleep(0.2)
+
+        holder = threading.Thread(target=hold)
+        holder.start()
+        holding.wait(1)
+        acquired, ticks = asyncio.run(count_ticks(governor.acquire_async(timeout=2)))
+        holder.join()
+        self.assertTrue(acquired)
+        self.assertGreater(ticks, 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
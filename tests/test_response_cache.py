@@ -0,0 +1,52 @@
+"""
+Response cache: complete answers are reused for equivalent requests, and
+answers built from degraded upstream data are not.
+"""
+import unittest
+
+import support
+
+from agents.orchestrator import TourismAgent
+
+
+class ResponseCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.upstreams = support.replay()
+        self.agent = TourismAgent()
+
+    def test_equivalent_requests_share_an_answer(self):
+        first = self.agent.process_request("plan my trip to Vienna")
+        second = self.agent.process_request("going to vienna, help me plan")
+        self.assertNotIn("cache", first)
+        self.assertEqual(second["cache"], "hit")
+        self.assertEqual(second["places"], first["places"])
+
+    def test_stale_attractions_are_not_cached(self):
+        TourismAgent(response_cache=False).process_request("trip to Vienna")
+        support.expire_tiles()
+        self.upstreams.down.add("overpass-api.de")
+
+        degraded = self.agent.process_request("trip to Vienna")
+        self.assertTrue(degraded["places"])
+        self.assertNotIn("cache", self.agent.process_request("trip to Vienna"))
+
+        # Once Overpass is back the answer is fetched again, then reused
+        self.upstreams.down.clear()
+        self.upstreams.calls.clear()
+        self.assertNotIn("cache", self.agent.process_request("trip to Vienna"))
+        self.assertEqual(self.upstreams.calls["overpass-api.de"], 1)
+        self.assertEqual(self.agent.process_request("trip to Vienna")["cache"], "hit")
+
+    def test_missing_attractions_are_not_cached(self):
+        self.upstreams.down.add("overpass-api.de")
+        self.assertEqual(self.agent.process_request("trip to Vienna")["places"], [])
+        self.assertNotIn("cache", self.agent.process_request("trip to Vienna"))
+
+    def test_comparison_with_missing_attractions_is_not_cached(self):
+        self.upstreams.down.add("overpass-api.de")
+        self.agent.process_request("compare Vienna and Prague")
+        self.assertNotIn("cache", self.agent.process_request("compare Vienna and Prague"))
+
+
+if __name__ == "__main__":
+    unittest.main()
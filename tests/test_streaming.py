@@ -0,0 +1,82 @@
+"""
+Server-Sent Events: iter_request's events as each stage finishes, and the
+/api/chat/stream route that sends them, against replayed upstreams.
+"""
+import json
+import unittest
+
+import support
+
+from agents.orchestrator import TourismAgent
+from api import index
+
+
+def parse_sse(body):
+    """
+    Returns [(event, data)] from a text/event-stream body.
+    """
+    events = []
+    for block in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+class IterRequestTest(unittest.TestCase):
+    def setUp(self):
+        support.replay()
+        self.agent = TourismAgent()
+
+    def test_stages_in_order(self):
+        events = list(self.agent.iter_request("plan a 2 day trip to Vienna"))
+        names = [event for event, _ in events]
+        self.assertEqual(names[:2], ["location", "tips"])
+        self.assertEqual(sorted(names[2:4]), ["places", "weather"])
+        self.assertEqual(names[4:], ["advice", "done"])
+
+        data = dict(events)
+        self.assertEqual(data["location"]["days"], 2)
+        self.assertTrue(data["places"]["places"])
+        self.assertEqual(len(data["advice"]["itinerary"]), 2)
+        self.assertIn("total", data["done"]["timings"])
+
+    def test_cached_answer_replays_the_same_events(self):
+        first = list(self.agent.iter_request("trip to Vienna"))
+        second = list(self.agent.iter_request("going to vienna"))
+        self.assertEqual([event for event, _ in second], [event for event, _ in first])
+        self.assertEqual(dict(second)["done"]["cache"], "hit")
+        self.assertEqual(dict(second)["places"], dict(first)["places"])
+
+    def test_comparison_is_one_event(self):
+        events = list(self.agent.iter_request("Rome or Paris?"))
+        self.assertEqual([event for event, _ in events], ["comparison", "done"])
+        self.assertEqual([row["city"] for row in events[0][1]["summary"]], ["Rome", "Paris"])
+
+    def test_unknown_location(self):
+        self.assertEqual([event for event, _ in self.agent.iter_request("What is the weather like")], ["error"])
+
+
+class StreamRouteTest(unittest.TestCase):
+    def setUp(self):
+        support.replay()
+        index.agent = TourismAgent()
+        self.client = index.app.test_client()
+
+    def tearDown(self):
+        index.agent = None
+
+    def test_event_stream(self):
+        response = self.client.post("/api/chat/stream", json={"message": "trip to Vienna"})
+        self.assertEqual(response.mimetype, "text/event-stream")
+        self.assertEqual(response.headers["Cache-Control"], "no-cache")
+        events = parse_sse(response.get_data(as_text=True))
+        self.assertEqual(events[0][0], "location")
+        self.assertEqual(events[-1][0], "done")
+        self.assertTrue(dict(events)["places"]["places"])
+
+    def test_empty_message(self):
+        self.assertEqual(self.client.post("/api/chat/stream", json={"message": ""}).status_code, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,147 @@
+"""
+Travel advisor knowledge base: city tips, budget tiers and the regions that
+select them, loaded from data/advisor.json (or TOURISM_ADVISOR_DATA).
+
+The file is indexed once per load. Edits are picked up without a restart:
+the file's modification time is checked at most every RELOAD_INTERVAL
+seconds and a changed file is re-indexed and swapped in.
+"""
+import json
+import os
+import threading
+import time
+
+from utils.gazetteer import normalize_name
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "advisor.json")
+
+RELOAD_INTERVAL = 5  # seconds between modification checks
+
+
+class PhraseIndex:
+    """
+    Word-level trie of normalized phrases ("new york" -> node "new" -> node
+    "york"). Scanning a text is a dict lookup per word and phrase length, so
+    the cost depends on the text, not on how many phrases are indexed.
+    """
+
+    def __init__(self):
+        self.root = {}
+
+    def add(self, phrase, value):
+        node = self.root
+        for word in normalize_name(phrase).split():
+            node = node.setdefault(word, {})
+        # Words are never empty, so "" marks the end of a phrase; the first value added wins
+        node.setdefault("", value)
+
+    def matches(self, text):
+        """
+        Yields the value of every indexed phrase found in text, left to right.
+        """
+        words = normalize_name(text).split()
+        for start in range(len(words)):
+            node = self.root
+            for word in words[start:]:
+                node = node.get(word)
+                if node is None:
+                    break
+                if "" in node:
+                    yield node[""]
+
+
+class KnowledgeBase:
+    """
+    Indexed advisor data. Exact city names are a hash lookup; names inside
+    longer strings ("New York City", "Rome, Lazio, Italia") go through the
+    phrase trie.
+    """
+
+    def __init__(self, data):
+        self.default_tips = list(data.get("default_tips", []))
+        self.budget_tiers = dict(data.get("budget_tiers", {}))
+        self.default_tier = data.get("default_tier")
+
+        self.tips_by_name = {}
+        self.tip_phrases = PhraseIndex()
+        for entry in data.get("city_tips", []):
+            tips = list(entry["tips"])
+            for name in entry["names"]:
+                self.tips_by_name.setdefault(normalize_name(name), tips)
+                self.tip_phrases.add(name, tips)
+
+        # Earlier regions take priority when a name matches several
+        self.region_phrases = PhraseIndex()
+        for priority, region in enumerate(data.get("regions", [])):
+            for phrase in region["match"]:
+                self.region_phrases.add(phrase, (priority, region["tier"]))
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def tips_for(self, city_name):
+        """
+        Tips for a city (exact name or alias, else a known city named within
+        city_name), or the default tips.
+        """
+        tips = self.tips_by_name.get(normalize_name(city_name))
+        if tips is None:
+            tips = next(self.tip_phrases.matches(city_name), None)
+        return list(tips if tips is not None else self.default_tips)
+
+    def budget_for(self, *names):
+        """
+        Budget tier for a place, from the highest-priority region named in any
+        of the given names, or the default tier. Empty if neither applies.
+        """
+        best = None
+        for name in names:
+            for match in self.region_phrases.matches(name):
+                if best is None or match < best:
+                    best = match
+        tier = best[1] if best else self.default_tier
+        return dict(self.budget_tiers.get(tier, {}))
+
+
+_kb = None
+_kb_mtime = None
+_last_check = 0.0
+_lock = threading.Lock()
+
+def _path():
+    return os.environ.get("TOURISM_ADVISOR_DATA", DEFAULT_PATH)
+
+def reload(force=False):
+    """
+    Re-reads the data file if it changed since the last load (or always, with
+    force). A file that fails to load leaves the current knowledge in place.
+    Returns the active KnowledgeBase.
+    """
+    global _kb, _kb_mtime, _last_check
+    with _lock:
+        _last_check = time.monotonic()
+        path = _path()
+        mtime = None
+        try:
+            mtime = os.stat(path).st_mtime_ns
+            if force or _kb is None or mtime != _kb_mtime:
+                _kb = KnowledgeBase.from_file(path)
+                _kb_mtime = mtime
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"Advisor knowledge not loaded: {e}")
+            # Don't retry a broken file until it changes again
+            _kb_mtime = mtime
+            if _kb is None:
+                _kb = KnowledgeBase({})
+        return _kb
+
+def get_knowledge_base():
+    """
+    Returns the current KnowledgeBase, loading it on first use and picking up
+    file changes every RELOAD_INTERVAL seconds.
+    """
+    if _kb is None or time.monotonic() - _last_check >= RELOAD_INTERVAL:
+        return reload()
+    return _kb
@@ -0,0 +1,263 @@
+"""
+Offline attraction index built from a local OpenStreetMap extract.
+
+Build once per region:
+
+    python -m utils.attraction_index build kerala.osm.pbf data/attractions
+    python -m utils.attraction_index build export.geojson data/attractions --bbox 9.8,76.1,10.1,76.4
+
+The index directory holds:
+    coords.bin  packed float64 (lat, lon) pairs, grouped by grid cell; memory-mapped on load
+    meta.json   grid cell offsets, coverage boxes, and the name/tags of each point
+
+.osm.pbf input needs the optional 'osmium' package; Overpass JSON and GeoJSON
+exports are read with the standard library.
+"""
+import json
+import mmap
+import os
+from array import array
+
+from utils.geo import haversine_m, radius_bbox, tile_of
+
+INDEX_VERSION = 1
+
+# Grid cell size in degrees; a 5 km radius query touches a handful of cells
+CELL_DEG = 0.05
+
+# Where get_places looks for an index unless TOURISM_ATTRACTION_INDEX is set
+DEFAULT_INDEX_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "attractions")
+
+
+class AttractionIndex:
+    """
+    Read-only grid index over attraction points, answering radius queries locally.
+    """
+
+    def __init__(self, path):
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != INDEX_VERSION:
+            raise ValueError(f"Unsupported attraction index version: {meta.get('version')}")
+
+        self.path = path
+        self.cell_deg = meta["cell_deg"]
+        self.coverage = [tuple(box) for box in meta["coverage"]]
+        self.cells = {tuple(map(int, key.split(":"))): span for key, span in meta["cells"].items()}
+        self.names = meta["names"]
+        self.tags = meta["tags"]
+
+        self._file = open(os.path.join(path, "coords.bin"), "rb")
+        if os.fstat(self._file.fileno()).st_size:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.coords = memoryview(self._mmap).cast("d")
+        else:
+            self._mmap = None
+            self.coords = array("d")
+
+    def __len__(self):
+        return len(self.names)
+
+    def covers(self, lat, lon, radius_m):
+        """
+        True if the whole circle lies inside one of the extract's coverage boxes.
+        """
+        south, west, north, east = radius_bbox(lat, lon, radius_m)
+        return any(
+            s <= south and w <= west and north <= n and east <= e
+            for s, w, n, e in self.coverage
+        )
+
+    def query(self, lat, lon, radius_m):
+        """
+        Returns the attractions within radius_m of a point, nearest first, in the
+        same {name, lat, lon, tags} shape the places agent caches.
+        """
+        south, west, north, east = radius_bbox(lat, lon, radius_m)
+        row0, col0 = tile_of(south, west, self.cell_deg)
+        row1, col1 = tile_of(north, east, self.cell_deg)
+        coords = self.coords
+
+        hits = []
+        for row in range(row0, row1 + 1):
+            for col in range(col0, col1 + 1):
+                span = self.cells.get((row, col))
+                if not span:
+                    continue
+                for i in range(span[0], span[1]):
+                    plat = coords[2 * i]
+                    plon = coords[2 * i + 1]
+                    if not (south <= plat <= north and west <= plon <= east):
+                        continue
+                    distance = haversine_m(lat, lon, plat, plon)
+                    if distance <= radius_m:
+                        hits.append((distance, i))
+
+        hits.sort()
+        return [
+            {"name": self.names[i], "lat": coords[2 * i], "lon": coords[2 * i + 1], "tags": self.tags[i]}
+            for _, i in hits
+        ]
+
+
+_index = None
+_index_loaded = False
+
+def get_index():
+    """
+    Returns the configured AttractionIndex, loading it on first use, or None if
+    no index has been built.
+    """
+    global _index, _index_loaded
+    if not _index_loaded:
+        _index_loaded = True
+        path = os.environ.get("TOURISM_ATTRACTION_INDEX", DEFAULT_INDEX_DIR)
+        if os.path.exists(os.path.join(path, "meta.json")):
+            try:
+                _index = AttractionIndex(path)
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Attraction index not loaded: {e}")
+    return _index
+
+
+# --- Build step ---
+
+def _matches(tags, feature_tags):
+    if not tags.get("name"):
+        return False
+    return any(tags.get(key) in values for key, values in feature_tags.items())
+
+def _centroid(points):
+    points = [p for p in points if p is not None]
+    if not points:
+        return None
+    return (sum(p[0] for p in points) / len(points), sum(p[1] for p in points) / len(points))
+
+def _read_overpass_json(data):
+    for element in data.get("elements", []):
+        if "lat" in element:
+            point = (element["lat"], element["lon"])
+        elif "center" in element:
+            point = (element["center"]["lat"], element["center"]["lon"])
+        else:
+            point = _centroid([(g["lat"], g["lon"]) for g in element.get("geometry", [])])
+        yield point, element.get("tags", {})
+
+def _read_geojson(data):
+    for feature in data.get("features", []):
+        geometry = feature.get("geometry") or {}
+        coords = geometry.get("coordinates")
+        kind = geometry.get("type")
+        if kind == "Point":
+            point = (coords[1], coords[0])
+        elif kind in ("LineString", "MultiPoint"):
+            point = _centroid([(c[1], c[0]) for c in coords])
+        elif kind == "Polygon":
+            point = _centroid([(c[1], c[0]) for c in coords[0]])
+        elif kind == "MultiPolygon":
+            point = _centroid([(c[1], c[0]) for polygon in coords for c in polygon[0]])
+        else:
+            point = None
+        properties = feature.get("properties") or {}
+        yield point, properties.get("tags", properties)
+
+def _read_pbf(path, feature_tags):
+    try:
+        import osmium
+    except ImportError:
+        raise SystemExit("Reading .osm.pbf extracts requires the 'osmium' package (pip install osmium)")
+
+    found = []
+
+    class Handler(osmium.SimpleHandler):
+        def node(self, n):
+            tags = dict(n.tags)
+            if _matches(tags, feature_tags):
+                found.append(((n.location.lat, n.location.lon), tags))
+
+        def way(self, w):
+            tags = dict(w.tags)
+            if _matches(tags, feature_tags):
+                found.append((_centroid([(nd.lat, nd.lon) for nd in w.nodes if nd.location.valid()]), tags))
+
+    Handler().apply_file(path, locations=True)
+    bbox = None
+    reader = osmium.io.Reader(path, osmium.osm.osm_entity_bits.NOTHING)
+    header_box = reader.header().box()
+    reader.close()
+    if header_box.valid():
+        bbox = (header_box.bottom_left.lat, header_box.bottom_left.lon, header_box.top_right.lat, header_box.top_right.lon)
+    return found, bbox
+
+def build_index(source, out_dir, bbox=None, cell_deg=CELL_DEG):
+    """
+    Extracts attraction features from an OSM extract and writes an index to out_dir.
+    Relations in .osm.pbf input are skipped; JSON exports should use 'out center'.
+    Returns the number of indexed points.
+    """
+    from agents.places_agent import FEATURE_TAGS, KEPT_TAGS
+
+    if source.endswith(".pbf"):
+        features, header_bbox = _read_pbf(source, FEATURE_TAGS)
+        bbox = bbox or header_bbox
+    else:
+        with open(source, encoding="utf-8") as f:
+            data = json.load(f)
+        reader = _read_geojson if data.get("type") == "FeatureCollection" else _read_overpass_json
+        features = [(point, tags) for point, tags in reader(data) if _matches(tags, FEATURE_TAGS)]
+
+    records = []
+    seen = set()
+    for point, tags in features:
+        if point is None:
+            continue
+        key = (tags["name"], round(point[0], 5), round(point[1], 5))
+        if key in seen:
+            continue
+        seen.add(key)
+        records.append((tile_of(point[0], point[1], cell_deg), point, {k: tags[k] for k in KEPT_TAGS if k in tags}))
+    records.sort(key=lambda r: r[0])
+
+    if bbox is None and records:
+        lats = [r[1][0] for r in records]
+        lons = [r[1][1] for r in records]
+        bbox = (min(lats), min(lons), max(lats), max(lons))
+
+    coords = array("d")
+    cells = {}
+    for i, (cell, point, _) in enumerate(records):
+        coords.extend(point)
+        key = f"{cell[0]}:{cell[1]}"
+        cells.setdefault(key, [i, i])[1] = i + 1
+
+    os.makedirs(out_dir, exist_ok=True)
+    with open(os.path.join(out_dir, "coords.bin"), "wb") as f:
+        coords.tofile(f)
+    with open(os.path.join(out_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "version": INDEX_VERSION,
+            "cell_deg": cell_deg,
+            "coverage": [list(bbox)] if bbox else [],
+            "cells": cells,
+            "names": [r[2]["name"] for r in records],
+            "tags": [r[2] for r in records],
+        }, f, ensure_ascii=False, separators=(",", ":"))
+    return len(records)
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Offline attraction index tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="Build an index from an .osm.pbf, Overpass JSON or GeoJSON extract")
+    build.add_argument("source")
+    build.add_argument("out_dir", nargs="?", default=DEFAULT_INDEX_DIR)
+    build.add_argument("--bbox", help="Coverage box 'south,west,north,east' (defaults to the extract bounds)")
+    args = parser.parse_args(argv)
+
+    bbox = tuple(float(x) for x in args.bbox.split(",")) if args.bbox else None
+    count = build_index(args.source, args.out_dir, bbox=bbox)
+    print(f"Indexed {count} attractions into {args.out_dir}")
+
+if __name__ == "__main__":
+    main()
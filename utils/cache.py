@@ -0,0 +1,339 @@
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from utils.snapshot import get_snapshot
+
+# Directory holding the on-disk cache files. It is shared by every worker
+# process on the host, so a lookup made by one worker is reused by the others.
+CACHE_DIR = os.environ.get("TOURISM_CACHE_DIR", os.path.join(tempfile.gettempdir(), "tourism-cache"))
+
+# Sentinel returned on a cache miss (None is a valid cached value).
+MISS = object()
+
+
+class LRUCache:
+    """
+    Thread-safe in-process LRU cache where every entry carries its own expiry time.
+    Expired entries are kept for stale_ttl more seconds for get_stale().
+    """
+
+    def __init__(self, max_entries=1024, stale_ttl=0):
+        self.max_entries = max_entries
+        self.stale_ttl = stale_ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return MISS
+            value, expires_at = entry
+            if expires_at <= time.time():
+                if expires_at + self.stale_ttl <= time.time():
+                    del self._data[key]
+                return MISS
+            self._data.move_to_end(key)
+            return value
+
+    def get_stale(self, key):
+        """
+        Returns the value even if it has expired (within stale_ttl), else MISS.
+        For answering while the upstream that refreshes it is down.
+        """
+        with self._lock:
+            entry = self._data.get(key)
+        if entry is None or entry[1] + self.stale_ttl <= time.time():
+            return MISS
+        return entry[0]
+
+    def peek(self, key):
+        """
+        Returns (value, expires_at) for a live entry without touching its LRU position, else MISS.
+        """
+        with self._lock:
+            entry = self._data.get(key)
+        if entry is None or entry[1] <= time.time():
+            return MISS
+        return entry
+
+    def set(self, key, value, expires_at):
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteStore:
+    """
+    JSON key/value table in a SQLite file. Survives restarts and can be used
+    from several processes at once (WAL mode).
+    """
+
+    # Expired rows and rows over max_entries are purged every this many writes
+    PURGE_EVERY = 100
+
+    def __init__(self, path, table="cache", max_entries=None, stale_ttl=0):
+        self.path = path
+        self.table = table
+        self.max_entries = max_entries
+        self.stale_ttl = stale_ttl
+        self._local = threading.local()
+        self._writes = 0
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            conn.commit()
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        """
+        Returns (value, expires_at) for a live entry, else MISS.
+        """
+        row = self._connect().execute(
+            f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or row[1] <= time.time():
+            return MISS
+        return json.loads(row[0]), row[1]
+
+    def get_stale(self, key):
+        """
+        Returns (value, expires_at) even if expired (within stale_ttl), else MISS.
+        """
+        row = self._connect().execute(
+            f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or row[1] + self.stale_ttl <= time.time():
+            return MISS
+        return json.loads(row[0]), row[1]
+
+    def set(self, key, value, expires_at):
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), expires_at),
+            )
+        self._writes += 1
+        if self._writes % self.PURGE_EVERY == 0:
+            self.purge()
+
+    def delete(self, key):
+        conn = self._connect()
+        with conn:
+            conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+
+    def purge(self):
+        """
+        Drops rows expired for longer than stale_ttl, then the
+        soonest-to-expire rows above max_entries.
+        """
+        conn = self._connect()
+        with conn:
+            conn.execute(f"DELETE FROM {self.table} WHERE expires_at <= ?", (time.time() - self.stale_ttl,))
+            if self.max_entries:
+                conn.execute(
+                    f"DELETE FROM {self.table} WHERE key IN (SELECT key FROM {self.table} "
+                    "ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+
+    def clear(self):
+        conn = self._connect()
+        with conn:
+            conn.execute(f"DELETE FROM {self.table}")
+
+    def raw_items(self):
+        """
+        Yields (key, JSON text, expires_at) for every live entry.
+        """
+        yield from self._connect().execute(
+            f"SELECT key, value, expires_at FROM {self.table} WHERE expires_at > ?", (time.time(),)
+        )
+
+
+class TieredCache:
+    """
+    In-process LRU in front of a shared SQLite store, with hit/miss counters.
+    Disk misses fall back to the read-only startup snapshot (utils/snapshot.py)
+    if it has a table with the cache's name.
+
+    If the disk tier can't be opened (e.g. read-only filesystem) the cache keeps
+    working as memory-only. Both tiers keep expired entries for stale_ttl
+    seconds for get_stale().
+    """
+
+    def __init__(self, name, memory_entries=1024, disk_entries=None, path=None, stale_ttl=0):
+        self.name = name
+        self.memory = LRUCache(memory_entries, stale_ttl)
+        self.disk = SQLiteStore(path or os.path.join(CACHE_DIR, "cache.sqlite3"), table=name,
+                                max_entries=disk_entries, stale_ttl=stale_ttl)
+        self.disk_enabled = True
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "snapshot_hits": 0, "misses": 0, "stale_hits": 0}
+
+    def _disk_call(self, method, *args):
+        if not self.disk_enabled:
+            return MISS
+        try:
+            return getattr(self.disk, method)(*args)
+        except (sqlite3.Error, OSError) as e:
+            print(f"Cache '{self.name}' disk tier disabled: {e}")
+            self.disk_enabled = False
+            return MISS
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is not MISS:
+            self.counters["memory_hits"] += 1
+            return value
+
+        entry = self._disk_call("get", key)
+        if entry is not MISS:
+            value, expires_at = entry
+            self.memory.set(key, value, expires_at)
+            self.counters["disk_hits"] += 1
+            return value
+
+        snapshot = get_snapshot()
+        entry = snapshot.get(self.name, key) if snapshot is not None else None
+        if entry is not None:
+            value, expires_at = entry
+            self.memory.set(key, value, expires_at)
+            self.counters["snapshot_hits"] += 1
+            return value
+
+        self.counters["misses"] += 1
+        return MISS
+
+    def peek(self, key):
+        """
+        Returns (value, expires_at) from the memory or disk tier without
+        counting a hit or miss, else MISS.
+        """
+        entry = self.memory.peek(key)
+        if entry is MISS:
+            entry = self._disk_call("get", key)
+        return entry
+
+    def get_stale(self, key):
+        """
+        Returns a value even if it has expired (within stale_ttl), else MISS.
+        Used when the upstream that would refresh it is unavailable.
+        """
+        value = self.memory.get_stale(key)
+        if value is MISS:
+            entry = self._disk_call("get_stale", key)
+            value = entry if entry is MISS else entry[0]
+        if value is not MISS:
+            self.counters["stale_hits"] += 1
+        return value
+
+    def set(self, key, value, ttl):
+        expires_at = time.time() + ttl
+        self.memory.set(key, value, expires_at)
+        self._disk_call("set", key, value, expires_at)
+
+    def delete(self, key):
+        self.memory.delete(key)
+        self._disk_call("delete", key)
+
+    def clear(self):
+        self.memory.clear()
+        self._disk_call("clear")
+
+    def stats(self):
+        hits = self.counters["memory_hits"] + self.counters["disk_hits"] + self.counters["snapshot_hits"]
+        total = hits + self.counters["misses"]
+        return {
+            **self.counters,
+            "hits": hits,
+            "hit_rate": round(hits / total, 3) if total else 0.0,
+            "memory_entries": len(self.memory),
+            "disk_enabled": self.disk_enabled,
+        }
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key: the first caller runs the
+    function, everyone else arriving before it finishes waits for and shares
+    its result (or exception).
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def in_flight(self, key):
+        with self._lock:
+            return key in self._calls
+
+    def do(self, key, fn):
+        """
+        Returns (value, shared) where shared is True if another caller computed it.
+        """
+        finish, value = self.join(key)
+        if finish is None:
+            return value, True
+        try:
+            value = fn()
+        except BaseException as e:
+            finish(error=e)
+            raise
+        finish(value)
+        return value, False
+
+    def join(self, key):
+        """
+        For callers that produce the value in steps (e.g. while streaming it).
+        Returns (finish, None) to the leader, which must call finish(value) or
+        finish(error=e) exactly once. Everyone else waits for the leader and
+        gets (None, value), or its exception raised.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = {"done": threading.Event(), "value": None, "error": None}
+
+        if not leader:
+            call["done"].wait()
+            if call["error"] is not None:
+                raise call["error"]
+            return None, call["value"]
+
+        def finish(value=None, error=None):
+            call["value"] = value
+            call["error"] = error
+            with self._lock:
+                del self._calls[key]
+            call["done"].set()
+
+        return finish, None
@@ -0,0 +1,200 @@
+"""
+Per-upstream circuit breakers. After FAILURE_THRESHOLD consecutive failed
+calls (connection errors, timeouts, 429/5xx after retries) an upstream's
+circuit opens and calls to it fail fast with CircuitOpen instead of waiting
+on a sick server; the agents then answer from stale cached data or without
+that upstream.
+
+While open, a background probe checks the upstream every RESET_TIMEOUT
+seconds (doubling up to MAX_RESET_TIMEOUT while it keeps failing) and closes
+the circuit once it answers. Upstreams without a probe let one live call
+through as a trial instead (half-open). State is per process.
+"""
+import threading
+import time
+
+import requests
+
+from utils import metrics
+
+FAILURE_THRESHOLD = 5
+RESET_TIMEOUT = 15  # seconds
+MAX_RESET_TIMEOUT = 120
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpen(requests.RequestException):
+    """
+    The upstream's circuit is open; the call was not sent.
+    """
+
+
+class CircuitBreaker:
+    """
+    Thread-safe closed/open/half-open state machine for one upstream.
+    probe is an optional callable returning True if the upstream is healthy.
+    """
+
+    def __init__(self, name, failure_threshold=FAILURE_THRESHOLD, reset_timeout=RESET_TIMEOUT,
+                 max_reset_timeout=MAX_RESET_TIMEOUT, probe=None):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.probe = probe
+        self.state = CLOSED
+        self.failures = 0  # consecutive
+        self.opened_at = None
+        self.retry_at = None
+        self.last_error = None
+        self.counters = {"failures": 0, "rejected": 0, "opened": 0, "probes": 0}
+        self._delay = reset_timeout
+        self._prober = None
+        self._lock = threading.Lock()
+
+    def _transition(self, state):
+        # Caller holds the lock
+        self.state = state
+        metrics.CIRCUIT_TRANSITIONS.inc(self.name, state)
+
+    def allow(self):
+        """
+        True if a call may be sent now. Open circuits reject (and count) it,
+        except for the half-open trial of a breaker without a probe (one
+        per wait, so a trial that never reports back can't wedge it).
+        """
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            now = time.time()
+            if self.probe is None and now >= self.retry_at:
+                self.retry_at = now + self._delay
+                if self.state != HALF_OPEN:
+                    self._transition(HALF_OPEN)
+                return True
+            self.counters["rejected"] += 1
+        metrics.CIRCUIT_REJECTED.inc(self.name)
+        return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            if self.state != CLOSED:
+                self._close()
+
+    def record_failure(self, error=None):
+        with self._lock:
+            self.failures += 1
+            self.counters["failures"] += 1
+            self.last_error = str(error) if error is not None else None
+            if self.state == HALF_OPEN:
+                self._reopen()
+            elif self.state == CLOSED and self.failures >= self.failure_threshold:
+                self._delay = self.reset_timeout
+                self._open()
+
+    def _close(self):
+        self._transition(CLOSED)
+        self.opened_at = self.retry_at = None
+        self._delay = self.reset_timeout
+        # A prober that is still running sees it has been replaced and exits
+        self._prober = None
+
+    def _open(self):
+        self._transition(OPEN)
+        self.counters["opened"] += 1
+        self.opened_at = time.time()
+        self.retry_at = self.opened_at + self._delay
+        if self.probe is not None and self._prober is None:
+            self._prober = threading.Thread(target=self._probe_loop, name=f"circuit-probe-{self.name}", daemon=True)
+            self._prober.start()
+
+    def _reopen(self):
+        """
+        A trial failed: open again with a longer wait.
+        """
+        self._delay = min(self._delay * 2, self.max_reset_timeout)
+        self._open()
+
+    def _probe_loop(self):
+        """
+        Runs while the circuit is open: probes after each wait and closes the
+        circuit on the first healthy answer.
+        """
+        me = threading.current_thread()
+        while True:
+            with self._lock:
+                if self._prober is not me:
+                    return
+                wait = self.retry_at - time.time()
+            if wait > 0:
+                time.sleep(wait)
+            with self._lock:
+                if self._prober is not me:
+                    return
+                self.counters["probes"] += 1
+            try:
+                healthy = self.probe()
+                error = None
+            except Exception as e:
+                healthy = False
+                error = str(e)
+            with self._lock:
+                if self._prober is not me:
+                    return
+                if healthy:
+                    self.failures = 0
+                    self._close()
+                    return
+                self.last_error = error or self.last_error
+                self._delay = min(self._delay * 2, self.max_reset_timeout)
+                self.retry_at = time.time() + self._delay
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.failures,
+                "opened_at": self.opened_at,
+                "retry_at": self.retry_at,
+                "last_error": self.last_error,
+                **self.counters,
+            }
+
+
+_breakers = {}
+_lock = threading.Lock()
+
+def breaker_for(name, probe=None):
+    """
+    Returns the shared CircuitBreaker for an upstream, creating it on first use.
+    """
+    breaker = _breakers.get(name)
+    if breaker is None:
+        with _lock:
+            breaker = _breakers.get(name)
+            if breaker is None:
+                breaker = _breakers[name] = CircuitBreaker(name, probe=probe)
+    return breaker
+
+def any_open():
+    """
+    True if some upstream's circuit is not closed (answers may be degraded).
+    """
+    return any(breaker.state != CLOSED for breaker in list(_breakers.values()))
+
+def breaker_stats():
+    """
+    State and counters of every upstream's breaker.
+    """
+    return {name: breaker.snapshot() for name, breaker in list(_breakers.items())}
+
+def reset():
+    """
+    Forgets every breaker (e.g. between benchmark runs).
+    """
+    with _lock:
+        _breakers.clear()
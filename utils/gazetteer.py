@@ -0,0 +1,264 @@
+"""
+Local gazetteer: resolves well-known place names without calling Nominatim.
+
+The bundled data/gazetteer.tsv covers our most requested cities and regions.
+A larger table can be generated from a GeoNames dump
+(https://download.geonames.org/export/dump/):
+
+    python -m utils.gazetteer build cities15000.txt data/gazetteer.tsv \
+        --countries countryInfo.txt --admin1 admin1CodesASCII.txt
+
+Set TOURISM_GAZETTEER to use a table other than the bundled one. When a
+startup snapshot (utils/snapshot.py) holds the indexed table for the current
+TSV, it is mapped from there instead of being re-parsed.
+"""
+import os
+import threading
+import unicodedata
+from array import array
+from bisect import bisect_left
+
+from utils.snapshot import get_snapshot
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "gazetteer.tsv")
+
+COLUMNS = ("name", "aliases", "lat", "lon", "addresstype", "display_name", "popular")
+
+# Gazetteer attributes stored in a snapshot, as JSON lists and as raw arrays
+_TEXT_COLUMNS = ("names", "display_names", "addresstypes", "popular", "keys")
+_ARRAY_COLUMNS = (("lats", "d"), ("lons", "d"), ("rows", "i"))
+
+
+def normalize_name(name):
+    """
+    Lookup key for a place name: accents, punctuation, case and extra spaces
+    are dropped ("São  Paulo" and "sao paulo" share a key).
+    """
+    decomposed = unicodedata.normalize("NFKD", name)
+    chars = [c if c.isalnum() else " " for c in decomposed if not unicodedata.combining(c)]
+    return " ".join("".join(chars).split()).casefold()
+
+
+class Gazetteer:
+    """
+    Column-oriented place table with a sorted-key index over normalized names
+    and aliases. Exact lookups and prefix searches are binary searches.
+    """
+
+    def __init__(self, rows):
+        self.names = []
+        self.display_names = []
+        self.addresstypes = []
+        self.popular = []
+        self.lats = array("d")
+        self.lons = array("d")
+
+        entries = {}
+        for row in rows:
+            index = len(self.names)
+            self.names.append(row["name"])
+            self.display_names.append(row["display_name"])
+            self.addresstypes.append(row["addresstype"])
+            self.popular.append(row.get("popular") or "")
+            self.lats.append(float(row["lat"]))
+            self.lons.append(float(row["lon"]))
+            for name in [row["name"]] + [a for a in (row.get("aliases") or "").split("|") if a]:
+                # Earlier rows win on duplicate names, so the table is ordered by priority
+                entries.setdefault(normalize_name(name), index)
+
+        self.keys = sorted(entries)
+        self.rows = array("i", (entries[k] for k in self.keys))
+
+    @classmethod
+    def from_tsv(cls, path):
+        with open(path, encoding="utf-8") as f:
+            header = f.readline().rstrip("\r\n").split("\t")
+            rows = (dict(zip(header, line.rstrip("\r\n").split("\t"))) for line in f if line.strip())
+            return cls(rows)
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        """
+        Table read from a snapshot written by write_snapshot(). The coordinate
+        and row arrays are read-only views of the mapped file.
+        """
+        table = cls([])
+        for column in _TEXT_COLUMNS:
+            entry = snapshot.get("gazetteer", column)
+            if entry is None:
+                raise KeyError(f"snapshot has no gazetteer column '{column}'")
+            setattr(table, column, entry[0])
+        for column, typecode in _ARRAY_COLUMNS:
+            data = snapshot.get_bytes("gazetteer", column)
+            if data is None:
+                raise KeyError(f"snapshot has no gazetteer column '{column}'")
+            setattr(table, column, data.cast(typecode))
+        return table
+
+    def write_snapshot(self, writer):
+        for column in _TEXT_COLUMNS:
+            writer.put("gazetteer", column, getattr(self, column))
+        for column, _ in _ARRAY_COLUMNS:
+            writer.put_bytes("gazetteer", column, getattr(self, column).tobytes())
+
+    def __len__(self):
+        return len(self.names)
+
+    def _find(self, key):
+        i = bisect_left(self.keys, key)
+        if i < len(self.keys) and self.keys[i] == key:
+            return self.rows[i]
+        return None
+
+    def _record(self, index):
+        return {
+            "lat": self.lats[index],
+            "lon": self.lons[index],
+            "display_name": self.display_names[index],
+            "addresstype": self.addresstypes[index],
+            "found": True
+        }
+
+    def lookup(self, name):
+        """
+        Returns a get_coordinates-style dict for a known name or alias, else None.
+        """
+        index = self._find(normalize_name(name))
+        return None if index is None else self._record(index)
+
+    def prefix_search(self, prefix, limit=10):
+        """
+        Names (canonical, de-duplicated) whose name or an alias starts with prefix.
+        """
+        key = normalize_name(prefix)
+        results = []
+        i = bisect_left(self.keys, key)
+        while i < len(self.keys) and self.keys[i].startswith(key) and len(results) < limit:
+            name = self.names[self.rows[i]]
+            if name not in results:
+                results.append(name)
+            i += 1
+        return results
+
+    def suggestions_for(self, display_name):
+        """
+        Popular cities for the most specific region named in a display name
+        ("Kerala, India" -> Kerala's list), or None.
+        """
+        for part in display_name.split(","):
+            index = self._find(normalize_name(part))
+            if index is not None and self.popular[index]:
+                return self.popular[index]
+        return None
+
+
+_gazetteer = None
+_lock = threading.Lock()
+
+def table_path():
+    return os.environ.get("TOURISM_GAZETTEER", DEFAULT_PATH)
+
+def get_gazetteer():
+    """
+    Returns the shared Gazetteer, loading it on first use (from the snapshot
+    if it was built from the current table). An unreadable table yields an
+    empty gazetteer, so every lookup falls through to Nominatim.
+    """
+    global _gazetteer
+    if _gazetteer is None:
+        with _lock:
+            if _gazetteer is None:
+                path = table_path()
+                snapshot = get_snapshot()
+                try:
+                    if snapshot is not None and snapshot.is_current("gazetteer", path):
+                        _gazetteer = Gazetteer.from_snapshot(snapshot)
+                    else:
+                        _gazetteer = Gazetteer.from_tsv(path)
+                except (OSError, ValueError, KeyError) as e:
+                    print(f"Gazetteer not loaded: {e}")
+                    _gazetteer = Gazetteer([])
+    return _gazetteer
+
+def lookup(name):
+    return get_gazetteer().lookup(name)
+
+
+# --- Build step (GeoNames) ---
+
+def _read_codes(path, key_col, value_col):
+    codes = {}
+    if path:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("#"):
+                    continue
+                cols = line.rstrip("\n").split("\t")
+                if len(cols) > max(key_col, value_col):
+                    codes[cols[key_col]] = cols[value_col]
+    return codes
+
+def build_from_geonames(source, out_path, countries=None, admin1=None, min_population=15000, max_aliases=10):
+    """
+    Converts a GeoNames cities dump into the gazetteer TSV, largest cities
+    first. Aliases are limited to Latin-script alternate names.
+    Returns the number of rows written.
+    """
+    country_names = _read_codes(countries, 0, 4)
+    admin1_names = _read_codes(admin1, 0, 1)
+
+    rows = []
+    with open(source, encoding="utf-8") as f:
+        for line in f:
+            cols = line.rstrip("\n").split("\t")
+            if len(cols) < 15 or cols[6] != "P":
+                continue
+            population = int(cols[14] or 0)
+            if population < min_population:
+                continue
+            name, ascii_name, country = cols[1], cols[2], cols[8]
+            aliases = []
+            for alias in [ascii_name] + cols[3].split(","):
+                if alias and alias != name and alias.isascii() and alias not in aliases:
+                    aliases.append(alias)
+            display = [name, admin1_names.get(f"{country}.{cols[10]}", ""), country_names.get(country, country)]
+            rows.append((population, {
+                "name": name,
+                "aliases": "|".join(aliases[:max_aliases]),
+                "lat": cols[4],
+                "lon": cols[5],
+                "addresstype": "city" if population >= 100000 else "town",
+                "display_name": ", ".join(part for part in display if part),
+                "popular": ""
+            }))
+
+    rows.sort(key=lambda r: -r[0])
+    with open(out_path, "w", encoding="utf-8") as f:
+        f.write("\t".join(COLUMNS) + "\n")
+        for _, row in rows:
+            f.write("\t".join(row[c].replace("\t", " ") for c in COLUMNS) + "\n")
+    return len(rows)
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Local gazetteer tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="Generate a gazetteer TSV from a GeoNames cities dump")
+    build.add_argument("source")
+    build.add_argument("out_path")
+    build.add_argument("--countries", help="GeoNames countryInfo.txt for country names")
+    build.add_argument("--admin1", help="GeoNames admin1CodesASCII.txt for state/region names")
+    build.add_argument("--min-population", type=int, default=15000)
+    lookup_cmd = sub.add_parser("lookup", help="Resolve a name against the gazetteer")
+    lookup_cmd.add_argument("name")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        count = build_from_geonames(args.source, args.out_path, args.countries, args.admin1, args.min_population)
+        print(f"Wrote {count} places to {args.out_path}")
+    else:
+        print(lookup(args.name) or get_gazetteer().prefix_search(args.name))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+import math
+
+EARTH_RADIUS_M = 6371000
+
+# Edge length of a cache tile in degrees (~2.2 km north-south)
+TILE_DEG = 0.02
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """
+    Great-circle distance between two points in metres.
+    """
+    p1 = math.radians(lat1)
+    p2 = math.radians(lat2)
+    dp = p2 - p1
+    dl = math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+def radius_bbox(lat, lon, radius_m):
+    """
+    Returns the (south, west, north, east) box enclosing a circle around a point.
+    """
+    dlat = math.degrees(radius_m / EARTH_RADIUS_M)
+    coslat = max(math.cos(math.radians(lat)), 1e-6)
+    dlon = min(180.0, math.degrees(radius_m / (EARTH_RADIUS_M * coslat)))
+    return (lat - dlat, lon - dlon, lat + dlat, lon + dlon)
+
+def local_xy(lat, lon, lat0, lon0):
+    """
+    Projects a point to (x, y) metres east/north of (lat0, lon0). Accurate
+    enough for distances within a city.
+    """
+    x = math.radians(lon - lon0) * EARTH_RADIUS_M * math.cos(math.radians(lat0))
+    y = math.radians(lat - lat0) * EARTH_RADIUS_M
+    return (x, y)
+
+def tile_of(lat, lon, size=TILE_DEG):
+    """
+    Returns the (row, col) of the grid tile containing a point.
+    """
+    return (math.floor(lat / size), math.floor(lon / size))
+
+def tiles_covering(lat, lon, radius_m, size=TILE_DEG):
+    """
+    Lists every tile that intersects a circle of radius_m around a point.
+    """
+    south, west, north, east = radius_bbox(lat, lon, radius_m)
+    row0, col0 = tile_of(south, west, size)
+    row1, col1 = tile_of(north, east, size)
+    return [(r, c) for r in range(row0, row1 + 1) for c in range(col0, col1 + 1)]
+
+def tile_bbox(tile, size=TILE_DEG):
+    """
+    Returns the (south, west, north, east) box of a tile.
+    """
+    row, col = tile
+    return (row * size, col * size, (row + 1) * size, (col + 1) * size)
@@ -1,4 +1,100 @@
+import math
 import requests
+from utils import gazetteer, metrics, transport
+from utils.cache import TieredCache, MISS
+
+# Found places rarely move; "not found" answers expire sooner in case the
+# name was mistyped upstream or OSM gains the place later.
+GEOCODE_TTL = 30 * 24 * 3600
+NEGATIVE_TTL = 24 * 3600
+
+# Expired answers are kept this long and served while Nominatim is unavailable
+STALE_TTL = 30 * 24 * 3600
+
+_cache = TieredCache("geocode", memory_entries=2048, disk_entries=50000, stale_ttl=STALE_TTL)
+
+# Nominatim address types too broad to plan a trip for (we ask for a city instead)
+REGION_TYPES = ("country", "state", "region", "province")
+
+def normalize_place_name(place_name):
+    """
+    Canonical cache key for a place query: "Bangalore ", "bangalore" and
+    "BANGALORE" all map to "bangalore".
+    """
+    return " ".join(place_name.split()).casefold()
+
+def cache_stats():
+    """
+    Hit/miss counters of the geocoding cache.
+    """
+    return _cache.stats()
+
+NOMINATIM_URL = "https://nominatim.openstreetmap.org/search"
+HEADERS = {
+    "User-Agent": "MyTourismApp/1.0" 
+}
+
+def _known(place_name):
+    """
+    Answers from the gazetteer or the cache. Returns (cache key, result or MISS).
+    """
+    # Well-known places are resolved locally without a network call
+    local = gazetteer.lookup(place_name)
+    if local:
+        metrics.LOOKUPS.inc("geocode", "gazetteer")
+        return None, local
+
+    key = normalize_place_name(place_name)
+    cached = _cache.get(key)
+    metrics.LOOKUPS.inc("geocode", "upstream" if cached is MISS else "cache")
+    return key, cached
+
+def _params(place_name):
+    return {
+        "q": place_name,
+        "format": "json",
+        "limit": 1
+    }
+
+def _store(key, data):
+    """
+    Turns a Nominatim response into our result dict and caches it
+    (including "not found").
+    """
+    if data:
+        result = data[0]
+        geo = {
+            "lat": float(result["lat"]),
+            "lon": float(result["lon"]),
+            "display_name": result["display_name"],
+            "addresstype": result.get("addresstype", "unknown"),
+            "found": True
+        }
+        _cache.set(key, geo, GEOCODE_TTL)
+        return geo
+    else:
+        _cache.set(key, None, NEGATIVE_TTL)
+        return None
+
+def _fallback(key, error):
+    """
+    Answer after a failed lookup: the expired cache entry if we have one, else None.
+    """
+    stale = _cache.get_stale(key)
+    if stale is not MISS:
+        metrics.FALLBACKS.inc("geocode_stale")
+        return stale
+    print(f"Error fetching coordinates: {error}")
+    metrics.AGENT_ERRORS.inc("geocoding")
+    return None
+
+def _fetch(key, place_name):
+    try:
+        response = transport.get(NOMINATIM_URL, params=_params(place_name), headers=HEADERS)
+        response.raise_for_status()
+        return _store(key, response.json())
+    except requests.RequestException as e:
+        return _fallback(key, e)
 
 def get_coordinates(place_name):
     """
@@ -10,32 +106,38 @@ def get_coordinates(place_name):
     Returns:
         dict: {lat, lon, display_name, addresstype} if found, else None.
     """
-    url = "https://nominatim.openstreetmap.org/search"
-    params = {
-        "q": place_name,
-        "format": "json",
-        "limit": 1
-    }
-    headers = {
-        "User-Agent": "MyTourismApp/1.0" 
-    }
-    
+    key, known = _known(place_name)
+    if known is not MISS:
+        return known
+    return _fetch(key, place_name)
+
+async def get_coordinates_async(place_name):
+    """
+    Async variant of get_coordinates.
+    """
+    key, known = _known(place_name)
+    if known is not MISS:
+        return known
+
     try:
-        response = requests.get(url, params=params, headers=headers)
+        response = await transport.aget(NOMINATIM_URL, params=_params(place_name), headers=HEADERS)
         response.raise_for_status()
-        data = response.json()
-        
-        if data:
-            result = data[0]
-            return {
-                "lat": float(result["lat"]),
-                "lon": float(result["lon"]),
-                "display_name": result["display_name"],
-                "addresstype": result.get("addresstype", "unknown"),
-                "found": True
-            }
-        else:
-            return None
+        return _store(key, response.json())
     except requests.RequestException as e:
-        print(f"Error fetching coordinates: {e}")
-        return None
+        return _fallback(key, e)
+
+def peek(place_name):
+    """
+    Returns (result, expires_at) without a network call or cache statistics,
+    else MISS. Gazetteer answers never expire (expires_at is infinite).
+    """
+    local = gazetteer.lookup(place_name)
+    if local:
+        return local, math.inf
+    return _cache.peek(normalize_place_name(place_name))
+
+def refresh(place_name):
+    """
+    Re-fetches a place from Nominatim and replaces its cache entry.
+    """
+    return _fetch(normalize_place_name(place_name), place_name)
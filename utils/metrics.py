@@ -0,0 +1,205 @@
+"""
+In-process counters and latency histograms, rendered in the Prometheus text
+exposition format by render() (served at /api/metrics).
+
+Recording is a dict lookup, a bisect and a few additions under a lock, so it
+is cheap enough to leave on. Set TOURISM_METRICS=0 to turn recording off.
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+ENABLED = os.environ.get("TOURISM_METRICS", "1") != "0"
+
+# Upper bounds in seconds: parsing takes microseconds, upstream calls up to the read timeout
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """
+    Monotonic count per label combination.
+    """
+
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues, amount=1):
+        if not ENABLED:
+            return
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def value(self, *labelvalues):
+        return self._values.get(labelvalues, 0)
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for labelvalues, value in values:
+            yield f"{self.name}{_labels(self.labelnames, labelvalues)} {_number(value)}"
+
+
+class Histogram:
+    """
+    Distribution of observed values (seconds) per label combination, kept as
+    per-bucket counts plus a running sum.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labelvalues):
+        if not ENABLED:
+            return
+        # Index len(buckets) is the +Inf bucket
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, *labelvalues):
+        """
+        Observes the wall time of the enclosed block.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labelvalues)
+
+    def count(self, *labelvalues):
+        series = self._series.get(labelvalues)
+        return sum(series[:-1]) if series else 0
+
+    def samples(self):
+        with self._lock:
+            series = sorted((labelvalues, list(values)) for labelvalues, values in self._series.items())
+        for labelvalues, values in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), values):
+                cumulative += count
+                le = 'le="' + _number(bound) + '"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, labelvalues, le)} {cumulative}"
+            labels = _labels(self.labelnames, labelvalues)
+            yield f"{self.name}_sum{labels} {_number(values[-1])}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+def _register(metric):
+    with _registry_lock:
+        return _registry.setdefault(metric.name, metric)
+
+def counter(name, help, labelnames=()):
+    return _register(Counter(name, help, labelnames))
+
+def histogram(name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+    return _register(Histogram(name, help, labelnames, buckets))
+
+def render():
+    """
+    Returns every registered metric in the text exposition format (version 0.0.4).
+    """
+    lines = []
+    for metric in list(_registry.values()):
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.samples())
+    return "\n".join(lines) + "\n"
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# --- Application metrics ---
+
+STAGE_SECONDS = histogram(
+    "tourism_stage_duration_seconds",
+    "Time spent in each stage of planning a chat request.",
+    ("stage",)
+)
+REQUEST_SECONDS = histogram(
+    "tourism_request_duration_seconds",
+    "End-to-end chat request time by response cache result.",
+    ("cache",)
+)
+UPSTREAM_SECONDS = histogram(
+    "tourism_upstream_request_duration_seconds",
+    "Time per HTTP attempt to an upstream API by outcome (status class or error).",
+    ("upstream", "outcome")
+)
+UPSTREAM_RETRIES = counter(
+    "tourism_upstream_retries_total",
+    "Upstream requests retried after a connection error or 429/5xx response.",
+    ("upstream",)
+)
+UPSTREAM_ERRORS = counter(
+    "tourism_upstream_errors_total",
+    "Upstream requests that finally failed or returned an error status.",
+    ("upstream",)
+)
+CIRCUIT_TRANSITIONS = counter(
+    "tourism_circuit_transitions_total",
+    "Upstream circuit breaker state changes, by the state entered.",
+    ("upstream", "state")
+)
+CIRCUIT_REJECTED = counter(
+    "tourism_circuit_rejected_total",
+    "Upstream calls failed fast because the upstream's circuit was open.",
+    ("upstream",)
+)
+AGENT_ERRORS = counter(
+    "tourism_agent_errors_total",
+    "Agent calls that fell back to an empty or error result.",
+    ("agent",)
+)
+AGENT_TIMEOUTS = counter(
+    "tourism_agent_timeouts_total",
+    "Agents that missed the per-request deadline.",
+    ("agent",)
+)
+FALLBACKS = counter(
+    "tourism_fallbacks_total",
+    "Degraded paths taken, e.g. places_broad when too few wikipedia-tagged attractions were found.",
+    ("kind",)
+)
+LOOKUPS = counter(
+    "tourism_lookups_total",
+    "Where lookups were answered from (gazetteer, cache, index, upstream).",
+    ("lookup", "source")
+)
@@ -0,0 +1,398 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from utils.cache import CACHE_DIR
+
+try:
+    import fcntl
+except ImportError:  # Windows: buckets and slots are per-process only
+    fcntl = None
+
+# Request priorities: lower runs first. Live chat traffic always goes ahead of
+# background work such as cache warming.
+PRIORITY_LIVE = 0
+PRIORITY_BACKGROUND = 10
+
+# Longest a live request waits in an upstream's queue before giving up
+QUEUE_TIMEOUT = float(os.environ.get("TOURISM_QUEUE_TIMEOUT", 10))
+
+# Per-upstream policy: sustained requests/sec, burst size and (optionally)
+# how many requests may be in flight at once across all worker processes.
+POLICIES = {
+    # https://operations.osmfoundation.org/policies/nominatim/ - max 1 request/second
+    "nominatim.openstreetmap.org": {"rate": 1.0, "burst": 1},
+    # Overpass hands out a couple of concurrent slots per client IP
+    "overpass-api.de": {"rate": 1.0, "burst": 2, "slots": 2},
+    "api.open-meteo.com": {"rate": 10.0, "burst": 10},
+}
+
+STATE_DIR = os.path.join(CACHE_DIR, "ratelimit")
+
+_priority = contextvars.ContextVar("request_priority", default=PRIORITY_LIVE)
+
+
+@contextmanager
+def priority(level):
+    """
+    Runs the enclosed upstream calls at the given priority.
+    """
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+def current_priority():
+    return _priority.get()
+
+
+@contextmanager
+def _locked(path, blocking=True):
+    """
+    Holds an exclusive lock on a file for cross-process critical sections.
+    Without blocking, yields None instead if another holder has the lock.
+    """
+    with open(path, "a+") as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            if blocking:
+                raise
+            yield None
+            return
+        try:
+            f.seek(0)
+            yield f
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class TokenBucket:
+    """
+    Token bucket refilled at `rate` tokens/sec up to `burst`. When a state
+    directory is usable the bucket lives in a locked file, so every worker
+    process on the host draws from the same budget.
+    """
+
+    def __init__(self, name, rate, burst, state_dir=STATE_DIR):
+        self.rate = rate
+        self.burst = burst
+        self._lock = threading.Lock()
+        self._state = {"tokens": burst, "updated": time.time(), "blocked_until": 0}
+        self.path = None
+        if fcntl and state_dir:
+            try:
+                os.makedirs(state_dir, exist_ok=True)
+                self.path = os.path.join(state_dir, f"{name}.bucket")
+            except OSError as e:
+                print(f"Rate limit state for {name} is per-process: {e}")
+
+    def _update(self, fn, blocking=True):
+        """
+        Applies fn to the (refilled) bucket state under the appropriate lock.
+        Without blocking, returns None instead if the lock is held elsewhere.
+        """
+        if not self._lock.acquire(blocking):
+            return None
+        try:
+            if self.path is None:
+                return fn(self._refill(self._state))
+            with _locked(self.path, blocking) as f:
+                if f is None:
+                    return None
+                raw = f.read()
+                state = json.loads(raw) if raw else dict(self._state)
+                result = fn(self._refill(state))
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(state))
+                return result
+        finally:
+            self._lock.release()
+
+    def _refill(self, state):
+        now = time.time()
+        state["tokens"] = min(self.burst, state["tokens"] + (now - state["updated"]) * self.rate)
+        state["updated"] = now
+        return state
+
+    def try_take(self, blocking=True):
+        """
+        Takes a token if one is available. Returns 0, or the seconds to wait
+        before one will be. Without blocking, returns None if another thread
+        or process is updating the bucket.
+        """
+        def take(state):
+            now = state["updated"]
+            if state["blocked_until"] > now:
+                return state["blocked_until"] - now
+            if state["tokens"] >= 1:
+                state["tokens"] -= 1
+                return 0
+            return (1 - state["tokens"]) / self.rate
+        return self._update(take, blocking)
+
+    def available(self):
+        return self._update(lambda state: 0 if state["blocked_until"] > state["updated"] else state["tokens"])
+
+    def block(self, seconds):
+        """
+        Stops handing out tokens for `seconds` (e.g. after a 429 with Retry-After).
+        """
+        def apply(state):
+            state["blocked_until"] = max(state["blocked_until"], time.time() + seconds)
+            state["tokens"] = 0
+        self._update(apply)
+
+
+class SlotPool:
+    """
+    At most `size` concurrent holders across processes, using one lock file per slot.
+    """
+
+    POLL_INTERVAL = 0.05
+
+    def __init__(self, name, size, state_dir=STATE_DIR):
+        self.size = size
+        self._local = threading.BoundedSemaphore(size)
+        self.paths = []
+        if fcntl and state_dir:
+            try:
+                os.makedirs(state_dir, exist_ok=True)
+                self.paths = [os.path.join(state_dir, f"{name}.slot{i}") for i in range(size)]
+            except OSError:
+                self.paths = []
+
+    def acquire(self, timeout):
+        """
+        Returns a handle to pass to release(), or None if no slot freed up in time.
+        """
+        deadline = time.monotonic() + timeout
+        if not self._local.acquire(timeout=timeout):
+            return None
+        if not self.paths:
+            return True
+        while True:
+            for path in self.paths:
+                f = open(path, "a")
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    return f
+                except OSError:
+                    f.close()
+            if time.monotonic() >= deadline:
+                self._local.release()
+                return None
+            time.sleep(self.POLL_INTERVAL)
+
+    async def acquire_async(self, timeout):
+        """
+        Event-loop variant of acquire(): polls instead of blocking a thread.
+        """
+        deadline = time.monotonic() + timeout
+        while not self._local.acquire(blocking=False):
+            if time.monotonic() >= deadline:
+                return None
+            await asyncio.sleep(self.POLL_INTERVAL)
+        if not self.paths:
+            return True
+        while True:
+            for path in self.paths:
+                f = open(path, "a")
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    return f
+                except OSError:
+                    f.close()
+            if time.monotonic() >= deadline:
+                self._local.release()
+                return None
+            await asyncio.sleep(self.POLL_INTERVAL)
+
+    def release(self, handle):
+        if handle is not True:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+            handle.close()
+        self._local.release()
+
+
+class Governor:
+    """
+    Paces requests to one upstream: callers queue by priority (then arrival)
+    and the head of the queue waits for a token from the shared bucket.
+    Threads wait on a condition; coroutines (acquire_async) share the same
+    queue but poll with asyncio.sleep and never block on a lock, so they
+    don't hold a thread each or stall the event loop.
+    """
+
+    # How often a queued coroutine re-checks whether it has reached the head
+    ASYNC_POLL_INTERVAL = 0.02
+    # How often a coroutine retries a queue lock that a thread is holding
+    LOCK_POLL_INTERVAL = 0.001
+
+    def __init__(self, name, rate, burst, slots=None, state_dir=STATE_DIR):
+        self.name = name
+        self.bucket = TokenBucket(name, rate, burst, state_dir)
+        self.slots = SlotPool(name, slots, state_dir) if slots else None
+        self._queue = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self.stats = {"acquired": 0, "cancelled": 0, "max_queue_depth": 0, "total_wait": 0.0, "max_wait": 0.0}
+
+    def acquire(self, priority=None, timeout=None):
+        """
+        Waits for this caller's turn and a token. Returns False (and leaves the
+        queue) if that takes longer than timeout seconds.
+        """
+        priority = current_priority() if priority is None else priority
+        timeout = QUEUE_TIMEOUT if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+        ticket = (priority, next(self._seq))
+
+        with self._cond:
+            self._enqueue(ticket)
+            try:
+                while True:
+                    acquired, wait, remaining = self._try_acquire(ticket, start, deadline)
+                    if acquired is not None:
+                        return acquired
+                    self._cond.wait(remaining if wait is None else min(wait, remaining))
+            finally:
+                self._cond.notify_all()
+
+    async def acquire_async(self, priority=None, timeout=None):
+        """
+        Coroutine variant of acquire() for the async transport.
+        """
+        priority = current_priority() if priority is None else priority
+        timeout = QUEUE_TIMEOUT if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+        ticket = (priority, next(self._seq))
+
+        await self._lock_async()
+        try:
+            self._enqueue(ticket)
+        finally:
+            self._cond.release()
+        try:
+            while True:
+                await self._lock_async()
+                try:
+                    acquired, wait, remaining = self._try_acquire(ticket, start, deadline, blocking=False)
+                    if acquired is not None:
+                        self._cond.notify_all()
+                        return acquired
+                finally:
+                    self._cond.release()
+                await asyncio.sleep(min(wait or self.ASYNC_POLL_INTERVAL, remaining))
+        except BaseException:
+            # Cancelled while queued: leave the queue so the callers behind can
+            # go. Waiting for the lock here is brief: holders keep it for one
+            # bucket update at most.
+            with self._cond:
+                if ticket in self._queue:
+                    self._queue.remove(ticket)
+                    heapq.heapify(self._queue)
+                    self._cond.notify_all()
+            raise
+
+    async def _lock_async(self):
+        """
+        Takes the queue lock without blocking the event loop.
+        """
+        while not self._cond.acquire(blocking=False):
+            await asyncio.sleep(self.LOCK_POLL_INTERVAL)
+
+    def _enqueue(self, ticket):
+        # Caller holds self._cond
+        heapq.heappush(self._queue, ticket)
+        self.stats["max_queue_depth"] = max(self.stats["max_queue_depth"], len(self._queue))
+        # A new arrival may outrank the current head; let it re-check
+        self._cond.notify_all()
+
+    def _try_acquire(self, ticket, start, deadline, blocking=True):
+        """
+        One turn of the wait loop (caller holds self._cond). Returns
+        (True or False when done, else None; seconds until a token, or None
+        if not at the head or the bucket was busy; seconds left before the
+        deadline).
+        """
+        wait = None
+        if self._queue[0] == ticket:
+            wait = self.bucket.try_take(blocking)
+            if wait == 0:
+                heapq.heappop(self._queue)
+                waited = time.monotonic() - start
+                self.stats["acquired"] += 1
+                self.stats["total_wait"] += waited
+                self.stats["max_wait"] = max(self.stats["max_wait"], waited)
+                return True, 0, 0
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            self._queue.remove(ticket)
+            heapq.heapify(self._queue)
+            self.stats["cancelled"] += 1
+            return False, None, 0
+        return None, wait, remaining
+
+    def backoff(self, seconds):
+        """
+        Pauses this upstream for every caller in every process.
+        """
+        self.bucket.block(seconds)
+
+    def snapshot(self):
+        with self._cond:
+            stats = dict(self.stats)
+            stats["queue_depth"] = len(self._queue)
+        stats["avg_wait"] = round(stats["total_wait"] / stats["acquired"], 4) if stats["acquired"] else 0.0
+        stats["total_wait"] = round(stats["total_wait"], 4)
+        stats["max_wait"] = round(stats["max_wait"], 4)
+        return stats
+
+
+_governors = {}
+_governors_lock = threading.Lock()
+
+def governor_for(host):
+    """
+    Returns the Governor for an upstream host, or None if it has no policy.
+    """
+    policy = POLICIES.get(host)
+    if policy is None:
+        return None
+    governor = _governors.get(host)
+    if governor is None:
+        with _governors_lock:
+            governor = _governors.get(host)
+            if governor is None:
+                governor = _governors[host] = Governor(
+                    host, policy["rate"], policy["burst"], policy.get("slots")
+                )
+    return governor
+
+def has_headroom(host):
+    """
+    True if a request to host right now would not hold up anyone: no caller
+    is queued in this process and the shared bucket has a token to spare.
+    Background work checks this before spending upstream quota.
+    """
+    governor = governor_for(host)
+    if governor is None:
+        return True
+    return governor.snapshot()["queue_depth"] == 0 and governor.bucket.available() >= 1
+
+def governor_stats():
+    """
+    Queue depth, wait times and cancellations per upstream.
+    """
+    return {host: governor.snapshot() for host, governor in list(_governors.items())}
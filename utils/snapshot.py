@@ -0,0 +1,261 @@
+"""
+Read-only startup snapshot: precomputed tables and cache entries in one
+memory-mapped file, so a fresh process (e.g. a serverless cold start) has a
+warm gazetteer and warm geocode/places caches without parsing source files
+or calling upstream APIs.
+
+Build it at deploy time, after the caches have been filled:
+
+    python -m utils.snapshot build data/snapshot.bin
+    python -m utils.snapshot info data/snapshot.bin
+
+Layout: MAGIC, an 8-byte header length, a small JSON header, then 8-byte
+aligned blobs. The header lists each section's key index blob; an index is
+parsed the first time its section is used, and values are decoded from the
+mapped file only when they are looked up.
+"""
+import hashlib
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+
+MAGIC = b"TSNAP01\n"
+ALIGN = 8
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "snapshot.bin")
+
+# Disk cache tables copied into a snapshot by default (see utils.cache.TieredCache)
+CACHE_SECTIONS = ("geocode", "places_tiles")
+
+
+def file_signature(path):
+    """
+    Identifies a source file's version by its size and content hash, so stale
+    snapshot tables are ignored once the source is edited. Path and mtime are
+    left out: a bundle built elsewhere (e.g. deployed under /var/task) still
+    matches its snapshot.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return {"size": os.path.getsize(path), "sha256": digest.hexdigest()}
+
+
+class Snapshot:
+    """
+    Memory-mapped snapshot reader. Thread-safe; section indexes load lazily.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a snapshot file")
+        (header_len,) = struct.unpack_from("<Q", self._mmap, len(MAGIC))
+        start = len(MAGIC) + 8
+        header = json.loads(self._mmap[start:start + header_len])
+        self._data = _aligned(start + header_len)
+        self.created = header["created"]
+        self.sources = header["sources"]
+        self._section_spans = header["sections"]
+        self._sections = {}
+        self._lock = threading.Lock()
+
+    def _section(self, name):
+        index = self._sections.get(name)
+        if index is None:
+            span = self._section_spans.get(name)
+            if span is None:
+                return None
+            with self._lock:
+                index = self._sections.get(name)
+                if index is None:
+                    index = self._sections[name] = json.loads(self._blob(span[0], span[1]))
+        return index
+
+    def _blob(self, offset, length):
+        start = self._data + offset
+        return self._mmap[start:start + length]
+
+    def sections(self):
+        return list(self._section_spans)
+
+    def keys(self, section):
+        return list(self._section(section) or ())
+
+    def is_current(self, name, path):
+        """
+        True if the table `name` was built from the current version of path.
+        """
+        try:
+            return self.sources.get(name) == file_signature(path)
+        except OSError:
+            return False
+
+    def get(self, section, key):
+        """
+        Returns (value, expires_at) for a live JSON entry, else None.
+        expires_at is None for entries that don't expire.
+        """
+        entry = (self._section(section) or {}).get(key)
+        if entry is None or entry[3] != "j":
+            return None
+        offset, length, expires_at, _ = entry
+        if expires_at is not None and expires_at <= time.time():
+            return None
+        return json.loads(self._blob(offset, length)), expires_at
+
+    def get_bytes(self, section, key):
+        """
+        Returns a zero-copy memoryview of a binary entry, else None.
+        """
+        entry = (self._section(section) or {}).get(key)
+        if entry is None or entry[3] != "b":
+            return None
+        start = self._data + entry[0]
+        return memoryview(self._mmap)[start:start + entry[1]]
+
+
+def _aligned(offset):
+    return (offset + ALIGN - 1) // ALIGN * ALIGN
+
+
+class SnapshotWriter:
+    """
+    Collects entries and writes them as a snapshot file on close()
+    (to a temporary file first, then renamed into place).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.sources = {}
+        self._sections = {}
+        self._blobs = []
+        self._size = 0
+
+    def _add_blob(self, data):
+        offset = self._size
+        padding = _aligned(len(data)) - len(data)
+        self._blobs.append(data + b"\0" * padding)
+        self._size += len(data) + padding
+        return offset
+
+    def _entry(self, section, key, data, expires_at, kind):
+        offset = self._add_blob(data)
+        self._sections.setdefault(section, {})[key] = [offset, len(data), expires_at, kind]
+
+    def put(self, section, key, value, expires_at=None):
+        self._entry(section, key, json.dumps(value).encode("utf-8"), expires_at, "j")
+
+    def put_json_text(self, section, key, text, expires_at=None):
+        """
+        Adds an already JSON-encoded value (e.g. straight from the SQLite cache).
+        """
+        self._entry(section, key, text.encode("utf-8"), expires_at, "j")
+
+    def put_bytes(self, section, key, data):
+        self._entry(section, key, bytes(data), None, "b")
+
+    def source(self, name, path):
+        self.sources[name] = file_signature(path)
+
+    def close(self):
+        spans = {}
+        for name, index in self._sections.items():
+            data = json.dumps(index).encode("utf-8")
+            spans[name] = [self._add_blob(data), len(data)]
+        header = json.dumps({"created": time.time(), "sources": self.sources, "sections": spans}).encode("utf-8")
+        prefix = MAGIC + struct.pack("<Q", len(header)) + header
+        prefix += b"\0" * (_aligned(len(prefix)) - len(prefix))
+
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(prefix)
+            for blob in self._blobs:
+                f.write(blob)
+        os.replace(tmp_path, self.path)
+
+
+_snapshot = None
+_snapshot_loaded = False
+_lock = threading.Lock()
+
+def get_snapshot():
+    """
+    Returns the configured Snapshot (TOURISM_SNAPSHOT, else data/snapshot.bin),
+    opening it on first use, or None if there isn't one.
+    """
+    global _snapshot, _snapshot_loaded
+    if not _snapshot_loaded:
+        with _lock:
+            if not _snapshot_loaded:
+                path = os.environ.get("TOURISM_SNAPSHOT", DEFAULT_PATH)
+                if os.path.exists(path):
+                    try:
+                        _snapshot = Snapshot(path)
+                    except (OSError, ValueError, KeyError) as e:
+                        print(f"Snapshot not loaded: {e}")
+                _snapshot_loaded = True
+    return _snapshot
+
+
+# --- Build step ---
+
+def build_snapshot(out_path, caches=CACHE_SECTIONS):
+    """
+    Writes a snapshot of the gazetteer table and the live entries of the
+    given disk cache tables. Returns {section: entry count}.
+    """
+    from utils import gazetteer
+    from utils.cache import CACHE_DIR, SQLiteStore
+
+    writer = SnapshotWriter(out_path)
+    counts = {}
+
+    path = gazetteer.table_path()
+    table = gazetteer.Gazetteer.from_tsv(path)
+    table.write_snapshot(writer)
+    writer.source("gazetteer", path)
+    counts["gazetteer"] = len(table)
+
+    store_path = os.path.join(CACHE_DIR, "cache.sqlite3")
+    for name in caches:
+        counts[name] = 0
+        if not os.path.exists(store_path):
+            continue
+        for key, text, expires_at in SQLiteStore(store_path, table=name).raw_items():
+            writer.put_json_text(name, key, text, expires_at)
+            counts[name] += 1
+
+    writer.close()
+    return counts
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Startup snapshot tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="Snapshot the gazetteer and the disk caches")
+    build.add_argument("out_path", nargs="?", default=DEFAULT_PATH)
+    build.add_argument("--caches", default=",".join(CACHE_SECTIONS), help="Comma-separated cache tables to include")
+    info = sub.add_parser("info", help="List a snapshot's sections")
+    info.add_argument("path", nargs="?", default=DEFAULT_PATH)
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        caches = [name for name in args.caches.split(",") if name]
+        counts = build_snapshot(args.out_path, caches)
+        print(f"Wrote {args.out_path}: " + ", ".join(f"{name} {count}" for name, count in counts.items()))
+    else:
+        snapshot = Snapshot(args.path)
+        print(f"{args.path}: created {time.ctime(snapshot.created)}")
+        for name in snapshot.sections():
+            print(f"  {name}: {len(snapshot.keys(name))} entries")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,389 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from utils import circuit, metrics, ratelimit
+
+# Shared HTTP transport for every agent: one keep-alive Session with a
+# connection pool per host, timeouts on every call, bounded retries with
+# jittered backoff, a cap on in-flight requests per upstream host and a
+# circuit breaker per upstream host (see utils.circuit).
+
+CONNECT_TIMEOUT = float(os.environ.get("TOURISM_CONNECT_TIMEOUT", 3.05))
+READ_TIMEOUT = float(os.environ.get("TOURISM_READ_TIMEOUT", 30))
+MAX_RETRIES = int(os.environ.get("TOURISM_HTTP_RETRIES", 2))
+
+BACKOFF_BASE = 0.5  # seconds
+BACKOFF_MAX = 8.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Idle keep-alive connections kept per host
+POOL_SIZE = 16
+
+# Max in-flight requests per upstream host; others use DEFAULT_HOST_CONCURRENCY
+HOST_CONCURRENCY = {
+    "nominatim.openstreetmap.org": 1,
+    "overpass-api.de": 2,
+    "api.open-meteo.com": 8,
+}
+DEFAULT_HOST_CONCURRENCY = 8
+
+# Cheap requests that tell whether an upstream with an open circuit has
+# recovered. Other hosts get a half-open trial with a live request instead.
+PROBES = {
+    "nominatim.openstreetmap.org": "https://nominatim.openstreetmap.org/status?format=json",
+    "overpass-api.de": "https://overpass-api.de/api/status",
+    "api.open-meteo.com": "https://api.open-meteo.com/v1/forecast?latitude=0&longitude=0&hourly=temperature_2m&forecast_days=1",
+}
+
+class UpstreamBusy(requests.RequestException):
+    """
+    A rate-limited upstream couldn't take the request before the queue timeout.
+    """
+
+_session = None
+_session_lock = threading.Lock()
+_host_limits = {}
+_async_client = None
+_async_host_limits = {}
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def _get_session():
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                # Retries are handled in request() so they can be counted and paced
+                adapter = HTTPAdapter(pool_connections=8, pool_maxsize=POOL_SIZE, max_retries=0)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+def _host_limit(host):
+    limit = _host_limits.get(host)
+    if limit is None:
+        with _session_lock:
+            limit = _host_limits.setdefault(
+                host, threading.BoundedSemaphore(HOST_CONCURRENCY.get(host, DEFAULT_HOST_CONCURRENCY))
+            )
+    return limit
+
+_COUNTER_METRICS = {"retries": metrics.UPSTREAM_RETRIES, "errors": metrics.UPSTREAM_ERRORS}
+
+def _count(host, key, amount=1):
+    with _stats_lock:
+        host_stats = _stats.setdefault(host, {"requests": 0, "retries": 0, "errors": 0})
+        host_stats[key] = host_stats.get(key, 0) + amount
+    if key in _COUNTER_METRICS:
+        _COUNTER_METRICS[key].inc(host, amount=amount)
+
+def _outcome(response):
+    return "error" if response is None else f"{response.status_code // 100}xx"
+
+def _admit(host):
+    """
+    Waits for the upstream's rate-limit governor (token and, if the upstream
+    limits concurrency, a slot). Returns (governor, slot) for _release().
+    """
+    governor = ratelimit.governor_for(host)
+    if governor is None:
+        return None, None
+    if not governor.acquire():
+        raise UpstreamBusy(f"Timed out waiting for a {host} request slot")
+    slot = None
+    if governor.slots:
+        slot = governor.slots.acquire(ratelimit.QUEUE_TIMEOUT)
+        if slot is None:
+            raise UpstreamBusy(f"Timed out waiting for a {host} connection slot")
+    return governor, slot
+
+async def _admit_async(host):
+    """
+    Event-loop variant of _admit(): waits without holding a thread.
+    """
+    governor = ratelimit.governor_for(host)
+    if governor is None:
+        return None, None
+    if not await governor.acquire_async():
+        raise UpstreamBusy(f"Timed out waiting for a {host} request slot")
+    slot = None
+    if governor.slots:
+        slot = await governor.slots.acquire_async(ratelimit.QUEUE_TIMEOUT)
+        if slot is None:
+            raise UpstreamBusy(f"Timed out waiting for a {host} connection slot")
+    return governor, slot
+
+def _release(governor, slot):
+    if slot is not None:
+        governor.slots.release(slot)
+
+def _failed(response):
+    """
+    True if a final response means the upstream is unhealthy (429 or 5xx).
+    """
+    return response.status_code == 429 or response.status_code >= 500
+
+def _probe(url):
+    def probe():
+        with ratelimit.priority(ratelimit.PRIORITY_BACKGROUND):
+            return not _failed(request("GET", url, retries=0, probe=True))
+    return probe
+
+def _breaker(host):
+    url = PROBES.get(host)
+    return circuit.breaker_for(host, _probe(url) if url else None)
+
+def _check_circuit(host, probe):
+    """
+    Returns the host's breaker (None for probes), raising CircuitOpen if the
+    call must fail fast.
+    """
+    if probe:
+        return None
+    breaker = _breaker(host)
+    if not breaker.allow():
+        raise circuit.CircuitOpen(f"{host} is unavailable (circuit open), not sending the request")
+    return breaker
+
+def _record_outcome(breaker, response=None, error=None):
+    if breaker is None:
+        return
+    if error is not None:
+        breaker.record_failure(error)
+    elif _failed(response):
+        breaker.record_failure(f"HTTP {response.status_code}")
+    else:
+        breaker.record_success()
+
+def _pause(governor, attempt, response):
+    """
+    Waits before a retry. A 429 pauses the upstream's governor instead, so
+    every caller in every process backs off, and the next _admit waits it out.
+    """
+    delay = _backoff(attempt, response)
+    if governor is not None and response is not None and response.status_code == 429:
+        governor.backoff(delay)
+    else:
+        time.sleep(delay)
+
+def _backoff(attempt, response=None):
+    """
+    Seconds to wait before retry number `attempt` (0-based): full-jitter
+    exponential backoff, or the server's Retry-After if it sent one.
+    """
+    if response is not None:
+        retry_after = response.headers.get("Retry-After", "")
+        if retry_after.isdigit():
+            return min(float(retry_after), BACKOFF_MAX)
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+
+def request(method, url, timeout=None, retries=None, probe=False, **kwargs):
+    """
+    Sends an HTTP request through the shared session.
+
+    Requests to an upstream whose circuit is open fail fast with
+    circuit.CircuitOpen. Requests to upstreams with a rate-limit policy wait
+    for their turn first (see utils.ratelimit). Connection errors and 429/5xx
+    responses are retried up to `retries` times with jittered backoff; read
+    timeouts are not, so a hung upstream costs at most one read timeout.
+    Returns the final response (callers still call raise_for_status) or
+    raises requests.RequestException. probe marks the breaker's own recovery
+    probes, which bypass it.
+    """
+    host = urlsplit(url).hostname or ""
+    breaker = _check_circuit(host, probe)
+    try:
+        response = _send(method, url, host, timeout, retries, **kwargs)
+    except UpstreamBusy:
+        # Our own queue was full; says nothing about the upstream's health
+        raise
+    except requests.RequestException as e:
+        _record_outcome(breaker, error=e)
+        raise
+    _record_outcome(breaker, response)
+    return response
+
+def _send(method, url, host, timeout, retries, **kwargs):
+    timeout = timeout or (CONNECT_TIMEOUT, READ_TIMEOUT)
+    retries = MAX_RETRIES if retries is None else retries
+    session = _get_session()
+
+    attempt = 0
+    while True:
+        governor, slot = _admit(host)
+        _count(host, "requests")
+        response = None
+        start = time.perf_counter()
+        try:
+            with _host_limit(host):
+                response = session.request(method, url, timeout=timeout, **kwargs)
+        except (requests.ConnectionError, requests.exceptions.ChunkedEncodingError):
+            if attempt >= retries:
+                _count(host, "errors")
+                raise
+        except requests.RequestException:
+            _count(host, "errors")
+            raise
+        finally:
+            _release(governor, slot)
+            metrics.UPSTREAM_SECONDS.observe(time.perf_counter() - start, host, _outcome(response))
+
+        if response is not None and (response.status_code not in RETRY_STATUSES or attempt >= retries):
+            if response.status_code >= 400:
+                _count(host, "errors")
+            return response
+
+        _count(host, "retries")
+        _pause(governor, attempt, response)
+        attempt += 1
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
+
+# --- Async transport (httpx) ---
+# Same timeouts, retry policy and per-host limits as the sync transport, for
+# the async serving path. httpx is imported on first use so the sync path
+# doesn't pay for it.
+
+def _get_async_client():
+    global _async_client
+    if _async_client is None:
+        import httpx
+        limits = httpx.Limits(max_connections=None, max_keepalive_connections=POOL_SIZE * 4)
+        _async_client = httpx.AsyncClient(limits=limits)
+    return _async_client
+
+def _async_host_limit(host):
+    limit = _async_host_limits.get(host)
+    if limit is None:
+        limit = _async_host_limits[host] = asyncio.Semaphore(HOST_CONCURRENCY.get(host, DEFAULT_HOST_CONCURRENCY))
+    return limit
+
+def _to_requests_response(response):
+    """
+    Wraps an httpx response as a requests.Response so callers handle both
+    transports with the same code (raise_for_status, json, RequestException).
+    """
+    converted = requests.models.Response()
+    converted.status_code = response.status_code
+    converted.headers = requests.structures.CaseInsensitiveDict(response.headers)
+    converted._content = response.content
+    converted.encoding = response.encoding
+    converted.url = str(response.url)
+    converted.reason = response.reason_phrase
+    return converted
+
+async def arequest(method, url, timeout=None, retries=None, data=None, **kwargs):
+    """
+    Async counterpart of request(): sends through a shared httpx.AsyncClient
+    and returns a requests.Response, raising requests exceptions on failure.
+    Shares request()'s circuit breakers.
+    """
+    host = urlsplit(url).hostname or ""
+    breaker = _check_circuit(host, False)
+    try:
+        response = await _asend(method, url, host, timeout, retries, data, **kwargs)
+    except UpstreamBusy:
+        raise
+    except requests.RequestException as e:
+        _record_outcome(breaker, error=e)
+        raise
+    _record_outcome(breaker, response)
+    return response
+
+async def _asend(method, url, host, timeout, retries, data, **kwargs):
+    import httpx
+
+    connect, read = timeout or (CONNECT_TIMEOUT, READ_TIMEOUT)
+    retries = MAX_RETRIES if retries is None else retries
+    if isinstance(data, (str, bytes)):
+        kwargs["content"] = data
+    elif data is not None:
+        kwargs["data"] = data
+    client = _get_async_client()
+
+    attempt = 0
+    while True:
+        governor, slot = await _admit_async(host)
+        _count(host, "requests")
+        response = None
+        start = time.perf_counter()
+        try:
+            async with _async_host_limit(host):
+                response = await client.request(method, url, timeout=httpx.Timeout(read, connect=connect), **kwargs)
+        except httpx.ReadTimeout as e:
+            _count(host, "errors")
+            raise requests.exceptions.ReadTimeout(str(e))
+        except httpx.TransportError as e:
+            if attempt >= retries:
+                _count(host, "errors")
+                raise requests.ConnectionError(str(e))
+        except httpx.HTTPError as e:
+            _count(host, "errors")
+            raise requests.RequestException(str(e))
+        finally:
+            _release(governor, slot)
+            metrics.UPSTREAM_SECONDS.observe(time.perf_counter() - start, host, _outcome(response))
+
+        if response is not None and (response.status_code not in RETRY_STATUSES or attempt >= retries):
+            if response.status_code >= 400:
+                _count(host, "errors")
+            return _to_requests_response(response)
+
+        _count(host, "retries")
+        if governor is not None and response is not None and response.status_code == 429:
+            # Blocking the shared bucket takes its file lock; keep that off the loop
+            await asyncio.to_thread(governor.backoff, _backoff(attempt, response))
+        else:
+            await asyncio.sleep(_backoff(attempt, response))
+        attempt += 1
+
+async def aclose():
+    """
+    Closes the async client's connections (call on application shutdown).
+    """
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+
+async def aget(url, **kwargs):
+    return await arequest("GET", url, **kwargs)
+
+async def apost(url, **kwargs):
+    return await arequest("POST", url, **kwargs)
+
+def transport_stats():
+    """
+    Per-host request/retry/error counters plus connection reuse taken from the
+    session's urllib3 pools (requests sent vs. connections opened).
+    """
+    with _stats_lock:
+        stats = {host: dict(values) for host, values in _stats.items()}
+
+    if _session is not None:
+        adapter = _session.get_adapter("https://")
+        pools = adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            host_stats = stats.setdefault(pool.host, {"requests": 0, "retries": 0, "errors": 0})
+            host_stats["connections_opened"] = host_stats.get("connections_opened", 0) + pool.num_connections
+            host_stats["connections_reused"] = host_stats.get("connections_reused", 0) + max(
+                0, pool.num_requests - pool.num_connections
+            )
+    return stats